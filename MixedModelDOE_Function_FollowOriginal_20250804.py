@@ -1,33 +1,534 @@
 import pandas as pd
 import numpy as np
 from itertools import combinations
-import statsmodels.formula.api as smf
-from statsmodels.stats.anova import anova_lm
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.preprocessing import StandardScaler
 from patsy import dmatrix
 from statsmodels.stats.outliers_influence import OLSInfluence
 from scipy.stats import f
-import warnings
-warnings.filterwarnings("ignore")
 
 # import os
-from statsmodels.formula.api import mixedlm
-from statsmodels.tools.sm_exceptions import ConvergenceWarning
-warnings.simplefilter("ignore", ConvergenceWarning)
 import os
+import time
+from collections.abc import Mapping
+from doe_export import get_exporter
+from doe_diagnostics import design_diagnostics, condition_summary
+from doe_fitting import FitController, MixedFitError, fit_log_frame, DEFAULT_TIME_BUDGET, OPTIMIZER_CHAIN
+from doe_archive import ArchiveQuery
+from doe_stages import StageMemo
+from doe_inference import mixed_fit_tests, DF_METHODS
+from doe_backends import get_backend
+from doe_permutation import permutation_logworth, add_permutation_columns
+from doe_color import add_lab_responses
+from doe_admission import track_stage_memory
+
+MIXED_SOLVERS = ("auto", "statsmodels", "sparse")
+_DEFAULT_MEMO = StageMemo()  # 进程内共享的阶段缓存（run_mixed_model_doe 未指定 memo 时使用）
+
+
+def load_input_data(source):
+    """
+    将分析输入统一转换为 DataFrame（无需落盘）
+
+    Args:
+        source: 支持以下几种形式
+            - str / os.PathLike：CSV 文件路径（原始行为）
+            - 文件类对象（含 read 方法）：如 io.BytesIO、上传文件句柄，直接交给 pd.read_csv 解析
+            - pd.DataFrame：已解析的数据表（浅拷贝，不复制底层数组）
+            - Mapping：列名 → 数组 的列式数据（如 {"dye1": np.array([...]), ...}）
+            - ArchiveQuery：历史归档的子集查询（见 doe_archive），只读取所需的列与行
+
+    Returns:
+        pd.DataFrame: 原始数据表 df_raw
+    """
+    if isinstance(source, pd.DataFrame):
+        # 浅拷贝：后续新增 Config_combo 等列不会影响调用方的数据
+        return source.copy(deep=False)
+    if isinstance(source, ArchiveQuery):
+        return source.to_frame()
+    if isinstance(source, Mapping):
+        return pd.DataFrame(source, copy=False)
+    if isinstance(source, (str, os.PathLike)) or hasattr(source, "read"):
+        return pd.read_csv(source)
+    raise TypeError(f"Unsupported input type for DOE analysis: {type(source).__name__}")
+
+
+def create_rsm_terms(terms):
+    """二阶 RSM 项：线性项 + 平方项 + 两两交互项"""
+    linear = terms
+    square = [f"I({t}**2)" for t in terms]
+    inter = [f"{a}:{b}" for a, b in combinations(terms, 2)]
+    return linear + square + inter
+
+
+def response_logworth(df, y, terms, backend="statsmodels"):
+    """
+    单个响应变量的 OLS + Type III ANOVA LogWorth 扫描（由拟合后端计算，见 doe_backends）
+
+    Returns:
+        pd.DataFrame: 两列 Factor、y（LogWorth）
+    """
+    return get_backend(backend).logworth(df, y, terms)
+
+
+def combine_logworth(tables, response_vars):
+    """
+    合并各响应变量的 LogWorth 表，并计算 Median / Max LogWorth 与显著次数
+
+    Returns:
+        pd.DataFrame: 按 Max_LogWorth 降序排列
+    """
+    combined = pd.DataFrame()
+    for temp in tables:
+        combined = pd.merge(combined, temp, on="Factor", how="outer") if not combined.empty else temp
+
+    combined = combined.fillna(0)
+    combined["Median_LogWorth"] = combined[response_vars].median(axis=1)
+    combined["Max_LogWorth"] = combined[response_vars].max(axis=1)
+    combined["Appears_Significant"] = (combined[response_vars] > 1.3).sum(axis=1)
+    return combined.sort_values("Max_LogWorth", ascending=False)
+
+
+def full_model_logworth(df, response_vars, rsm_terms, backend="statsmodels"):
+    """全模型 LogWorth 扫描（各响应变量的 OLS + Type III ANOVA）"""
+    backend = get_backend(backend)
+    return combine_logworth([response_logworth(df, y, rsm_terms, backend) for y in response_vars], response_vars)
+
+
+def get_simplified_factors(effect_matrix, threshold=1.3, min_significant=2):
+    """按 Max LogWorth 阈值或显著次数筛选因子，并补齐 hierarchy（交互项 / 平方项的主效应）"""
+    factors = effect_matrix[
+        (effect_matrix["Max_LogWorth"] >= threshold) | 
+        (effect_matrix["Appears_Significant"] >= min_significant)
+    ]["Factor"].tolist()
+    if "Intercept" in factors:
+        factors.remove("Intercept")
+    hierarchical_terms = set(factors)
+    for f in factors:
+        if ":" in f:
+            a, b = f.split(":")
+            hierarchical_terms |= {a.strip(), b.strip()}
+        if "I(" in f:
+            base = f.split("(")[1].split("**")[0].strip()
+            hierarchical_terms.add(base)
+    return sorted(hierarchical_terms)
+
+
+def threshold_path(effect_matrix, df, response_vars, x_full, min_significant=2, selected_threshold=None,
+                   threshold_range=None):
+    """
+    阈值路径：所有阈值下不同的 simplified 因子集合 + 每个集合的 OLS 拟合诊断
+
+    get_simplified_factors 的结果只在阈值越过某个 Max_LogWorth 时改变，因此只需在这些断点上求值；
+    每个集合的拟合都取完整 RSM 设计矩阵交叉积 X'X、X'y 的子块（只计算一次），
+    无需重新构造设计矩阵或重跑 statsmodels。
+
+    Args:
+        effect_matrix (pd.DataFrame): full_model_logworth 的结果
+        df (pd.DataFrame): 标准化后的建模数据
+        response_vars (list): 响应变量
+        x_full (pd.DataFrame): 完整 RSM 模型的设计矩阵（patsy dmatrix，含 Intercept）
+        min_significant (int): 同 get_simplified_factors
+        selected_threshold (float): 当前分析使用的阈值，对应行标记 Selected = True
+        threshold_range (tuple): (最小阈值, 最大阈值)，只保留该范围内可达的集合
+
+    Returns:
+        pd.DataFrame: 每个（因子集合, 响应变量）一行；Threshold_From < 阈值 <= Threshold_To 时得到该集合
+    """
+    X = x_full.to_numpy(dtype=float)
+    Y = df.loc[x_full.index, response_vars].to_numpy(dtype=float)
+    n = X.shape[0]
+    column_index = {c: i for i, c in enumerate(x_full.columns)}
+    xtx, xty, yty = X.T @ X, X.T @ Y, np.sum(Y ** 2, axis=0)
+    tss = np.sum((Y - Y.mean(axis=0)) ** 2, axis=0)
+
+    # 断点：阈值从 +∞ 降到每个 Max_LogWorth 时集合才会变化
+    breakpoints = np.unique(effect_matrix.loc[effect_matrix["Factor"] != "Intercept", "Max_LogWorth"])[::-1]
+    grid = np.concatenate([[np.inf], breakpoints])
+    sets = []
+    for i, t in enumerate(grid):
+        factors = get_simplified_factors(effect_matrix, t, min_significant)
+        lower = grid[i + 1] if i + 1 < len(grid) else -np.inf
+        if sets and sets[-1]["factors"] == factors:
+            sets[-1]["from"] = lower
+        else:
+            sets.append({"factors": factors, "to": t, "from": lower})
+    if threshold_range is not None:
+        low, high = threshold_range
+        sets = [s for s in sets if s["from"] < high and s["to"] >= low]
+
+    rows = []
+    for s in sets:
+        idx = [column_index["Intercept"]] + [column_index[f] for f in s["factors"]]
+        p = len(idx)
+        G = xtx[np.ix_(idx, idx)]
+        G_inv = np.linalg.pinv(G)
+        beta = G_inv @ xty[idx]
+        rss = yty - np.sum(beta * xty[idx], axis=0)
+        # PRESS：留一残差 e_i / (1 − h_ii)，杠杆值 h_ii = x_iᵀ(X'X)⁻¹x_i
+        X_s = X[:, idx]
+        leverage = np.einsum("ij,jk,ik->i", X_s, G_inv, X_s)
+        resid = Y - X_s @ beta
+        press = np.sum((resid / (1 - leverage)[:, None]) ** 2, axis=0)
+        eig = np.linalg.eigvalsh(G)
+        for j, y in enumerate(response_vars):
+            r2 = 1 - rss[j] / tss[j]
+            log_lik_term = n * np.log(max(rss[j], np.finfo(float).tiny) / n)
+            rows.append({
+                "Threshold_From": s["from"],
+                "Threshold_To": s["to"],
+                "Selected": selected_threshold is not None and s["from"] < selected_threshold <= s["to"],
+                "N_Factors": len(s["factors"]),
+                "Factors": " + ".join(s["factors"]),
+                "Response": y,
+                "R2": r2,
+                "Adjusted_R2": 1 - (1 - r2) * (n - 1) / (n - p) if n > p else np.nan,
+                "RMSE": np.sqrt(rss[j] / (n - p)) if n > p else np.nan,
+                "PRESS": press[j],
+                "Predicted_R2": 1 - press[j] / tss[j],
+                "AICc": log_lik_term + 2 * p + (2 * p * (p + 1) / (n - p - 1) if n > p + 1 else np.nan),
+                "BIC": log_lik_term + p * np.log(n),
+                "Condition_Number_XtX": eig[-1] / eig[0] if eig[0] > 0 else np.inf,
+            })
+    return pd.DataFrame(rows)
+
+
+class MixedFitSummary:
+    """
+    混合模型拟合结果中下游（导出 / 模型注册表）用到的部分：固定效应、其协方差、残差方差与拟合值
+
+    fit_mixed_response 的结果会进入阶段缓存（doe_stages，进程内共享），只保存这些表，
+    不保留 MixedLMResults / SparseMixedResult（它们引用模型对象、设计矩阵与数据副本）
+    """
+
+    def __init__(self, fit):
+        self.fe_params = fit.fe_params.copy()
+        names = list(self.fe_params.index)
+        self._cov_fe = pd.DataFrame(fit.cov_params()).loc[names, names].copy()
+        self.scale = float(fit.scale)
+        self.cov_re = pd.DataFrame(fit.cov_re).copy()
+        self.fittedvalues = pd.Series(fit.fittedvalues).copy()
+
+    def cov_params(self):
+        """固定效应的协方差矩阵（与 MixedLMResults.cov_params() 的固定效应块一致）"""
+        return self._cov_fe
+
 
-def run_mixed_model_doe(file_path, output_dir):
+def fit_mixed_response(df, df_raw, y, simplified_factors, random_factors, use_sparse, predictors, scaler,
+                       df_method="kenward-roger", controller=None):
+    """
+    单个响应变量的混合模型拟合 + 诊断（近似 R²、coded / uncoded 参数、JMP 风格 LOF）
+
+    df_method 为固定效应 t 检验的分母自由度方法（见 doe_inference.DF_METHODS），决定 coded 参数的 LogWorth；
+    controller 为 doe_fitting.FitController（时间预算、OLS 热启动、优化器回退链），默认使用其默认设置
+
+    Returns:
+        dict: fit（MixedFitSummary）、fit_log、variance、diagnostics、coded_parameters、uncoded_parameters、lack_of_fit
+
+    Raises:
+        MixedFitError: 所有优化器都失败或超出时间预算
+    """
+    # 🔧 构建 Mixed Model（含 Config_combo 为随机组变量）
+    #    use_sparse 时求解稀疏 Henderson 方程：Config_combo + Day / Operator / DyeLot 等交叉或嵌套区组
+    formula = f"{y} ~ " + " + ".join(simplified_factors)
+    model_fit, fit_log = (controller or FitController()).fit(formula, df, random_factors, use_sparse, response=y)
+    selected = next(a for a in fit_log if a["Selected"])
+    if selected["Status"] != "converged":
+        print(f"⚠️ {y}: 所有优化器均未收敛，采用 REML 似然最高的结果（{selected['Optimizer']}）")
+    # 📊 Variance Components（用于 Part 5、JMP Profiler 对比）
+    group_var = model_fit.cov_re.iloc[0, 0] if model_fit.cov_re.shape[0] > 0 else np.nan
+    residual_var = model_fit.scale  # == RMSE²
+    print(f"\n📊 Variance Components for {y}:")
+    print(f" - Group Var (Config)   = {group_var:.4f}")
+    print(f" - Residual Var (Error) = {residual_var:.4f}   (RMSE ≈ {np.sqrt(residual_var):.4f})")
+    for factor in random_factors[1:]:
+        print(f" - Var ({factor}) = {model_fit.vcomp[factor]:.4f}")
+
+    var_record = {
+        "Response": y,
+        "Group_Var": group_var,
+        "Residual_Var": residual_var,
+        "RMSE_from_Var": np.sqrt(residual_var),
+        **{f"Var_{factor}": model_fit.vcomp[factor] for factor in random_factors[1:]}
+    }
+
+    # ======================================================================================
+    # 📌【关键说明】加载 coded β 系数时，用 fixed_intercepts.csv 中的 β₀ 替换默认 Intercept
+    #
+    # 💬 背景：
+    # 默认的 coded_parameters.csv 中 Intercept（β₀）字段导出自 model_fit.params["Intercept"]，
+    # 而该值通常包含组别 shrinkage（即 group-level intercept correction），非纯固定项；
+    #
+    # 🔬 如果继续使用该 Intercept，会导致 predict_coded(...) 的结果与 JMP Profiler 产生明显偏差（最多可达 1.2+）；
+    # 📈 为了确保评分与推荐与 JMP 一致，我们需将其替换为 model_fit.fe_params["Intercept"] 导出的固定截距。
+    #
+    # ✅ 本函数将修正 Intercept，并返回用于 L/A/B 打分的 β 系数表。
+    # ======================================================================================
+
+    def load_betas(path, intercept_path):
+        df = pd.read_csv(path)
+        intercept_df = pd.read_csv(intercept_path)
+
+        beta_dict = {}
+        for resp in df["Response"].unique():
+            temp = df[df["Response"] == resp].copy()
+            fixed_b0 = intercept_df.loc[intercept_df["Response"] == resp, "Fixed_Intercept"].values[0]
+            temp.loc[temp["Factor"] == "Intercept", "Coef."] = fixed_b0  # ⬅️ 替换为纯 fixed intercept
+            beta_dict[resp] = dict(zip(temp["Factor"], temp["Coef."]))
+        return beta_dict
+
+    y_true = df[y]
+    y_pred = model_fit.fittedvalues
+    resid = y_true - y_pred
+
+    # 🎯 近似 R²（external approximation）
+    # 注意：MixedLM 无 R² 原生输出，因此这里基于预测值使用解释方差比近似推算：
+    ss_total = np.sum((y_true - y_true.mean()) ** 2)
+    ss_resid = np.sum((y_true - y_pred) ** 2)
+    r_squared = 1 - ss_resid / ss_total
+
+    # 🎯 Adjusted R² 近似（基于固定效应自由度修正）
+    k = model_fit.k_fe - 1
+    n = len(y_true)
+    adj_r_squared = 1 - (1 - r_squared) * (n - 1) / (n - k - 1)
+    rmse = np.sqrt(np.mean(resid ** 2))
+
+    diagnostics = {
+        "Response": y,
+        "R2_Approximate": r_squared,
+        "Adjusted_R2_Approximate": adj_r_squared,
+        "RMSE": rmse,
+        "Mean_Response": y_true.mean(),
+        "Observations": n
+    }
+
+    # 🔢 固定效应参数表：直接取全精度数组（不再解析 summary 的格式化文本）；
+    #    t 检验的分母自由度按 df_method 计算（Kenward–Roger / Satterthwaite，见 doe_inference），与 JMP REML 对齐
+    fe = model_fit.fe_params
+    tests = mixed_fit_tests(model_fit, df, simplified_factors, random_factors, df_method)
+    coef_tbl = pd.DataFrame({
+        "Coef.": fe,
+        "Std.Err.": tests["Std_Error"],
+        "P>|z|": model_fit.pvalues[fe.index],  # 渐近 z 检验，保留原列便于对照
+        "DF": tests["DF"],
+        "t Ratio": tests["t_Ratio"],
+        "Prob>|t|": tests["Prob_t"],
+    })
+    # 方差分量行（绝对单位，与 summary 表及 mixed_model_variance_summary 相同；两种求解器行名一致），不做检验
+    if use_sparse:
+        var_rows = model_fit.variance_rows()
+    else:
+        var_rows = pd.Series({f"{g} Var": model_fit.cov_re.loc[g, g] for g in model_fit.cov_re.index})
+    coef_tbl = pd.concat([coef_tbl, pd.DataFrame({"Coef.": var_rows, "P>|z|": 1.0})])
+    p_value = coef_tbl["P>|z|"] if df_method == "asymptotic" else coef_tbl["Prob>|t|"].fillna(1.0)
+    coef_tbl["Response"] = y
+    coef_tbl["Factor"] = coef_tbl.index
+    coef_tbl["LogWorth"] = -np.log10(p_value.replace(0, 1e-16))
+    coded_table = coef_tbl[["Response", "Factor", "Coef.", "Std.Err.", "P>|z|", "DF", "t Ratio", "Prob>|t|", "LogWorth"]]
+
+    # 🔁 参数反标准化（解码）
+    X_mean = scaler.mean_
+    X_scale = scaler.scale_
+    uncoded = []
+
+    for pname in coef_tbl.index:
+        if pname == "Intercept":
+            continue
+        try:
+            coef_coded = float(coef_tbl.loc[pname, "Coef."])
+        except:
+            continue
+
+        if pname.startswith("I("):
+            var = pname.split("(")[1].split("**")[0].strip()
+            if var not in predictors: continue
+            i = predictors.index(var)
+            beta_uncoded = coef_coded / (X_scale[i] ** 2)
+
+        elif ":" in pname:
+            var1, var2 = pname.split(":")
+            if var1 not in predictors or var2 not in predictors: continue
+            i1, i2 = predictors.index(var1), predictors.index(var2)
+            beta_uncoded = coef_coded / (X_scale[i1] * X_scale[i2])
+
+        else:
+            var = pname.strip()
+            if var not in predictors: continue
+            i = predictors.index(var)
+            beta_uncoded = coef_coded / X_scale[i]
+
+        uncoded.append((pname, beta_uncoded))
+
+    intercept_uncoded = y_true.mean()
+    for pname, beta_uncoded in uncoded:
+        if pname.startswith("I(") or ":" in pname: continue
+        var = pname.strip()
+        if var not in predictors: continue
+        i = predictors.index(var)
+        intercept_uncoded -= beta_uncoded * X_mean[i]
+
+    uncoded.insert(0, ("Intercept", intercept_uncoded))
+    uncoded_df = pd.DataFrame(uncoded, columns=["Factor", "Estimate"])
+    uncoded_df["Response"] = y
+
+    # 📐 JMP 风格 LOF：基于 config_combo 聚合后计算 lack-of-fit F 统计量
+    lof_df = df_raw[["Config_combo", y]].copy()
+    lof_df["_fitted"] = y_pred
+    group_df = lof_df.groupby("Config_combo").agg(
+        local_avg=(y, "mean"),
+        fitted_val=("_fitted", "mean"),
+        count=("Config_combo", "count")
+    ).reset_index()
+
+    ss_lack = (group_df["count"] * (group_df["local_avg"] - group_df["fitted_val"])**2).sum()
+    df_lack = len(group_df) - model_fit.df_modelwc - 1
+    df_merge = lof_df.merge(group_df[["Config_combo", "local_avg"]], on="Config_combo", how="left")
+    ss_pure = ((df_merge[y] - df_merge["local_avg"])**2).sum()
+    df_pure = df_merge.shape[0] - len(group_df)
+
+    ms_lack = ss_lack / df_lack
+    ms_pure = ss_pure / df_pure
+    F_lof = ms_lack / ms_pure
+    from scipy.stats import f as f_dist
+    p_lof = 1 - f_dist.cdf(F_lof, df_lack, df_pure)
+
+    lof_record = {
+        "Response": y,
+        "DF_LackOfFit": df_lack,
+        "SS_LackOfFit": ss_lack,
+        "MS_LackOfFit": ms_lack,
+        "DF_PureError": df_pure,
+        "SS_PureError": ss_pure,
+        "MS_PureError": ms_pure,
+        "F_Ratio": F_lof,
+        "p_Value": p_lof
+    }
+
+    return {
+        "fit": MixedFitSummary(model_fit),
+        "fit_log": fit_log,
+        "variance": var_record,
+        "diagnostics": diagnostics,
+        "coded_parameters": coded_table,
+        "uncoded_parameters": uncoded_df,
+        "lack_of_fit": lof_record,
+    }
+
+
+def compute_threshold_path(source, threshold_range=None, min_significant=2, selected_threshold=None,
+                           backend="statsmodels", illuminant="D65", observer="2"):
+    """
+    只运行 数据导入 → 标准化 → 全模型 LogWorth 扫描 → 阈值路径，不拟合混合模型，
+    用于交互式选择 threshold
+
+    Returns:
+        pd.DataFrame: threshold_path 的结果
+    """
+    df = add_lab_responses(load_input_data(source), illuminant, observer).copy()
+    response_vars = ["Lvalue", "Avalue", "Bvalue"]
+    predictors = ["dye1", "dye2", "Time", "Temp"]
+    df[predictors] = StandardScaler().fit_transform(df[predictors])
+    rsm_terms = create_rsm_terms(predictors)
+    effect_summary_all = full_model_logworth(df, response_vars, rsm_terms, backend)
+    x_full = dmatrix(" + ".join(rsm_terms), data=df, return_type="dataframe")
+    return threshold_path(effect_summary_all, df, response_vars, x_full, min_significant,
+                          selected_threshold, threshold_range)
+
+
+def run_mixed_model_doe(file_path, output_dir, export_format="csv", progress_callback=None,
+                        random_effects=None, mixed_solver="auto", threshold=1.3, min_significant=2,
+                        memo=None, df_method="kenward-roger", fit_time_budget=DEFAULT_TIME_BUDGET,
+                        optimizers=OPTIMIZER_CHAIN, backend="statsmodels", permutations=0, permutation_seed=0,
+                        illuminant="D65", observer="2", trace_memory=False):
     """
     完全基于原始脚本的DOE混合模型分析函数
     保持所有原始逻辑、注释和结构不变
+
+    file_path 除 CSV 路径外，也可以是内存缓冲区、DataFrame 或列式数组字典（见 load_input_data）；
+    输入只有反射率光谱列（如 R400 … R700）而没有 Lvalue / Avalue / Bvalue 时，按 illuminant（"D65"、"D50"、
+    "A"、"E"）与 observer（"2" / "10"）换算为 CIE L*a*b*（见 doe_color），其余流程不变
+    export_format 指定输出格式："csv"（默认）、"arrow"、"parquet" 或自定义导出器（见 doe_export）
+
+    progress_callback(event) 在每个阶段结束时收到结构化进度事件（见 emit_progress）
+
+    random_effects 为 Config_combo 之外的区组随机因子列名（如 ["Day", "Operator", "DyeLot:Batch"]，
+    "A:B" 表示 B 嵌套在 A 内）；mixed_solver 为 "statsmodels"（MixedLM）、"sparse"（稀疏 Henderson
+    方程，见 doe_sparse_mixed）或 "auto"（有额外随机因子时用 sparse）
+
+    threshold / min_significant 为 simplified 因子筛选参数（见 get_simplified_factors）；
+    所有阈值对应的不同因子集合及其拟合诊断另外导出为 threshold_path（见 threshold_path）
+
+    df_method 为混合模型固定效应 t 检验的分母自由度："kenward-roger"（默认，对齐 JMP REML）、
+    "satterthwaite" 或 "asymptotic"（原 summary 中的 z 检验）；coded_parameters 的 LogWorth 按该方法计算
+
+    混合模型拟合由 doe_fitting.FitController 控制：OLS 热启动，按 optimizers 回退链（默认 lbfgs → powell → nm）
+    依次尝试，每个响应变量最多用时 fit_time_budget 秒（None 表示不限）。每次尝试的优化器、状态、迭代次数、耗时
+    导出为 mixed_model_fit_log；任一响应变量没有可用的拟合结果时抛出 MixedFitError（列出全部失败原因）
+
+    backend 为拟合后端（见 doe_backends）："statsmodels"（参考实现，默认）或 "numpy"（快速 OLS / LogWorth；
+    混合模型求解器仍由 mixed_solver 决定，需要稀疏求解器时显式传入 mixed_solver="sparse"），也可传入自定义后端对象；
+    后端之间的数值一致性由 doe_golden 的基准输出比对保证
+
+    permutations > 0 时对 full / simplified 模型的每个 Type III 项另做 permutations 次 Freedman–Lane 置换检验
+    （见 doe_permutation，permutation_seed 为随机种子），在 fullmodel_logworth / simplified_logworth 中
+    追加 <响应>_Perm_p 与 Max_Perm_LogWorth 列；因子筛选仍按参数 LogWorth
+
+    各计算阶段按内容指纹记忆化（见 doe_stages）：memo 为 StageMemo 实例，默认使用进程内共享缓存，
+    传入 False 时不缓存。只修改某个响应列（如 Bvalue）时，其余响应变量的 OLS / 混合模型拟合直接复用；
+    进度事件中的 cached 字段标明该阶段是否命中缓存。缓存中只有导出表与 MixedFitSummary，
+    不保留拟合结果对象，返回值中的 models 也是 MixedFitSummary
+
+    trace_memory=True 时用 tracemalloc 记录每个阶段的内存峰值（见 doe_admission.StageMemoryTracker）：
+    进度事件附带 memory_peak_mb，并导出 stage_memory 表（返回值中的 stage_memory 含全部阶段）
+
+    返回包含拟合模型、scaler、simplified 因子等内容的字典（可直接注册到 doe_registry）
     """
-    
+    with track_stage_memory(trace_memory) as memory_tracker:
+        return _run_mixed_model_doe(file_path, output_dir, export_format, progress_callback, random_effects,
+                                    mixed_solver, threshold, min_significant, memo, df_method, fit_time_budget,
+                                    optimizers, backend, permutations, permutation_seed, illuminant, observer,
+                                    memory_tracker)
+
+
+def _run_mixed_model_doe(file_path, output_dir, export_format, progress_callback, random_effects, mixed_solver,
+                         threshold, min_significant, memo, df_method, fit_time_budget, optimizers, backend,
+                         permutations, permutation_seed, illuminant, observer, memory_tracker):
+    start_time = time.perf_counter()
+    if memo is None:
+        memo = _DEFAULT_MEMO
+    elif memo is False:
+        memo = StageMemo(max_entries=0)
+    if mixed_solver not in MIXED_SOLVERS:
+        raise ValueError(f"Unsupported mixed_solver: {mixed_solver}. Supported: {', '.join(MIXED_SOLVERS)}")
+    backend = get_backend(backend)
+    if df_method not in DF_METHODS:
+        raise ValueError(f"Unsupported df_method: {df_method}. Supported: {', '.join(DF_METHODS)}")
+    controller = FitController(time_budget=fit_time_budget, methods=optimizers)
+    random_factors = ["Config_combo"] + list(random_effects or [])
+    use_sparse = mixed_solver == "sparse" or (mixed_solver == "auto" and (len(random_factors) > 1 or backend.sparse_mixed))
+    if permutations < 0:
+        raise ValueError(f"permutations must be non-negative, got {permutations}")
+    if len(random_factors) > 1 and not use_sparse:
+        raise ValueError("Additional random effects require mixed_solver='sparse' (or 'auto')")
+
+    def emit_progress(stage, response=None, **partial):
+        # 📡 进度事件：阶段名、响应变量、已用时间（秒）+ 该阶段的部分结果（JSON 可序列化）
+        if memory_tracker is not None:
+            partial["memory_peak_mb"] = memory_tracker.mark(stage, response)
+        if progress_callback is not None:
+            progress_callback({
+                "stage": stage,
+                "response": response,
+                "elapsed": round(time.perf_counter() - start_time, 4),
+                **partial
+            })
+
     # === 1. 数据导入 ===
-    df_raw = pd.read_csv(file_path)
+    df_raw = add_lab_responses(load_input_data(file_path), illuminant, observer)
     response_vars = ["Lvalue", "Avalue", "Bvalue"]
     predictors = ["dye1", "dye2", "Time", "Temp"]
+    emit_progress("data_loaded", rows=int(df_raw.shape[0]), columns=list(map(str, df_raw.columns)))
 
     # === 2. 标准化用于 simplified 模型建模 ===
     scaler = StandardScaler()
@@ -43,65 +544,76 @@ def run_mixed_model_doe(file_path, output_dir):
     print("📏 Part 2 构建 X_coded 时的原始均值与标准差：")
     print("X_mean =", scaler.mean_)
     print("X_std  =", scaler.scale_)
+    emit_progress("standardized", x_mean=scaler.mean_.tolist(), x_std=scaler.scale_.tolist())
 
     # === 3. 构造 RSM 项 ===
-    def create_rsm_terms(terms):
-        linear = terms
-        square = [f"I({t}**2)" for t in terms]
-        inter = [f"{a}:{b}" for a, b in combinations(terms, 2)]
-        return linear + square + inter
-
     rsm_terms = create_rsm_terms(predictors)
 
-    # === 4. 全模型 LogWorth 扫描 ===
-    effect_summary_all = pd.DataFrame()
-    for y in response_vars:
-        formula = f"{y} ~ " + " + ".join(rsm_terms)
-        model = smf.ols(formula, data=df).fit()
-        anova_tbl = anova_lm(model, typ=3).reset_index()
-        anova_tbl = anova_tbl.rename(columns={"index": "Factor"})
-        anova_tbl = anova_tbl[anova_tbl["Factor"] != "Residual"]
-        anova_tbl["LogWorth"] = -np.log10(anova_tbl["PR(>F)"].replace(0, 1e-16))
-        temp = anova_tbl[["Factor", "LogWorth"]].copy()
-        temp.columns = ["Factor", y]
-        effect_summary_all = pd.merge(effect_summary_all, temp, on="Factor", how="outer") if not effect_summary_all.empty else temp
-
-    effect_summary_all = effect_summary_all.fillna(0)
-    effect_summary_all["Median_LogWorth"] = effect_summary_all[response_vars].median(axis=1)
-    effect_summary_all["Max_LogWorth"] = effect_summary_all[response_vars].max(axis=1)
-    effect_summary_all["Appears_Significant"] = (effect_summary_all[response_vars] > 1.3).sum(axis=1)
-    effect_summary_all = effect_summary_all.sort_values("Max_LogWorth", ascending=False)
+    # === 4. 全模型 LogWorth 扫描（逐响应变量记忆化：只依赖 X 与该响应列）===
+    # 🧩 每个阶段的缓存键 = 阶段名 + 上游阶段键 + 本阶段读取的列 / 参数的内容指纹（见 doe_stages）
+    x_coded = df[predictors]
+    full_stages = [
+        memo.run("full_model_ols", lambda y=y: response_logworth(df, y, rsm_terms, backend),
+                 X=x_coded, y=df[y], terms=rsm_terms, backend=backend.name)
+        for y in response_vars
+    ]
+    effect_summary_all = combine_logworth([stage.value for stage in full_stages], response_vars)
+    if permutations:
+        # 🎲 置换检验：每个响应变量一次 SVD + 批量矩阵乘法（见 doe_permutation）
+        perm_stages = [
+            memo.run("full_model_permutation",
+                     lambda y=y: permutation_logworth(df, y, rsm_terms, permutations, permutation_seed),
+                     X=x_coded, y=df[y], terms=rsm_terms, permutations=permutations, seed=permutation_seed)
+            for y in response_vars
+        ]
+        effect_summary_all = add_permutation_columns(effect_summary_all, [stage.value for stage in perm_stages])
+    emit_progress("full_model_logworth", cached=all(stage.cached for stage in full_stages),
+                  logworth=effect_summary_all.to_dict("records"))
 
     # === 5. 筛选简化因子（保持 hierarchy）===
-    def get_simplified_factors(effect_matrix, threshold=1.3, min_significant=2):
-        factors = effect_matrix[
-            (effect_matrix["Max_LogWorth"] >= threshold) | 
-            (effect_matrix["Appears_Significant"] >= min_significant)
-        ]["Factor"].tolist()
-        if "Intercept" in factors:
-            factors.remove("Intercept")
-        hierarchical_terms = set(factors)
-        for f in factors:
-            if ":" in f:
-                a, b = f.split(":")
-                hierarchical_terms |= {a.strip(), b.strip()}
-            if "I(" in f:
-                base = f.split("(")[1].split("**")[0].strip()
-                hierarchical_terms.add(base)
-        return sorted(hierarchical_terms)
-
-    simplified_factors = get_simplified_factors(effect_summary_all)
+    factors_stage = memo.run(
+        "simplified_factors", lambda: get_simplified_factors(effect_summary_all, threshold, min_significant),
+        deps=full_stages, threshold=threshold, min_significant=min_significant
+    )
+    # 💬 下游阶段以因子集合的内容（而非本阶段的键）作为输入：某个响应列变化但因子集合不变时，
+    #    其他响应变量的 simplified OLS / 混合模型拟合仍可命中缓存
+    simplified_factors = factors_stage.value
+    emit_progress("simplified_factors", factors=simplified_factors)
+
+    # === 5b. 阈值路径：一次性评估所有阈值对应的 simplified 因子集合（复用同一个完整设计矩阵）===
+    def compute_path():
+        x_full = dmatrix(" + ".join(rsm_terms), data=df, return_type="dataframe")
+        return threshold_path(effect_summary_all, df, response_vars, x_full,
+                              min_significant=min_significant, selected_threshold=threshold)
+
+    path_stage = memo.run("threshold_path", compute_path, deps=full_stages, X=x_coded,
+                          Y=df[response_vars], min_significant=min_significant, threshold=threshold)
+    threshold_path_df = path_stage.value
+    emit_progress("threshold_path", cached=path_stage.cached, path=threshold_path_df.to_dict("records"))
 
     # === 6. 构造原始 Config 键值（JMP 对齐）===
     df_raw["Config_combo"] = df_raw[["dye1", "dye2", "Time", "Temp"]].astype(str).agg("_".join, axis=1)
     df["Config_combo"] = df_raw["Config_combo"]
+    group_columns = df_raw[predictors + [c for f in random_factors[1:] for c in f.split(":")]]
 
-    # === 7. 共线性检查 ===
-    try:
+    # === 7. 共线性检查（一次 SVD：条件数、VIF、alias 矩阵、预测方差剖面）===
+    # 💬 不再构造 X'X 求条件数（会把条件数平方、损失精度），改由 X 的奇异值得到 cond(X'X) = cond(X)²
+    def compute_design_diagnostics():
         x = dmatrix(" + ".join(simplified_factors), data=df, return_type="dataframe")
-        xtx = x.T @ x
-        condition_number = np.linalg.cond(xtx.values)
+        x_full = dmatrix(" + ".join(rsm_terms), data=df, return_type="dataframe")
+        coded_ranges = {p: (df[p].min(), df[p].max()) for p in predictors}
+        return design_diagnostics(x, x_full, predictors, coded_ranges)
+
+    condition_number = np.nan
+    design_diag = None
+    try:
+        diag_stage = memo.run("alias_check", compute_design_diagnostics, X=x_coded, factors=simplified_factors)
+        design_diag = diag_stage.value
+        condition_number = design_diag["condition_number_xtx"]
         print(f"\n📐 Alias Check – X'X condition number: {condition_number:.2f}")
+        print(design_diag["terms"].to_string(index=False))
+        emit_progress("alias_check", cached=diag_stage.cached, condition_number=float(condition_number),
+                      rank=design_diag["rank"], vif=design_diag["terms"].to_dict("records"))
     except Exception as e:
         print(f"\n❌ Error building design matrix: {str(e)}")
 
@@ -115,25 +627,25 @@ def run_mixed_model_doe(file_path, output_dir):
 
     print(f"\n📐 Alias Check – X'X condition number: {condition_number:.2f}")
 
-    # 构建 simplified_logworth_df
-    simplified_logworth_df = pd.DataFrame()
+    # 构建 simplified_logworth_df（逐响应变量记忆化）
+    simplified_tables = []
     for y in response_vars:
         print(f"\n🔍 Building simplified model for: {y}")
-        formula = f"{y} ~ " + " + ".join(simplified_factors)
-        model = smf.ols(formula=formula, data=df).fit()
-        anova_tbl = anova_lm(model, typ=3).reset_index()
-        anova_tbl = anova_tbl.rename(columns={"index": "Factor"})
-        anova_tbl = anova_tbl[anova_tbl["Factor"] != "Residual"]
-        anova_tbl["LogWorth"] = -np.log10(anova_tbl["PR(>F)"].replace(0, 1e-16))
-        temp = anova_tbl[["Factor", "LogWorth"]].copy()
-        temp.columns = ["Factor", y]
-        simplified_logworth_df = pd.merge(simplified_logworth_df, temp, on="Factor", how="outer") if not simplified_logworth_df.empty else temp
-
-    simplified_logworth_df = simplified_logworth_df.fillna(0)
-    simplified_logworth_df["Median_LogWorth"] = simplified_logworth_df[response_vars].median(axis=1)
-    simplified_logworth_df["Max_LogWorth"] = simplified_logworth_df[response_vars].max(axis=1)
-    simplified_logworth_df["Appears_Significant"] = (simplified_logworth_df[response_vars] > 1.3).sum(axis=1)
-    simplified_logworth_df = simplified_logworth_df.sort_values("Max_LogWorth", ascending=False)
+        stage = memo.run("simplified_ols", lambda: response_logworth(df, y, simplified_factors, backend),
+                         X=x_coded, y=df[y], factors=simplified_factors, backend=backend.name)
+        simplified_tables.append(stage.value)
+        emit_progress("simplified_model", response=y, cached=stage.cached, logworth=stage.value.to_dict("records"))
+
+    simplified_logworth_df = combine_logworth(simplified_tables, response_vars)
+    if permutations:
+        perm_stages = [
+            memo.run("simplified_permutation",
+                     lambda y=y: permutation_logworth(df, y, simplified_factors, permutations, permutation_seed),
+                     X=x_coded, y=df[y], factors=simplified_factors, permutations=permutations, seed=permutation_seed)
+            for y in response_vars
+        ]
+        simplified_logworth_df = add_permutation_columns(simplified_logworth_df, [stage.value for stage in perm_stages])
+    emit_progress("simplified_logworth", logworth=simplified_logworth_df.to_dict("records"))
 
     print("\n📊 Simplified Model – Combined Effect Summary (LogWorth):")
     print(simplified_logworth_df)
@@ -189,168 +701,45 @@ def run_mixed_model_doe(file_path, output_dir):
     diagnostics_summary = []
     var_records = []  # 🆕 用于收集每个响应变量的 Group Var 和 Residual Var
     lof_records = []
+    fit_log = []  # 🆕 每个响应变量每次优化器尝试的记录
+    fit_failures = {}
 
     for y in response_vars:
         try:
-            # 🔧 构建 Mixed Model（含 Config_combo 为随机组变量）
-            formula = f"{y} ~ " + " + ".join(simplified_factors)
-            model = mixedlm(formula, data=df, groups=df["Config_combo"])
-            model_fit = model.fit(reml=True)
-            # 📊 Variance Components（用于 Part 5、JMP Profiler 对比）
-            group_var = model_fit.cov_re.iloc[0, 0] if model_fit.cov_re.shape[0] > 0 else np.nan
-            residual_var = model_fit.scale  # == RMSE²
-            print(f"\n📊 Variance Components for {y}:")
-            print(f" - Group Var (Config)   = {group_var:.4f}")
-            print(f" - Residual Var (Error) = {residual_var:.4f}   (RMSE ≈ {np.sqrt(residual_var):.4f})")
-
-            var_records.append({
-                "Response": y,
-                "Group_Var": group_var,
-                "Residual_Var": residual_var,
-                "RMSE_from_Var": np.sqrt(residual_var)
-            })
-
+            stage = memo.run(
+                "mixed_model", lambda: fit_mixed_response(df, df_raw, y, simplified_factors, random_factors,
+                                                          use_sparse, predictors, scaler, df_method, controller),
+                X=x_coded, y=df[y], groups=group_columns, factors=simplified_factors, solver=use_sparse,
+                df_method=df_method, fitting=controller.settings()
+            )
+            fitted = stage.value
+            model_fit = fitted["fit"]
             models[y] = model_fit
-
-            # ======================================================================================
-            # 📌【关键说明】加载 coded β 系数时，用 fixed_intercepts.csv 中的 β₀ 替换默认 Intercept
-            #
-            # 💬 背景：
-            # 默认的 coded_parameters.csv 中 Intercept（β₀）字段导出自 model_fit.params["Intercept"]，
-            # 而该值通常包含组别 shrinkage（即 group-level intercept correction），非纯固定项；
-            #
-            # 🔬 如果继续使用该 Intercept，会导致 predict_coded(...) 的结果与 JMP Profiler 产生明显偏差（最多可达 1.2+）；
-            # 📈 为了确保评分与推荐与 JMP 一致，我们需将其替换为 model_fit.fe_params["Intercept"] 导出的固定截距。
-            #
-            # ✅ 本函数将修正 Intercept，并返回用于 L/A/B 打分的 β 系数表。
-            # ======================================================================================
-
-            def load_betas(path, intercept_path):
-                df = pd.read_csv(path)
-                intercept_df = pd.read_csv(intercept_path)
-
-                beta_dict = {}
-                for resp in df["Response"].unique():
-                    temp = df[df["Response"] == resp].copy()
-                    fixed_b0 = intercept_df.loc[intercept_df["Response"] == resp, "Fixed_Intercept"].values[0]
-                    temp.loc[temp["Factor"] == "Intercept", "Coef."] = fixed_b0  # ⬅️ 替换为纯 fixed intercept
-                    beta_dict[resp] = dict(zip(temp["Factor"], temp["Coef."]))
-                return beta_dict
-
-            y_true = df[y]
-            y_pred = model_fit.fittedvalues
-            resid = y_true - y_pred
-
-            # 🎯 近似 R²（external approximation）
-            # 注意：MixedLM 无 R² 原生输出，因此这里基于预测值使用解释方差比近似推算：
-            ss_total = np.sum((y_true - y_true.mean()) ** 2)
-            ss_resid = np.sum((y_true - y_pred) ** 2)
-            r_squared = 1 - ss_resid / ss_total
-
-            # 🎯 Adjusted R² 近似（基于固定效应自由度修正）
-            k = model_fit.k_fe - 1
-            n = len(y_true)
-            adj_r_squared = 1 - (1 - r_squared) * (n - 1) / (n - k - 1)
-            rmse = np.sqrt(np.mean(resid ** 2))
-
-            diagnostics_summary.append({
-                "Response": y,
-                "R2_Approximate": r_squared,
-                "Adjusted_R2_Approximate": adj_r_squared,
-                "RMSE": rmse,
-                "Mean_Response": y_true.mean(),
-                "Observations": n
-            })
-
-            # 🔢 解析固定效应参数表，构建含 P 值与 LogWorth 的输出
-            coef_tbl = model_fit.summary().tables[1].copy()
-            coef_tbl.columns = ["Coef.", "Std.Err.", "z", "P>|z|", "[0.025", "0.975]"]
-            coef_tbl["P>|z|"] = pd.to_numeric(coef_tbl["P>|z|"], errors="coerce").fillna(1.0)
-            coef_tbl["Response"] = y
-            coef_tbl["Factor"] = coef_tbl.index
-            coef_tbl["LogWorth"] = -np.log10(coef_tbl["P>|z|"].replace(0, 1e-16))
-            param_coded_list.append(coef_tbl[["Response", "Factor", "Coef.", "P>|z|", "LogWorth"]])
-
-            # 🔁 参数反标准化（解码）
-            X_mean = scaler.mean_
-            X_scale = scaler.scale_
-            uncoded = []
-
-            for pname in coef_tbl.index:
-                if pname == "Intercept":
-                    continue
-                try:
-                    coef_coded = float(coef_tbl.loc[pname, "Coef."])
-                except:
-                    continue
-
-                if pname.startswith("I("):
-                    var = pname.split("(")[1].split("**")[0].strip()
-                    if var not in predictors: continue
-                    i = predictors.index(var)
-                    beta_uncoded = coef_coded / (X_scale[i] ** 2)
-
-                elif ":" in pname:
-                    var1, var2 = pname.split(":")
-                    if var1 not in predictors or var2 not in predictors: continue
-                    i1, i2 = predictors.index(var1), predictors.index(var2)
-                    beta_uncoded = coef_coded / (X_scale[i1] * X_scale[i2])
-
-                else:
-                    var = pname.strip()
-                    if var not in predictors: continue
-                    i = predictors.index(var)
-                    beta_uncoded = coef_coded / X_scale[i]
-
-                uncoded.append((pname, beta_uncoded))
-
-            intercept_uncoded = y_true.mean()
-            for pname, beta_uncoded in uncoded:
-                if pname.startswith("I(") or ":" in pname: continue
-                var = pname.strip()
-                if var not in predictors: continue
-                i = predictors.index(var)
-                intercept_uncoded -= beta_uncoded * X_mean[i]
-
-            uncoded.insert(0, ("Intercept", intercept_uncoded))
-            uncoded_df = pd.DataFrame(uncoded, columns=["Factor", "Estimate"])
-            uncoded_df["Response"] = y
-            param_uncoded_list.append(uncoded_df)
-
-            # 📐 JMP 风格 LOF：基于 config_combo 聚合后计算 lack-of-fit F 统计量
-            df_raw["_fitted"] = y_pred
-            group_df = df_raw.groupby("Config_combo").agg(
-                local_avg=(y, "mean"),
-                fitted_val=("_fitted", "mean"),
-                count=("Config_combo", "count")
-            ).reset_index()
-
-            ss_lack = (group_df["count"] * (group_df["local_avg"] - group_df["fitted_val"])**2).sum()
-            df_lack = len(group_df) - model_fit.df_modelwc - 1
-            df_merge = df_raw.merge(group_df[["Config_combo", "local_avg"]], on="Config_combo", how="left")
-            ss_pure = ((df_merge[y] - df_merge["local_avg"])**2).sum()
-            df_pure = df_merge.shape[0] - len(group_df)
-
-            ms_lack = ss_lack / df_lack
-            ms_pure = ss_pure / df_pure
-            F_lof = ms_lack / ms_pure
-            from scipy.stats import f as f_dist
-            p_lof = 1 - f_dist.cdf(F_lof, df_lack, df_pure)
-
-            lof_records.append({
-                "Response": y,
-                "DF_LackOfFit": df_lack,
-                "SS_LackOfFit": ss_lack,
-                "MS_LackOfFit": ms_lack,
-                "DF_PureError": df_pure,
-                "SS_PureError": ss_pure,
-                "MS_PureError": ms_pure,
-                "F_Ratio": F_lof,
-                "p_Value": p_lof
-            })
+            var_records.append(fitted["variance"])
+            diagnostics_summary.append(fitted["diagnostics"])
+            param_coded_list.append(fitted["coded_parameters"])
+            param_uncoded_list.append(fitted["uncoded_parameters"])
+            lof_records.append(fitted["lack_of_fit"])
+            fit_log.extend(fitted["fit_log"])
+            selected = next(a for a in fitted["fit_log"] if a["Selected"])
+            # 保持 design_data 的原有输出：_fitted 列为最后一个成功拟合的响应变量的预测值
+            df_raw["_fitted"] = model_fit.fittedvalues
+            emit_progress("mixed_model", response=y, cached=stage.cached, optimizer=selected["Optimizer"],
+                          converged=selected["Status"] == "converged", iterations=selected["Iterations"],
+                          variance_components=var_records[-1],
+                          diagnostics=diagnostics_summary[-1], lack_of_fit=lof_records[-1],
+                          uncoded_parameters=fitted["uncoded_parameters"][["Factor", "Estimate"]].to_dict("records"))
 
         except Exception as e:
             print(f"❌ 模型拟合失败 - {y}: {e}")
+            attempts = e.attempts if isinstance(e, MixedFitError) else []
+            fit_log.extend(attempts)
+            fit_failures[y] = str(e)
+            emit_progress("mixed_model_failed", response=y, error=str(e), attempts=attempts)
+
+    if fit_failures:
+        # 后续的 fixed_intercepts / 导出需要全部响应变量的模型：在这里明确报错，而不是稍后出现 KeyError
+        raise MixedFitError(", ".join(fit_failures), "; ".join(fit_failures.values()), fit_log)
 
     # === 🔎 Console Diagnostic Summary ===
     print("\n\n============================== 📋 JMP-style Diagnostic Summary ==============================")
@@ -385,8 +774,8 @@ def run_mixed_model_doe(file_path, output_dir):
     # 📌 目的：在不依赖 xlsxwriter 模块的情况下导出结果，便于在 JMP 中使用 Python 脚本运行并读入 CSV。
     # 🔍 本脚本将所有重要输出写入独立 CSV 文件，包括参数估计、LogWorth、诊断指标、LOF、残差图数据等。
 
-    # 📁 输出文件夹路径
-    os.makedirs(output_dir, exist_ok=True)
+    # 📁 输出文件夹路径（导出器负责创建目录；CSV 之外还支持 Arrow / Parquet 结果包）
+    exporter = get_exporter(export_format, output_dir)
 
     # === ✅ 在所有模型构建完毕后统一导出 fixed Intercept ===
     # 💬 背景：
@@ -404,16 +793,17 @@ def run_mixed_model_doe(file_path, output_dir):
         fixed_intercepts.append({"Response": y, "Fixed_Intercept": beta_0})
 
     fixed_df = pd.DataFrame(fixed_intercepts)
-    fixed_df.to_csv(os.path.join(output_dir, "fixed_intercepts.csv"), index=False)
+    exporter.write_table("fixed_intercepts", fixed_df)
 
 
     # 1️⃣ LogWorth 表
-    effect_summary_all.to_csv(os.path.join(output_dir, "fullmodel_logworth.csv"), index=False)
-    simplified_logworth_df.to_csv(os.path.join(output_dir, "simplified_logworth.csv"), index=False)
+    exporter.write_table("fullmodel_logworth", effect_summary_all)
+    exporter.write_table("simplified_logworth", simplified_logworth_df)
+    exporter.write_table("threshold_path", threshold_path_df)
 
     # 2️⃣ 参数估计（Coded / Uncoded 空间）
-    pd.concat(param_coded_list).to_csv(os.path.join(output_dir, "coded_parameters.csv"), index=False)
-    pd.concat(param_uncoded_list).to_csv(os.path.join(output_dir, "uncoded_parameters.csv"), index=False)
+    exporter.write_table("coded_parameters", pd.concat(param_coded_list))
+    exporter.write_table("uncoded_parameters", pd.concat(param_uncoded_list))
 
     # 3️⃣ 模型诊断指标（含近似 R² 和 Adjusted R²）
     # 📌 注意：R² 是基于 MixedLM 的预测值近似推算，非原生属性。
@@ -422,23 +812,24 @@ def run_mixed_model_doe(file_path, output_dir):
         "R2_Approximate": "R2_Approximate",
         "Adjusted_R2_Approximate": "Adjusted_R2_Approximate"
     })
-    diagnostics_df.to_csv(os.path.join(output_dir, "diagnostics_summary.csv"), index=False)
+    exporter.write_table("diagnostics_summary", diagnostics_df)
+    exporter.write_table("mixed_model_fit_log", fit_log_frame(fit_log))
 
     # 4️⃣ JMP 风格 Lack-of-Fit 分解表
-    pd.DataFrame(lof_records).to_csv(os.path.join(output_dir, "JMP_style_lof.csv"), index=False)
+    exporter.write_table("JMP_style_lof", pd.DataFrame(lof_records))
 
     # 5️⃣ 变量标准化信息（用于解码）
-    pd.DataFrame({
+    exporter.write_table("scaler", pd.DataFrame({
         "Variable": predictors,
         "Mean": scaler.mean_,
         "StdDev": scaler.scale_
-    }).to_csv(os.path.join(output_dir, "scaler.csv"), index=False)
+    }))
 
     # 6️⃣ 模型公式文本（逐响应变量）
-    with open(os.path.join(output_dir, "model_formulas.txt"), "w") as f:
-        for y in response_vars:
-            formula = f"{y} ~ " + " + ".join(simplified_factors)
-            f.write(f"{y} formula:\n{formula}\n\n")
+    formulas = {y: f"{y} ~ " + " + ".join(simplified_factors) for y in response_vars}
+    exporter.write_text("model_formulas.txt", "".join(
+        f"{y} formula:\n{formula}\n\n" for y, formula in formulas.items()
+    ))
 
     # 7️⃣ 基于 Mixed Model 的预测值 & 残差（输出图形所用 CSV）
     # ⚠️ 注意：由于 MixedLM 无帽子矩阵，我们无法计算真实的 studentized residual；
@@ -466,8 +857,7 @@ def run_mixed_model_doe(file_path, output_dir):
             })
             df_out.index.name = "ID"
 
-            out_path = os.path.join(output_dir, f"residual_data_{y}_from_MixedModel.csv")
-            df_out.to_csv(out_path)
+            exporter.write_table(f"residual_data_{y}_from_MixedModel", df_out, index=True)
 
         except Exception as e:
             print(f"❌ 残差输出失败 [{y}]: {e}")
@@ -476,15 +866,23 @@ def run_mixed_model_doe(file_path, output_dir):
     # 8️⃣ 建模输入数据导出（供 JMP 使用 Fit Model 脚本）
     # 📌 输出包含响应变量 + 原始因子列的完整观测数据表（未标准化）
     # ✅ 文件名 design_data.csv 是 JMP 脚本默认读取的数据源
-    df_raw.to_csv(os.path.join(output_dir, "design_data.csv"), index=False)
+    exporter.write_table("design_data", df_raw)
+
+    # === 📐 设计诊断表（基于 SVD）：design_diagnostics / design_condition / alias_matrix / prediction_variance_profile ===
+    if design_diag is not None:
+        exporter.write_table("design_diagnostics", design_diag["terms"])
+        exporter.write_table("design_condition", condition_summary(design_diag))
+        if design_diag["alias_matrix"] is not None:
+            exporter.write_table("alias_matrix", design_diag["alias_matrix"], index=True)
+        if design_diag["prediction_variance"] is not None:
+            exporter.write_table("prediction_variance_profile", design_diag["prediction_variance"])
 
     # === 📁 输出结构方差摘要表：mixed_model_variance_summary.csv ===
     df_var = pd.DataFrame(var_records)
-    df_var.to_csv(os.path.join(output_dir, "mixed_model_variance_summary.csv"), index=False)
+    exporter.write_table("mixed_model_variance_summary", df_var)
 
     # === 🆕 输出标准化信息至 CSV (InputDataBrief.csv) ===
 
-    brief_path = os.path.join(output_dir, "InputDataBrief.csv")
     brief_df = pd.DataFrame({
         "Variable": predictors,
         "Mean (after standardization)": df[predictors].mean().values,
@@ -493,10 +891,40 @@ def run_mixed_model_doe(file_path, output_dir):
         "Original StdDev (X_std)": scaler.scale_
     })
 
-    brief_df.to_csv(brief_path, index=False)
-    # print(f"\n📤 InputDataBrief.csv saved to: {brief_path}")
+    exporter.write_table("InputDataBrief", brief_df)
+
+    # === 🧮 分阶段内存峰值（trace_memory=True 时）===
+    if memory_tracker is not None:
+        memory_tracker.mark("export")
+        exporter.write_table("stage_memory", memory_tracker.frame())
+
+    # === 📦 结果包元数据（Arrow / Parquet 导出时写入 manifest 与 schema metadata）===
+    exporter.close({
+        "response_vars": response_vars,
+        "predictors": predictors,
+        "simplified_factors": simplified_factors,
+        "formulas": formulas,
+        "scaler": {"mean": scaler.mean_, "std": scaler.scale_},
+        "variance_components": var_records,
+    })
 
-    print(f"\n✅ 所有建模结果已基于 Mixed Model 导出为 CSV，保存在：{output_dir}")
+    export_name = getattr(exporter, "format", "custom").upper()
+    print(f"\n✅ 所有建模结果已基于 Mixed Model 导出为 {export_name}，保存在：{output_dir}")
+    emit_progress("exported", format=export_name.lower(), output_dir=output_dir)
+
+    # === 🔁 返回拟合结果（供模型注册表 / 预测等下游使用）===
+    return {
+        "response_vars": response_vars,
+        "predictors": predictors,
+        "simplified_factors": simplified_factors,
+        "formulas": formulas,
+        "scaler": scaler,
+        "models": models,
+        "design": df_raw,
+        "variance_components": var_records,
+        "threshold_path": threshold_path_df,
+        "stage_memory": memory_tracker.frame() if memory_tracker is not None else None,
+    }
 
 # 直接运行脚本时的入口
 if __name__ == "__main__":
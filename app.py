@@ -1,12 +1,29 @@
 
-from fastapi import FastAPI, UploadFile, File, Body
-from fastapi.responses import JSONResponse
-import shutil
+from fastapi import FastAPI, UploadFile, File, Body, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response
+from starlette.concurrency import run_in_threadpool
 import os
-import base64
-import tempfile
+import hmac
+import uuid
+import threading
+import contextlib
+import anyio
+import numpy as np
 import pandas as pd
-from MixedModelDOE_Function_FollowOriginal_20250804 import run_mixed_model_doe
+from MixedModelDOE_Function_FollowOriginal_20250804 import load_input_data, compute_threshold_path
+from doe_payload import open_payload_stream, iter_text_chunks, PayloadDecodeError
+from doe_registry import ModelRegistry
+from doe_jobs import JobManager, _jsonable
+from doe_augment import augment_design
+from doe_power import simulate_power, MAX_SIMULATIONS
+from doe_prediction_profiler import ProfilerCache, DEFAULT_POINTS, MAX_POINTS
+from doe_sensitivity import sobol_indices, DEFAULT_SAMPLES, MAX_SAMPLES
+from doe_profiling import RequestProfiler, PROFILE_ARTIFACTS
+from doe_plots import PlotRenderer
+from doe_admission import AdmissionController, AdmissionRejected
+from doe_workers import AnalysisWorkers
+from doe_results import ResultStore, etag_matches
 
 app = FastAPI(
     title="Mixed Model DOE Analysis API",
@@ -14,8 +31,180 @@ app = FastAPI(
     version="1.1.0"
 )
 
+# ./outputDOE 为共享输出目录，分析在线程池中执行时仍需串行
+_analysis_lock = threading.Lock()
+
+# 本地模型注册表：每次分析完成后登记模型，供 /predict 低延迟预测
+model_registry = ModelRegistry(os.environ.get("DOE_MODEL_REGISTRY", "./model_registry.sqlite"))
+
+
+# 预测刻画器缓存：每个模型版本的网格 / 协方差与最近的轨迹结果
+profiler_cache = ProfilerCache()
+
+# 分析工作进程池：输入数据与结果表经共享段（/dev/shm 内存映射文件）交接，不 pickle DataFrame（见 doe_workers）
+# DOE_ANALYSIS_PROCESSES=0 时在线程池中执行
+analysis_workers = AnalysisWorkers(max_workers=int(os.environ.get("DOE_ANALYSIS_PROCESSES", "2")))
+
+# 残差图 / 等高线图：模型登记后交给后台进程池渲染，按模型哈希缓存在 ./outputDOE/plots
+plot_renderer = PlotRenderer(os.path.join("./outputDOE", "plots"),
+                             max_workers=int(os.environ.get("DOE_PLOT_WORKERS", "2")), arena=analysis_workers.arena)
+
+
+def _schedule_plots(name, version):
+    """提交图表渲染（不等待）；渲染失败不影响分析结果"""
+    try:
+        plot_renderer.submit(model_registry.get(name, version), model_registry.load_design(name, version))
+    except Exception as e:
+        print(f"⚠️ Plot rendering not scheduled for {name} v{version}: {e}")
+
+
+# 按请求剖析：请求带 profile=true 且管理员开关打开（DOE_PROFILING=1 或 PUT /admin/profiling）时生效
+request_profiler = RequestProfiler(enabled=os.environ.get("DOE_PROFILING", "0") == "1")
+
+
+def _profile_capture(requested, profile_id, directory):
+    """
+    Returns:
+        tuple: (剖析上下文, 响应中的 profile 信息)；未请求剖析时为 (空上下文, None)
+    """
+    if not requested:
+        return contextlib.nullcontext(), None
+    if not request_profiler.enabled:
+        return contextlib.nullcontext(), {"enabled": False, "message": "Profiling is disabled by the administrator"}
+    links = {name: f"/profiles/{profile_id}/{name}" for name in PROFILE_ARTIFACTS}
+    return request_profiler.capture(profile_id, directory), {"enabled": True, "id": profile_id, "artifacts": links}
+
+
+# 内存准入控制：按行数 / 列数估计峰值内存，余量不足时改用低内存模式、排队或拒绝（见 doe_admission）
+admission_controller = AdmissionController(safety_factor=float(os.environ.get("DOE_MEMORY_SAFETY", "1.5")),
+                                           queue_timeout=float(os.environ.get("DOE_ADMISSION_TIMEOUT", "120")))
+
+
+def _admission_error(e):
+    """AdmissionRejected → 413（永远放不下）/ 503（排队超时，附 Retry-After）"""
+    headers = {"Retry-After": "30"} if e.status_code == 503 else None
+    return JSONResponse(status_code=e.status_code, headers=headers,
+                        content={"status": "error", "message": str(e), "memory_estimate_mb": e.estimate})
+
+
+def _content_length(request):
+    length = request.headers.get("content-length", "")
+    return int(length) if length.isdigit() else 0
+
+
+def _admitted_run(handle, output_dir, payload_bytes=0, on_queue=None, on_admit=None, run_lock=None, **options):
+    """
+    准入后在分析工作进程中执行（必要时改用低内存模式）；on_queue / on_admit 在开始排队 / 准入时调用
+
+    Args:
+        handle (dict): 输入数据的共享段句柄（analysis_workers.share）
+        run_lock (threading.Lock): 准入之后、执行期间持有的锁（共享输出目录）；排队等待准入时不持有
+
+    Returns:
+        tuple: (analysis_workers.run 的结果：模型规格 / 设计表 / stage_memory, 内存信息 dict)
+    """
+    with admission_controller.admit(handle["rows"], len(handle["columns"]), payload_bytes=payload_bytes,
+                                    permutations=options.get("permutations", 0), on_queue=on_queue) as admission:
+        options.update(admission.options)
+        if on_admit is not None:
+            on_admit(admission.to_dict())
+        with run_lock or contextlib.nullcontext():
+            output = analysis_workers.run(handle, output_dir, **options)
+    memory = {**admission.to_dict(), "shared_input_mb": round(handle["nbytes"] / 2 ** 20, 2)}
+    if output["stage_memory"] is not None:
+        memory["traced_peak_mb"] = float(output["stage_memory"]["Peak_MB"].max())
+    return output, memory
+
+
+def _share_input(source):
+    """解析输入并写入共享段；解析出的 DataFrame 随即释放，分析进程直接映射共享段"""
+    return analysis_workers.share(load_input_data(source))
+
+
+def _run_analysis(source, output_dir, model_name="default", profile=False, payload_bytes=0, **options):
+    """在工作线程中解析输入、交给分析工作进程执行并登记模型，返回 (输出目录文件列表, 模型名称与版本, 剖析信息, 内存信息)"""
+    profile_id = uuid.uuid4().hex
+    capture, profile_info = _profile_capture(profile, profile_id, os.path.join(output_dir, "profiles", profile_id))
+    os.makedirs(output_dir, exist_ok=True)
+    with capture:
+        handle = _share_input(source)
+        try:
+            # 先排队等待内存准入，准入后才取 _analysis_lock：排队中的请求不会挡住已准入的请求
+            # 剖析只覆盖当前线程：请求剖析时在本线程中执行
+            output, memory = _admitted_run(handle, output_dir, payload_bytes, run_lock=_analysis_lock,
+                                           in_process=bool(profile_info and profile_info["enabled"]), **options)
+        finally:
+            analysis_workers.release(handle)
+    with _analysis_lock:
+        files = os.listdir(output_dir)
+    version = model_registry.register_spec(model_name, output["spec"], output["design"])
+    _schedule_plots(model_name, version)
+    return files, {"name": model_name, "version": version}, profile_info, memory
+
+
+# 后台分析任务：每个任务有独立工作目录，进度事件可通过 SSE 订阅
+job_manager = JobManager(os.path.join("./outputDOE", "jobs"), max_workers=int(os.environ.get("DOE_JOB_WORKERS", "2")))
+
+# 任务结果下载：内容哈希 ETag、压缩表示与 zip 打包缓存（见 doe_results）
+result_store = ResultStore()
+
+
+def _model_name_from_filename(filename):
+    return os.path.splitext(os.path.basename(filename))[0] or "default"
+
+
+def _iter_request_body(request):
+    """在工作线程中按网络分块同步读取请求体（不缓存完整请求体）"""
+    stream = request.stream().__aiter__()
+    while True:
+        try:
+            yield anyio.from_thread.run(stream.__anext__)
+        except StopAsyncIteration:
+            return
+
+
+def _is_json_request(request):
+    content_type = request.headers.get("content-type", "")
+    return content_type.split(";")[0].strip().lower() in ("", "application/json")
+
+
+async def _parse_json_body(request, model_cls):
+    """
+    从 request.stream() 读取请求体并校验为 model_cls
+
+    不使用 request.body()：它会把完整请求体缓存在 Request 上，分析期间与解析出的 base64 字符串
+    同时占用内存；这里的缓冲区在解析后即释放，之后只保留模型中的字段
+    """
+    chunks = [chunk async for chunk in request.stream()]
+    body = b"".join(chunks)
+    del chunks
+    try:
+        return model_cls.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+
+def _streamed_body_kwargs(request):
+    """分块上传时：Content-Encoding 指定压缩格式，Content-Transfer-Encoding: base64 表示 base64 文本"""
+    return {
+        "base64_encoded": request.headers.get("content-transfer-encoding", "").lower() == "base64",
+        "compression": request.headers.get("content-encoding"),
+    }
+
+
+def _request_body_openapi(model_cls):
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": model_cls.model_json_schema()},
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+            },
+        }
+    }
+
 @app.post("/runDOE")
-async def run_doe(file: UploadFile = File(None)):
+async def run_doe(file: UploadFile = File(None), profile: bool = False):
     # 处理未上传文件或空文件名的情况，返回标准 JSON 错误
     if file is None or not hasattr(file, "filename") or not file.filename:
         return JSONResponse(
@@ -26,28 +215,17 @@ async def run_doe(file: UploadFile = File(None)):
     # 使用 os.path.basename 清理上传文件名，防止路径穿越攻击
     safe_filename = os.path.basename(file.filename)
 
-    # 设置输入和输出目录（适用于 Windows）
-    input_dir = "./input"
+    # 设置输出目录（适用于 Windows）
     output_dir = "./outputDOE"
-    os.makedirs(input_dir, exist_ok=True)
-    os.makedirs(output_dir, exist_ok=True)
 
-    # 构建安全的输入文件路径
-    input_path = os.path.join(input_dir, safe_filename)
-
-    # 保存上传的文件
+    # 调用 DOE 函数：直接从上传文件句柄解析，不再复制到 ./input
     try:
-        with open(input_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        return JSONResponse(
-            status_code=500,
-            content={"status": "error", "message": f"File save failed: {str(e)}"}
-        )
-
-    # 调用 DOE 函数
-    try:
-        run_mixed_model_doe(file_path=input_path, output_dir=output_dir)
+        admission_controller.check_payload(file.size or 0)
+        files, model, profile_info, memory = await run_in_threadpool(_run_analysis, file.file, output_dir,
+                                                                     model_name=_model_name_from_filename(safe_filename),
+                                                                     profile=profile)
+    except AdmissionRejected as e:
+        return _admission_error(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -57,9 +235,12 @@ async def run_doe(file: UploadFile = File(None)):
     # 返回结果
     return {
         "status": "success",
-        "input_file": input_path,
+        "input_file": safe_filename,
         "output_dir": output_dir,
-        "files": os.listdir(output_dir)
+        "files": files,
+        "model": model,
+        "profile": profile_info,
+        "memory": memory
     }
 
 @app.get("/runDOE")
@@ -68,12 +249,16 @@ async def run_doe_get():
 
 
 # 新增：支持 JSON body 传 base64 编码的 CSV 内容
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, Dict
 
 class DOEJsonRequest(BaseModel):
     filename: str
     file_b64: str  # base64 encoded CSV content
+    compression: Optional[str] = None  # "gzip" / "zstd"，为空时按魔数自动识别
+    export_format: Optional[str] = "csv"  # "csv" / "arrow" / "parquet"
+    model_name: Optional[str] = None  # 注册表中的模型名称，默认取文件名
+    profile: Optional[bool] = False  # 剖析本次分析（需管理员开关打开）
 
 # 新增：AI Foundry 兼容的 DOE 分析请求格式
 class DoeAnalysisRequest(BaseModel):
@@ -82,27 +267,119 @@ class DoeAnalysisRequest(BaseModel):
     predictors: Optional[str] = None  # comma-separated string, optional
     threshold: Optional[float] = 1.5
     force_full_dataset: Optional[bool] = True
+    compression: Optional[str] = None  # "gzip" / "zstd"，为空时按魔数自动识别
+    export_format: Optional[str] = "csv"  # "csv" / "arrow" / "parquet"
+    model_name: Optional[str] = "default"  # 注册表中的模型名称
+    random_effects: Optional[str] = None  # Config_combo 之外的区组随机因子，如 "Day,Operator,DyeLot:Batch"
+    mixed_solver: Optional[str] = "auto"  # "auto" / "statsmodels" / "sparse"
+    df_method: Optional[str] = "kenward-roger"  # "kenward-roger" / "satterthwaite" / "asymptotic"
+    fit_time_budget: Optional[float] = 60.0  # 每个响应变量的混合模型拟合时间预算（秒）
+    optimizers: Optional[str] = None  # 优化器回退链，如 "lbfgs,powell,nm"
+    backend: Optional[str] = "statsmodels"  # 拟合后端："statsmodels" / "numpy"
+    permutations: Optional[int] = 0  # LogWorth 置换检验次数（0 表示不做），如 10000
+    illuminant: Optional[str] = "D65"  # 光谱输入换算 L*a*b* 的照明体："D65" / "D50" / "A" / "E"
+    observer: Optional[str] = "2"  # 标准观察者："2"（CIE 1931）/ "10"（CIE 1964）
+    trace_memory: Optional[bool] = False  # 用 tracemalloc 记录各阶段内存峰值（约慢 4 倍）
+    profile: Optional[bool] = False  # 剖析本次分析（需管理员开关打开）
+
+# /predict 请求格式：原始单位的配方批量预测
+class PredictRequest(BaseModel):
+    model: str = "default"
+    version: Optional[int] = None  # 默认最新版本
+    recipes: List[Dict[str, float]]  # 如 [{"dye1": 0.25, "dye2": 0.04, "Time": 7, "Temp": 15}]
+
+# /models/{name}/augment 请求格式：D / I 最优增补试验推荐
+class AugmentRequest(BaseModel):
+    version: Optional[int] = None  # 默认最新版本
+    n_runs: int = 6
+    criterion: str = "D"  # "D" / "I"
+    levels: int = 10  # 候选网格每个因子的水平数
+    factor_ranges: Optional[Dict[str, List[float]]] = None  # 默认取注册设计的因子范围
+    n_starts: int = 8
+    random_state: Optional[int] = None
+
+# /models/{name}/power 请求格式：拟定设计的 Monte Carlo 功效模拟
+class PowerRequest(BaseModel):
+    version: Optional[int] = None  # 默认最新版本
+    design: Optional[List[Dict[str, float]]] = None  # 拟定设计（原始单位），默认使用注册设计
+    responses: Optional[List[str]] = None  # 默认全部响应变量
+    n_sim: int = 2000  # 2 ~ MAX_SIMULATIONS
+    alpha: float = 0.05
+    effect_scale: float = 1.0  # 真实效应 = 拟合系数 × effect_scale
+    random_state: Optional[int] = None
 
-@app.post("/runDOEjson")
-async def run_doe_json(request: DOEJsonRequest):
+# /models/{name}/profile 请求格式：预测刻画器（各因子的预测轨迹 + 置信带）
+class ProfileRequest(BaseModel):
+    version: Optional[int] = None  # 默认最新版本
+    setting: Optional[Dict[str, float]] = None  # 当前设定（原始单位），缺省的因子取范围中点
+    points: int = DEFAULT_POINTS  # 每个因子轨迹的取点数（2 ~ MAX_POINTS）
+    confidence: float = 0.95
+    factor_ranges: Optional[Dict[str, List[float]]] = None  # 默认取注册设计的因子范围
+
+# /models/{name}/sensitivity 请求格式：Sobol 全局灵敏度分析
+class SensitivityRequest(BaseModel):
+    version: Optional[int] = None  # 默认最新版本
+    factor_ranges: Optional[Dict[str, List[float]]] = None  # 默认取注册设计的因子范围
+    distribution: str = "uniform"  # "uniform" / "normal"（窗口宽度 = 6σ）
+    method: str = "analytic"  # "analytic" / "saltelli" / "both"
+    n_samples: int = DEFAULT_SAMPLES  # Saltelli 基础样本数（2 ~ MAX_SAMPLES）
+    seed: Optional[int] = None
+
+@app.post("/runDOEjson", openapi_extra=_request_body_openapi(DOEJsonRequest))
+async def run_doe_json(request: Request):
+    """
+    JSON + base64 接口；base64 内容可以是 gzip / zstd 压缩后的 CSV。
+
+    也支持分块流式上传（非 JSON 的 Content-Type）：请求体为 CSV 字节，
+    通过 Content-Encoding（gzip / zstd）和 Content-Transfer-Encoding: base64 说明编码，
+    文件名通过查询参数 ?filename= 传入。
+    """
     try:
-        # 解码 base64 内容并保存为临时 CSV 文件
-        csv_bytes = base64.b64decode(request.file_b64)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-            tmp.write(csv_bytes)
-            tmp_path = tmp.name
+        if _is_json_request(request):
+            payload = await _parse_json_body(request, DOEJsonRequest)
+            filename = payload.filename
+            export_format = payload.export_format
+            model_name = payload.model_name or _model_name_from_filename(filename)
+            profile = bool(payload.profile)
+            payload_bytes = len(payload.file_b64)  # 分析期间只保留 base64 字符串（请求体未缓存，解析后已释放）
+            admission_controller.check_payload(payload_bytes, base64_encoded=True)
+            # 按块解码 base64 字符串，不生成完整的解码副本
+            csv_stream = open_payload_stream(iter_text_chunks(payload.file_b64), base64_encoded=True,
+                                             compression=payload.compression)
+        else:
+            filename = request.query_params.get("filename", "upload.csv")
+            export_format = request.query_params.get("export_format", "csv")
+            model_name = request.query_params.get("model_name") or _model_name_from_filename(filename)
+            profile = request.query_params.get("profile", "false").lower() in ("1", "true", "yes")
+            payload_bytes = 0  # 分块流式上传：边读边解析，不保留请求体
+            body_kwargs = _streamed_body_kwargs(request)
+            admission_controller.check_payload(_content_length(request), body_kwargs["base64_encoded"])
+            csv_stream = open_payload_stream(_iter_request_body(request), **body_kwargs)
         # 设置输出目录
         output_dir = "./outputDOE"
-        os.makedirs(output_dir, exist_ok=True)
-        # 调用 DOE 分析
-        run_mixed_model_doe(file_path=tmp_path, output_dir=output_dir)
+        # 调用 DOE 分析（边解码边解析）
+        files, model, profile_info, memory = await run_in_threadpool(_run_analysis, csv_stream, output_dir,
+                                                                     model_name=model_name, export_format=export_format,
+                                                                     profile=profile, payload_bytes=payload_bytes)
         # 返回结果
         return {
             "status": "success",
-            "input_file": tmp_path,
+            "input_file": os.path.basename(filename),
             "output_dir": output_dir,
-            "files": os.listdir(output_dir)
+            "files": files,
+            "model": model,
+            "profile": profile_info,
+            "memory": memory
         }
+    except RequestValidationError:
+        raise
+    except PayloadDecodeError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": str(e)}
+        )
+    except AdmissionRejected as e:
+        return _admission_error(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -110,70 +387,555 @@ async def run_doe_json(request: DOEJsonRequest):
         )
 
 
+async def _read_doe_analysis_input(http_request):
+    """
+    解析 /api/DoeAnalysis 格式的输入（JSON 或分块流式请求体）
+
+    Returns:
+        tuple: (DoeAnalysisRequest, 逐块解码的 CSV 字节流)
+    """
+    if not _is_json_request(http_request):
+        try:
+            request = DoeAnalysisRequest(data="", **http_request.query_params)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+        body_kwargs = _streamed_body_kwargs(http_request)
+        admission_controller.check_payload(_content_length(http_request), body_kwargs["base64_encoded"])
+        csv_stream = open_payload_stream(_iter_request_body(http_request), **body_kwargs)
+        return request, csv_stream
+
+    request = await _parse_json_body(http_request, DoeAnalysisRequest)
+    # 处理数据输入 - 支持 base64, URL 或原始 CSV
+    if request.data.startswith("http"):
+        # URL 输入 - 暂时不支持，返回错误
+        raise PayloadDecodeError("URL data input not supported yet. Please use base64 encoded data.")
+    elif "," in request.data and "\n" in request.data:
+        # 原始 CSV 数据
+        admission_controller.check_payload(len(request.data))
+        csv_stream = open_payload_stream(iter_text_chunks(request.data), compression="identity")
+    else:
+        # base64 编码数据（可为 gzip / zstd 压缩内容），按块解码
+        admission_controller.check_payload(len(request.data), base64_encoded=True)
+        csv_stream = open_payload_stream(iter_text_chunks(request.data), base64_encoded=True,
+                                         compression=request.compression)
+    return request, csv_stream
+
+
+def _analysis_options(request):
+    """DoeAnalysisRequest → run_mixed_model_doe 的可选参数"""
+    return {
+        "export_format": request.export_format,
+        "random_effects": [f.strip() for f in request.random_effects.split(",") if f.strip()] if request.random_effects else None,
+        "mixed_solver": request.mixed_solver or "auto",
+        "df_method": request.df_method or "kenward-roger",
+        "fit_time_budget": request.fit_time_budget,
+        "optimizers": tuple(m.strip() for m in (request.optimizers or "lbfgs,powell,nm").split(",") if m.strip()),
+        "threshold": request.threshold if request.threshold is not None else 1.3,
+        "backend": request.backend or "statsmodels",
+        "permutations": request.permutations or 0,
+        "illuminant": request.illuminant or "D65",
+        "observer": request.observer or "2",
+        "trace_memory": bool(request.trace_memory),
+    }
+
+
+async def _doe_analysis_response(request, csv_stream):
+    """执行分析并构建 AI Foundry 兼容的响应"""
+    # 设置输出目录
+    output_dir = "./outputDOE"
+
+    # 调用 DOE 分析（边解码边解析，不写临时文件）
+    files, model, profile_info, memory = await run_in_threadpool(_run_analysis, csv_stream, output_dir,
+                                                                 model_name=request.model_name or "default",
+                                                                 profile=bool(request.profile),
+                                                                 payload_bytes=len(request.data),
+                                                                 **_analysis_options(request))
+
+    # 构建响应格式，兼容 AI Foundry
+    return {
+        "status": "success",
+        "summary": {
+            "response_variables": request.response_column.split(","),
+            "threshold": request.threshold,
+            "force_full_dataset": request.force_full_dataset,
+            "analysis_completed": True
+        },
+        "input_file": None,
+        "output_dir": output_dir,
+        "files": files,
+        "model": model,
+        "profile": profile_info,
+        "memory": memory
+    }
+
+
 # 新增：AI Foundry 兼容的 DOE 分析接口
-@app.post("/api/DoeAnalysis")
-async def doe_analysis(request: DoeAnalysisRequest):
+@app.post("/api/DoeAnalysis", openapi_extra=_request_body_openapi(DoeAnalysisRequest))
+async def doe_analysis(http_request: Request):
     """
     AI Foundry compatible DOE Analysis endpoint.
     Supports flexible data input and configurable response variables.
+
+    Besides JSON, the CSV may be streamed as a chunked request body (any non-JSON
+    Content-Type) with Content-Encoding gzip/zstd and optional
+    Content-Transfer-Encoding: base64; the other fields are then passed as query parameters.
     """
     try:
-        # 处理数据输入 - 支持 base64, URL 或原始 CSV
-        if request.data.startswith("http"):
-            # URL 输入 - 暂时不支持，返回错误
-            return JSONResponse(
-                status_code=400,
-                content={"status": "error", "message": "URL data input not supported yet. Please use base64 encoded data."}
-            )
-        elif "," in request.data and "\n" in request.data:
-            # 原始 CSV 数据
-            csv_content = request.data.encode('utf-8')
-        else:
-            # base64 编码数据
-            try:
-                csv_content = base64.b64decode(request.data)
-            except Exception:
-                return JSONResponse(
-                    status_code=400,
-                    content={"status": "error", "message": "Invalid base64 data format"}
-                )
-        
-        # 创建临时文件
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv", mode='wb') as tmp:
-            tmp.write(csv_content)
-            tmp_path = tmp.name
-        
-        # 设置输出目录
-        output_dir = "./outputDOE"
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # 调用 DOE 分析
-        run_mixed_model_doe(file_path=tmp_path, output_dir=output_dir)
-        
-        # 构建响应格式，兼容 AI Foundry
-        response = {
-            "status": "success",
-            "summary": {
-                "response_variables": request.response_column.split(","),
-                "threshold": request.threshold,
-                "force_full_dataset": request.force_full_dataset,
-                "analysis_completed": True
-            },
-            "input_file": tmp_path,
-            "output_dir": output_dir,
-            "files": os.listdir(output_dir)
-        }
-        
-        # 清理临时文件
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
-            
-        return response
-        
+        request, csv_stream = await _read_doe_analysis_input(http_request)
+        return await _doe_analysis_response(request, csv_stream)
+
+    except RequestValidationError:
+        raise
+    except PayloadDecodeError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": str(e)}
+        )
+    except AdmissionRejected as e:
+        return _admission_error(e)
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"status": "error", "message": f"DOE analysis failed: {str(e)}"}
         )
+
+
+
+# 新增：阈值路径接口（只做 LogWorth 扫描 + 各阈值下的因子集合与拟合诊断，不拟合混合模型）
+@app.post("/api/ThresholdPath", openapi_extra=_request_body_openapi(DoeAnalysisRequest))
+async def threshold_path_endpoint(http_request: Request):
+    """
+    Evaluate every distinct simplified factor set over the whole LogWorth threshold range
+    in one call, with per-set fit diagnostics (same input formats as /api/DoeAnalysis).
+    The row containing the request's `threshold` is marked Selected.
+    """
+    try:
+        request, csv_stream = await _read_doe_analysis_input(http_request)
+        path = await run_in_threadpool(compute_threshold_path, csv_stream,
+                                       selected_threshold=request.threshold,
+                                       illuminant=request.illuminant or "D65", observer=request.observer or "2")
+    except RequestValidationError:
+        raise
+    except PayloadDecodeError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    except AdmissionRejected as e:
+        return _admission_error(e)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "error", "message": f"Threshold path failed: {str(e)}"})
+    return {"status": "success", "threshold": request.threshold, "path": _jsonable(path.to_dict(orient="records"))}
+
+
+# 新增：后台任务接口 + SSE 进度事件流
+@app.post("/jobs", status_code=202, openapi_extra=_request_body_openapi(DoeAnalysisRequest))
+async def submit_job(http_request: Request):
+    """
+    Submit a DOE analysis (same input formats as /api/DoeAnalysis) to run in the background.
+    Progress events are streamed from /jobs/{job_id}/events (text/event-stream).
+    """
+    try:
+        request, csv_stream = await _read_doe_analysis_input(http_request)
+        # 请求体必须在响应前读完，因此先解析并写入共享段，后台任务只持有句柄
+        handle = await run_in_threadpool(_share_input, csv_stream)
+        request.data = ""  # 已解析：任务闭包不再保留 base64 文本
+    except RequestValidationError:
+        raise
+    except PayloadDecodeError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    except AdmissionRejected as e:
+        return _admission_error(e)
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"Invalid CSV data: {str(e)}"})
+
+    model_name = request.model_name or "default"
+
+    def run(job):
+        capture, profile_info = _profile_capture(request.profile, job.id, os.path.join(job.workspace, "profile"))
+        # 内存余量不足时任务在此排队（状态回到 queued），准入后继续
+        def on_queue(estimate):
+            job.publish({"stage": "waiting_for_memory", "memory_estimate_mb": estimate}, status="queued")
+
+        def on_admit(memory):
+            job.publish({"stage": "admitted", "memory": memory}, status="running")
+
+        try:
+            with capture:
+                output, memory = _admitted_run(handle, job.workspace, progress_callback=job.publish,
+                                               on_queue=on_queue, on_admit=on_admit,
+                                               in_process=bool(profile_info and profile_info["enabled"]),
+                                               **_analysis_options(request))
+        finally:
+            analysis_workers.release(handle)
+        version = model_registry.register_spec(model_name, output["spec"], output["design"])
+        _schedule_plots(model_name, version)
+        return {"files": os.listdir(job.workspace), "results_url": f"/jobs/{job.id}/results",
+                "model": {"name": model_name, "version": version}, "profile": profile_info, "memory": memory}
+
+    job = job_manager.submit(run)
+    return {
+        "status": "accepted",
+        "job_id": job.id,
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events"
+    }
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Job not found: {job_id}"})
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent progress events; reconnecting clients resume after Last-Event-ID."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Job not found: {job_id}"})
+    last_event_id = request.headers.get("last-event-id")
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    return StreamingResponse(
+        job.stream_events(start),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _job_results_workspace(job_id):
+    """
+    任务 → 可下载结果的工作目录；任务记录已被清理时仍可按工作目录读取
+
+    Returns:
+        tuple: (工作目录, 错误响应或 None)
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        workspace = os.path.join(job_manager.root_dir, job_id)
+        if all(c in "0123456789abcdef" for c in job_id) and os.path.isdir(workspace):
+            return workspace, None
+        return None, JSONResponse(status_code=404, content={"status": "error", "message": f"Job not found: {job_id}"})
+    if job.status != "succeeded":
+        return None, JSONResponse(status_code=409, content={"status": "error",
+                                                            "message": f"Job results not available: {job.status}"})
+    return job.workspace, None
+
+
+def _result_response(request, representation):
+    """结果文件响应：If-None-Match 命中时 304，否则交给 FileResponse（处理 Range / If-Range）"""
+    headers = {"ETag": representation["etag"], "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if representation["encoding"]:
+        headers["Content-Encoding"] = representation["encoding"]
+    if etag_matches(request.headers.get("if-none-match"), representation["etag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(representation["path"], media_type=representation["media_type"],
+                        filename=representation["filename"], headers=headers)
+
+
+@app.get("/jobs/{job_id}/results")
+async def job_results(job_id: str, request: Request):
+    """
+    Downloadable result files of a finished job, with sizes and content-hash ETags.
+    The listing itself carries an ETag, so dashboards can poll it with If-None-Match.
+    """
+    workspace, error = _job_results_workspace(job_id)
+    if error:
+        return error
+    files = await run_in_threadpool(result_store.list_files, workspace)
+    etag = result_store.listing_etag(files)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    for f in files:
+        f["url"] = f"/jobs/{job_id}/results/{f['name']}"
+    return JSONResponse(headers=headers, content={
+        "status": "success",
+        "job_id": job_id,
+        "files": files,
+        "bundle_url": f"/jobs/{job_id}/results.zip"
+    })
+
+
+@app.api_route("/jobs/{job_id}/results.zip", methods=["GET", "HEAD"])
+async def job_results_bundle(job_id: str, request: Request):
+    """All result files of a job as one zip (cached by content; supports ETag and Range)."""
+    workspace, error = _job_results_workspace(job_id)
+    if error:
+        return error
+    try:
+        representation = await run_in_threadpool(result_store.bundle, workspace)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    return _result_response(request, representation)
+
+
+@app.api_route("/jobs/{job_id}/results/{name:path}", methods=["GET", "HEAD"])
+async def job_result_file(job_id: str, name: str, request: Request):
+    """
+    One result table of a job. The content is gzip/zstd-encoded per Accept-Encoding, the ETag
+    is strong (content hash), conditional GET returns 304, and byte ranges make large
+    tables (design_data, residual_data_*) resumable.
+    """
+    workspace, error = _job_results_workspace(job_id)
+    if error:
+        return error
+    try:
+        representation = await run_in_threadpool(result_store.representation, workspace, name,
+                                                  request.headers.get("accept-encoding", ""))
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    return _result_response(request, representation)
+
+
+# 新增：模型注册表查询与低延迟预测接口
+@app.get("/models")
+async def list_models():
+    return {"status": "success", "models": model_registry.list_models()}
+
+
+@app.post("/predict")
+async def predict(request: PredictRequest):
+    """
+    Batch L/a/b prediction from a registered model (recipes in original units).
+    Uses the cached compiled model; the DOE fit is never rerun.
+    """
+    try:
+        model = model_registry.get(request.model, request.version)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    try:
+        predictions = model.predict_records(request.recipes)
+    except KeyError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": "error", "message": f"Missing factor in recipe: {e.args[0]}"}
+        )
+    return {
+        "status": "success",
+        "model": {"name": model.name, "version": model.version},
+        "predictors": model.predictors,
+        "predictions": predictions
+    }
+
+
+@app.post("/models/{name}/augment")
+async def augment(name: str, request: AugmentRequest):
+    """
+    Recommend the next runs that best improve the registered simplified model
+    (D- or I-optimal point exchange over a candidate grid in original units).
+    """
+    try:
+        model = model_registry.get(name, request.version)
+        design = model_registry.load_design(name, model.version)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    factor_ranges = {**model.spec["factor_ranges"], **(request.factor_ranges or {})}
+    try:
+        result = await run_in_threadpool(
+            augment_design,
+            design[model.predictors], model.terms, model.predictors, model.x_mean, model.x_scale,
+            n_runs=request.n_runs, criterion=request.criterion, factor_ranges=factor_ranges,
+            levels=request.levels, n_starts=request.n_starts, random_state=request.random_state
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    runs = result.pop("runs")
+    return {
+        "status": "success",
+        "model": {"name": model.name, "version": model.version},
+        **result,
+        "runs": runs.reset_index().to_dict(orient="records")
+    }
+
+
+@app.post("/models/{name}/profile")
+async def profile_model(name: str, request: ProfileRequest):
+    """
+    Prediction profiler: for the current setting, the prediction trace of every response
+    across each factor's range (others held at the setting), with confidence bands from
+    the registered coefficient covariance. Results are cached per model version.
+    """
+    try:
+        model = model_registry.get(name, request.version)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    if not 2 <= request.points <= MAX_POINTS:
+        return JSONResponse(status_code=400,
+                            content={"status": "error", "message": f"points must be between 2 and {MAX_POINTS}"})
+    args = (model, request.setting, request.confidence, request.points, request.factor_ranges)
+    try:
+        # 缓存命中（拖回之前的滑块位置）直接在事件循环中返回；未命中时的计算放到线程池，不阻塞其他请求
+        result = profiler_cache.cached(*args)
+        if result is None:
+            result = await run_in_threadpool(profiler_cache.profile, *args)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    return {"status": "success", "model": {"name": model.name, "version": model.version}, **result}
+
+
+@app.post("/models/{name}/power")
+async def power(name: str, request: PowerRequest):
+    """
+    Monte Carlo power and coefficient precision of a planned design, simulated under the
+    registered mixed model (its coefficients and variance components).
+    """
+    try:
+        model = model_registry.get(name, request.version)
+        design = model_registry.load_design(name, model.version) if request.design is None else None
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    if not 2 <= request.n_sim <= MAX_SIMULATIONS:
+        return JSONResponse(status_code=400,
+                            content={"status": "error", "message": f"n_sim must be between 2 and {MAX_SIMULATIONS}"})
+    if design is None:
+        design = pd.DataFrame(request.design)
+    missing = [p for p in model.predictors if p not in design.columns]
+    if missing:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"Missing factor in design: {missing}"})
+    design = design[model.predictors]
+    responses = request.responses or model.responses
+    unknown = [y for y in responses if y not in model.responses]
+    if unknown:
+        return JSONResponse(status_code=400, content={"status": "error", "message": f"Unknown response: {unknown}"})
+
+    def run():
+        tables = {}
+        for y in responses:
+            fitted = model.spec["responses"][y]
+            table = simulate_power(
+                design, model.terms, model.predictors, model.x_mean, model.x_scale,
+                np.asarray(fitted["coef"]) * request.effect_scale, fitted["group_var"], fitted["residual_var"],
+                n_sim=request.n_sim, alpha=request.alpha, random_state=request.random_state
+            )
+            tables[y] = table.to_dict(orient="records")
+        return tables
+
+    try:
+        tables = await run_in_threadpool(run)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    return {
+        "status": "success",
+        "model": {"name": model.name, "version": model.version},
+        "n_runs": len(design),
+        "n_sim": request.n_sim,
+        "power": tables
+    }
+
+
+@app.post("/models/{name}/sensitivity")
+async def sensitivity(name: str, request: SensitivityRequest):
+    """
+    Global (Sobol) sensitivity of every response to the factors over their operating window:
+    first-order and total indices, exact for the quadratic response surface, optionally
+    cross-checked by vectorized Saltelli sampling.
+    """
+    try:
+        model = model_registry.get(name, request.version)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    if not 2 <= request.n_samples <= MAX_SAMPLES:
+        return JSONResponse(status_code=400,
+                            content={"status": "error", "message": f"n_samples must be between 2 and {MAX_SAMPLES}"})
+    try:
+        result = await run_in_threadpool(sobol_indices, model, request.factor_ranges, request.distribution,
+                                         request.method, request.n_samples, request.seed)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
+    return {
+        "status": "success",
+        "model": {"name": model.name, "version": model.version},
+        **result,
+        "indices": result["indices"].to_dict(orient="records"),
+        "interactions": result["interactions"].to_dict(orient="records")
+    }
+
+
+# 新增：残差图 / 等高线图（后台渲染，按模型哈希缓存）
+@app.get("/models/{name}/plots")
+async def model_plots(name: str, version: Optional[int] = None):
+    """
+    Residual-vs-predicted, normal-probability and pairwise contour plots of a registered model.
+    Rendering happens in a background process pool; while it is running the response is 202
+    with status "rendering". Rendered plots are cached by model hash and never re-rendered.
+    """
+    try:
+        model = model_registry.get(name, version)
+        design = model_registry.load_design(name, model.version)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    plot_hash = plot_renderer.submit(model, design)  # 已渲染 / 正在渲染时不会重复提交
+    status = plot_renderer.status(plot_hash)
+    return JSONResponse(
+        status_code=200 if status["status"] == "ready" else 202,
+        content={
+            "status": status["status"],
+            "model": {"name": model.name, "version": model.version},
+            "plot_hash": plot_hash,
+            "plots": {f: f"/plots/{plot_hash}/{f}" for f in status["files"]},
+            **({"error": status["error"]} if "error" in status else {})
+        }
+    )
+
+
+@app.get("/plots/{plot_hash}/{name}")
+async def get_plot(plot_hash: str, name: str):
+    try:
+        path = plot_renderer.file_path(plot_hash, name)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    # 路径按内容哈希寻址，内容不会变化，浏览器可长期缓存
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+@app.on_event("shutdown")
+def _shutdown_plot_renderer():
+    plot_renderer.shutdown()
+    analysis_workers.shutdown()
+
+
+# 新增：剖析产物下载 + 管理员剖析开关
+@app.get("/profiles/{profile_id}/{name}")
+async def get_profile_artifact(profile_id: str, name: str):
+    try:
+        path = request_profiler.artifact_path(profile_id, name)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"status": "error", "message": str(e.args[0])})
+    if not os.path.exists(path):
+        return JSONResponse(status_code=404, content={"status": "error", "message": f"Profile artifact missing: {name}"})
+    return FileResponse(path, filename=name)
+
+
+class ProfilingToggle(BaseModel):
+    enabled: bool
+
+
+def _admin_error(http_request):
+    """校验 X-Admin-Token；未配置 DOE_ADMIN_TOKEN 时管理接口关闭"""
+    token = os.environ.get("DOE_ADMIN_TOKEN")
+    if not token:
+        return JSONResponse(status_code=403, content={"status": "error", "message": "Admin API is disabled"})
+    if not hmac.compare_digest(http_request.headers.get("X-Admin-Token", ""), token):
+        return JSONResponse(status_code=401, content={"status": "error", "message": "Invalid admin token"})
+    return None
+
+
+@app.get("/admin/profiling")
+async def get_profiling(http_request: Request):
+    error = _admin_error(http_request)
+    return error or {"status": "success", "enabled": request_profiler.enabled}
+
+
+@app.get("/admin/memory")
+async def get_memory(http_request: Request):
+    error = _admin_error(http_request)
+    return error or {"status": "success", **admission_controller.status(), "shared_memory": analysis_workers.stats()}
+
+
+@app.put("/admin/profiling")
+async def set_profiling(http_request: Request, toggle: ProfilingToggle):
+    error = _admin_error(http_request)
+    if error:
+        return error
+    request_profiler.enabled = toggle.enabled
+    return {"status": "success", "enabled": request_profiler.enabled}
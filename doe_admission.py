@@ -0,0 +1,366 @@
+"""
+分析任务的内存预算估计 + 准入控制 + 分阶段内存峰值（tracemalloc）
+
+🎯 作用：
+大文件上传到 /api/DoeAnalysis 时，数据会同时以 base64 文本、解码后的字节、df_raw、标准化副本 df、
+statsmodels 设计矩阵等多种形式存在，峰值内存可能超过实例上限，导致整个进程被 OOM kill。
+本模块在拟合开始前给出峰值内存估计，并按当前可用内存决定：
+
+- admitted   : 余量足够，按请求的设置运行
+- low_memory : 余量不足以按原设置运行，但足以按低内存模式运行时改用该模式：numpy 后端（不构造 statsmodels
+               模型对象）+ 稀疏混合模型求解器（拟合结果不保留 MixedLM 的多份数据副本）+ 不做置换检验
+- queued     : 当前余量两种模式都不够，但实例空闲时足够 → 排队等待其他分析释放内存（超时后拒绝）
+- rejected   : 即使实例空闲也放不下 → 直接拒绝（AdmissionRejected，HTTP 413）
+
+内存余量 = min(系统可用内存（cgroup v2 / v1 限额优先，其次 /proc/meminfo 的 MemAvailable），
+               容量 − 已准入任务的预留量)；无法读取时只按配置的容量限额判断（DOE_MEMORY_LIMIT_MB）。
+
+估计模型（见 estimate_memory）：峰值 ≈ 固定开销 + 保留的载荷 + 原始列的副本
+          + max(单阶段的临时设计矩阵副本, 各响应变量拟合后保留的副本之和) + 置换检验的分块矩阵，
+各系数由合成数据集上 run_mixed_model_doe 的 tracemalloc 峰值标定。
+
+StageMemoryTracker 在每个分析阶段结束时记录 tracemalloc 峰值（并重置峰值），
+run_mixed_model_doe(trace_memory=True) 时导出为 stage_memory，并附在进度事件的 memory_peak_mb 字段中。
+tracemalloc 是进程级的：多个分析并行时，各阶段峰值包含其他线程的分配。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+MB = 1024 * 1024
+
+# 📏 估计模型的系数（由合成数据集 2k / 20k / 60k 行的 tracemalloc 峰值标定，估计值比实测高约 30%）
+BASE_OVERHEAD = 32 * MB  # 与数据量无关的开销（模型对象、BLAS 工作区、导出缓冲等）
+PARSE_FACTOR = 3.0  # 载荷字节 → 解析期峰值（文本缓冲 + 解析中间结果）
+COLUMN_COPIES = 4.0  # 原始列的副本数（df_raw、标准化副本 df、导出 ...）
+DESIGN_COPIES = 13.0  # 单个阶段内同时存活的完整设计矩阵（n × 项数）副本数（alias_check 的两份 dmatrix + SVD）
+RETAINED_COPIES = {"standard": 5.0, "low_memory": 1.8}  # 每个响应变量拟合后保留的设计矩阵副本数（MixedLM 结果 / 稀疏求解器）
+
+DEFAULT_SAFETY_FACTOR = 1.5
+DEFAULT_QUEUE_TIMEOUT = 120.0
+LOW_MEMORY_OPTIONS = {"backend": "numpy", "mixed_solver": "sparse", "permutations": 0}
+ESTIMATED_BYTES_PER_CELL = 8  # CSV 中每个数值单元格的平均字节数（只有载荷大小时估计行数）
+
+
+class AdmissionRejected(RuntimeError):
+    """
+    分析任务未被准入
+
+    Attributes:
+        status_code (int): 413（永远放不下）或 503（排队超时，可稍后重试）
+        estimate (dict): 内存估计（MB）
+    """
+
+    def __init__(self, message, status_code=413, estimate=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.estimate = estimate or {}
+
+
+def rsm_term_count(n_factors):
+    """二阶 RSM 模型的列数（含 Intercept）：1 + 2k + k(k−1)/2"""
+    return 1 + 2 * n_factors + n_factors * (n_factors - 1) // 2
+
+
+def estimate_memory(n_rows, n_columns=None, n_factors=4, n_responses=3, payload_bytes=0, permutations=0,
+                    mode="standard"):
+    """
+    预测一次 run_mixed_model_doe 的峰值内存
+
+    Args:
+        n_rows (int): 行数
+        n_columns (int): 输入列数（默认 因子数 + 响应数）
+        n_factors (int): 因子数
+        n_responses (int): 响应变量数
+        payload_bytes (int): 分析期间仍保留在内存中的请求载荷（如 JSON 中的 base64 字符串）
+        permutations (int): 置换检验次数
+        mode (str): "standard" 或 "low_memory"
+
+    Returns:
+        dict: 各组成部分与峰值（字节）：payload、columns、design（单阶段临时设计矩阵与累计保留的拟合结果中的较大者）、
+              permutation、overhead、peak
+    """
+    if mode not in RETAINED_COPIES:
+        raise ValueError(f"Unsupported memory mode: {mode}. Supported: {', '.join(RETAINED_COPIES)}")
+    from doe_permutation import CHUNK_SIZE, MAX_CHUNK_ELEMENTS
+
+    n_columns = n_columns or n_factors + n_responses
+    matrix = 8.0 * n_rows * rsm_term_count(n_factors)
+    permutation = 0.0
+    if permutations and mode == "standard":
+        # 每个线程：置换下标与置换后残差两个 b × n 矩阵
+        chunk = min(MAX_CHUNK_ELEMENTS, CHUNK_SIZE * n_rows, permutations * n_rows)
+        permutation = 2 * 8.0 * chunk * (os.cpu_count() or 1)
+    parts = {
+        "payload": float(payload_bytes),
+        "columns": COLUMN_COPIES * 8.0 * n_rows * n_columns,
+        "design": max(DESIGN_COPIES * matrix, RETAINED_COPIES[mode] * matrix * n_responses),
+        "permutation": permutation,
+        "overhead": float(BASE_OVERHEAD),
+    }
+    parts["peak"] = sum(parts.values())
+    return parts
+
+
+def estimate_parse_memory(payload_bytes, n_columns=7, base64_encoded=False):
+    """
+    只知道载荷大小时（解析前）估计解析期峰值与行数
+
+    base64 文本按 3/4 换算为字节；压缩载荷解压后的大小未知，会被低估
+
+    Returns:
+        tuple: (估计行数, 估计 dict，同 estimate_memory)
+    """
+    raw = payload_bytes * 3 / 4 if base64_encoded else payload_bytes
+    rows = int(raw // (n_columns * ESTIMATED_BYTES_PER_CELL)) + 1
+    parts = {
+        "payload": PARSE_FACTOR * payload_bytes,
+        "columns": COLUMN_COPIES * 8.0 * rows * n_columns,
+        "overhead": float(BASE_OVERHEAD),
+    }
+    parts["peak"] = sum(parts.values())
+    return rows, parts
+
+
+def _read_int(path):
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    return int(value) if value.isdigit() else None
+
+
+def memory_status():
+    """
+    当前容量与可用内存（字节）
+
+    Returns:
+        dict: capacity（cgroup 限额或物理内存）、available；无法读取的项为 None
+    """
+    limit = _read_int("/sys/fs/cgroup/memory.max")
+    usage = _read_int("/sys/fs/cgroup/memory.current")
+    if limit is None:  # cgroup v1
+        limit = _read_int("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+        usage = _read_int("/sys/fs/cgroup/memory/memory.usage_in_bytes")
+    meminfo = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError):
+        pass
+    total, available = meminfo.get("MemTotal"), meminfo.get("MemAvailable")
+    if limit is not None and (total is None or limit < total):
+        cgroup_available = limit - usage if usage is not None else limit
+        available = min(cgroup_available, available) if available is not None else cgroup_available
+        total = limit
+    return {"capacity": total, "available": available}
+
+
+class Admission:
+    """一次准入的结果：运行模式、估计、排队时间；作为上下文管理器使用，退出时释放预留"""
+
+    def __init__(self, controller, decision, mode, estimate, reserved, waited):
+        self._controller = controller
+        self.decision = decision
+        self.mode = mode
+        self.estimate = estimate
+        self.reserved = reserved
+        self.waited = waited
+
+    @property
+    def options(self):
+        """需要覆盖的 run_mixed_model_doe 参数（低内存模式）"""
+        return dict(LOW_MEMORY_OPTIONS) if self.mode == "low_memory" else {}
+
+    def release(self):
+        if self._controller is not None:
+            self._controller._release(self.reserved)
+            self._controller = None
+
+    def to_dict(self):
+        return {"decision": self.decision, "mode": self.mode, "waited_seconds": round(self.waited, 3),
+                "estimated_peak_mb": round(self.estimate["peak"] / MB, 1),
+                "reserved_mb": round(self.reserved / MB, 1)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """
+    按当前内存余量准入分析任务
+
+    Args:
+        limit_bytes (int): 容量上限；默认取环境变量 DOE_MEMORY_LIMIT_MB，其次 cgroup 限额 / 物理内存
+        safety_factor (float): 估计值的放大系数
+        queue_timeout (float): 排队等待的最长时间（秒）
+        status_fn (callable): 返回 memory_status() 格式的函数（默认读取系统状态）
+    """
+
+    def __init__(self, limit_bytes=None, safety_factor=DEFAULT_SAFETY_FACTOR, queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+                 status_fn=memory_status):
+        if limit_bytes is None and os.environ.get("DOE_MEMORY_LIMIT_MB"):
+            limit_bytes = int(float(os.environ["DOE_MEMORY_LIMIT_MB"]) * MB)
+        self.limit_bytes = limit_bytes
+        self.safety_factor = safety_factor
+        self.queue_timeout = queue_timeout
+        self._status_fn = status_fn
+        self._reserved = 0
+        self._condition = threading.Condition()
+
+    def capacity(self):
+        """容量（字节）；未配置且无法读取系统内存时为 None（不做限制）"""
+        system = self._status_fn()["capacity"]
+        if self.limit_bytes is None:
+            return system
+        return self.limit_bytes if system is None else min(self.limit_bytes, system)
+
+    def headroom(self):
+        """当前可用于新任务的内存（字节）；无法判断时为 None"""
+        status = self._status_fn()
+        capacity = self.capacity()
+        bounds = []
+        if capacity is not None:
+            bounds.append(capacity - self._reserved)
+        if status["available"] is not None:
+            bounds.append(status["available"])
+        return min(bounds) if bounds else None
+
+    def status(self):
+        headroom = self.headroom()
+        capacity = self.capacity()
+        return {
+            "capacity_mb": None if capacity is None else round(capacity / MB, 1),
+            "headroom_mb": None if headroom is None else round(headroom / MB, 1),
+            "reserved_mb": round(self._reserved / MB, 1),
+            "safety_factor": self.safety_factor,
+        }
+
+    def check_payload(self, payload_bytes, base64_encoded=False):
+        """
+        解析前的粗检查：按载荷大小估计，实例空闲时也放不下（解析或低内存模式的分析）则立即拒绝
+
+        Raises:
+            AdmissionRejected
+        """
+        rows, parsing = estimate_parse_memory(payload_bytes, base64_encoded=base64_encoded)
+        analysis = estimate_memory(rows, payload_bytes=payload_bytes, mode="low_memory")
+        estimate = parsing if parsing["peak"] > analysis["peak"] else analysis
+        capacity = self.capacity()
+        if capacity is not None and estimate["peak"] * self.safety_factor > capacity:
+            raise AdmissionRejected(
+                f"Upload of {payload_bytes / MB:.1f} MB (~{rows} rows) needs an estimated "
+                f"{estimate['peak'] * self.safety_factor / MB:.0f} MB, more than the {capacity / MB:.0f} MB available "
+                f"to this instance", 413, _mb(estimate))
+
+    def admit(self, n_rows, n_columns=None, n_factors=4, n_responses=3, payload_bytes=0, permutations=0,
+              low_memory=True, wait=True, on_queue=None):
+        """
+        准入一个分析任务（必要时排队），返回 Admission；用完后 release（或用 with）
+
+        Args:
+            n_rows, n_columns, n_factors, n_responses, payload_bytes, permutations: 见 estimate_memory
+            low_memory (bool): 余量不足时是否允许改用低内存模式
+            wait (bool): 余量不足时是否排队等待
+            on_queue (callable): 开始排队时调用 on_queue(估计 MB dict)
+
+        Raises:
+            AdmissionRejected: 永远放不下（413）或排队超时（503）
+        """
+        estimates = {mode: estimate_memory(n_rows, n_columns, n_factors, n_responses, payload_bytes, permutations,
+                                           mode)
+                     for mode in (("standard", "low_memory") if low_memory else ("standard",))}
+        needs = {mode: estimate["peak"] * self.safety_factor for mode, estimate in estimates.items()}
+        capacity = self.capacity()
+        if capacity is not None and min(needs.values()) > capacity:
+            raise AdmissionRejected(
+                f"Analysis of {n_rows} rows needs an estimated {min(needs.values()) / MB:.0f} MB, "
+                f"more than the {capacity / MB:.0f} MB available to this instance", 413, _mb(estimates["standard"]))
+
+        start = time.perf_counter()
+        queued = False
+        with self._condition:
+            while True:
+                headroom = self.headroom()
+                for mode in estimates:
+                    if headroom is None or needs[mode] <= headroom:
+                        self._reserved += needs[mode]
+                        decision = "admitted" if mode == "standard" else "low_memory"
+                        if queued:
+                            decision = f"queued_{decision}"
+                        return Admission(self, decision, mode, estimates[mode], needs[mode],
+                                         time.perf_counter() - start)
+                remaining = self.queue_timeout - (time.perf_counter() - start)
+                if not wait or remaining <= 0:
+                    raise AdmissionRejected(
+                        f"Not enough free memory for {n_rows} rows (needs {min(needs.values()) / MB:.0f} MB, "
+                        f"{headroom / MB:.0f} MB free); retry later", 503, _mb(estimates["standard"]))
+                if not queued and on_queue is not None:
+                    on_queue(_mb(estimates["standard"]))
+                queued = True
+                # 其他任务释放预留时会唤醒；系统内存变化没有通知，因此定期重新检查
+                self._condition.wait(timeout=min(remaining, 1.0))
+
+    def _release(self, reserved):
+        with self._condition:
+            self._reserved = max(0, self._reserved - reserved)
+            self._condition.notify_all()
+
+
+def _mb(estimate):
+    return {k: round(v / MB, 1) for k, v in estimate.items()}
+
+
+class StageMemoryTracker:
+    """
+    分阶段 tracemalloc 峰值记录
+
+    mark(stage) 返回并记录上一次 mark 以来的峰值（MB），然后重置峰值；close() 停止本对象启动的追踪
+    """
+
+    def __init__(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.records = []
+
+    def mark(self, stage, response=None):
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        self.records.append({"Stage": stage, "Response": response, "Peak_MB": round(peak / MB, 3),
+                             "Current_MB": round(current / MB, 3)})
+        return self.records[-1]["Peak_MB"]
+
+    def frame(self):
+        return pd.DataFrame(self.records, columns=["Stage", "Response", "Peak_MB", "Current_MB"])
+
+    def close(self):
+        if self._started and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._started = False
+
+
+@contextmanager
+def track_stage_memory(enabled=True):
+    """StageMemoryTracker 的上下文管理器；enabled=False 时产出 None"""
+    tracker = StageMemoryTracker() if enabled else None
+    try:
+        yield tracker
+    finally:
+        if tracker is not None:
+            tracker.close()
@@ -0,0 +1,291 @@
+"""
+历史 DOE 试验归档（内存映射列式存储）+ 子集查询
+
+🎯 作用：
+把多年来分散的 DOE CSV 汇总到一个本地归档目录中，之后的分析直接按条件取子集，
+不必再逐个重新读取 CSV：
+
+    archive/
+      manifest.json              ← 段列表 + 每段的索引（产品线、日期范围、各数值列的 min / max）
+      segments/<段号>/<列名>.npy  ← 每列一个 .npy 文件，查询时以 mmap 方式打开
+
+- 查询时先用 manifest 中的索引（zone map）跳过不相关的段，只打开需要的列
+- 整段都满足条件时直接返回 np.memmap（零拷贝）；只有部分行满足条件时才复制选中的行
+- ArchiveQuery 可直接作为 run_mixed_model_doe 的输入（见 load_input_data）
+- 多个实例 / 进程可以共用同一个归档目录：append 在跨进程文件锁（manifest.lock）内重新读取 manifest、
+  追加段后原子替换；查询前按 manifest 的 mtime 判断是否需要重新加载，能看到其他实例的追加
+
+示例：
+    archive = ExperimentArchive("./doe_archive")
+    archive.append("DOEData_20250622.csv", product_line="PL-A", run_date="2025-06-22")
+    query = archive.query(product_line="PL-A", date_from="2025-01-01", factor_ranges={"Temp": (10, 20)},
+                          columns=["dye1", "dye2", "Time", "Temp", "Lvalue", "Avalue", "Bvalue"])
+    run_mixed_model_doe(query, "./outputDOE")
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import json
+import uuid
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "manifest.lock"
+SEGMENT_ROWS = 65536  # 每段最大行数，段越小 zone map 剪枝越精细
+PRODUCT_LINE_COLUMN = "product_line"
+DATE_COLUMN = "run_date"
+
+
+def _column_array(series):
+    """Series → 可 mmap 的定长 NumPy 数组（字符串列存为定长 Unicode）"""
+    if series.name == DATE_COLUMN:
+        return pd.to_datetime(series).to_numpy(dtype="datetime64[D]")
+    if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.to_numpy()
+    return series.astype(str).to_numpy(dtype=str)
+
+
+class ExperimentArchive:
+    """
+    内存映射列式归档
+
+    Args:
+        root (str): 归档目录（不存在时自动创建）
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "segments"), exist_ok=True)
+        self._manifest = {"segments": []}
+        self._manifest_stamp = None  # 已加载的 manifest 的 (mtime_ns, size)
+        self._refresh()
+
+    @contextmanager
+    def _exclusive(self):
+        """跨线程 + 跨进程的写锁（同一目录的所有实例共用 manifest.lock）"""
+        with self._lock, open(os.path.join(self.root, LOCK_NAME), "a+b") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                else:
+                    handle.seek(0)
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _refresh(self):
+        """manifest 被其他实例 / 进程替换（mtime 或大小变化）时重新加载"""
+        path = os.path.join(self.root, MANIFEST_NAME)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == self._manifest_stamp:
+            return
+        with open(path, encoding="utf-8") as f:
+            self._manifest = json.load(f)
+        self._manifest_stamp = stamp
+
+    def _write_manifest(self):
+        # 先写临时文件再原子替换，读者不会看到写了一半的 manifest（调用方持有 _exclusive）
+        path = os.path.join(self.root, MANIFEST_NAME)
+        tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+        stat = os.stat(path)
+        self._manifest_stamp = (stat.st_mtime_ns, stat.st_size)
+
+    @property
+    def segments(self):
+        self._refresh()
+        return list(self._manifest["segments"])
+
+    def append(self, source, product_line=None, run_date=None, source_name=None):
+        """
+        追加一批试验数据
+
+        Args:
+            source: CSV 路径 / 文件类对象 / DataFrame
+            product_line (str): 产品线；为空时要求数据中已有 product_line 列
+            run_date (str): 试验日期；为空时要求数据中已有 run_date 列
+            source_name (str): 来源文件名，记录在 manifest 中
+
+        Returns:
+            list: 新增段的段号
+        """
+        df = source.copy() if isinstance(source, pd.DataFrame) else pd.read_csv(source)
+        if source_name is None and isinstance(source, (str, os.PathLike)):
+            source_name = os.path.basename(source)
+        if product_line is not None:
+            df[PRODUCT_LINE_COLUMN] = product_line
+        if run_date is not None:
+            df[DATE_COLUMN] = run_date
+        for required in (PRODUCT_LINE_COLUMN, DATE_COLUMN):
+            if required not in df.columns:
+                raise ValueError(f"Archive rows need a '{required}' column or argument")
+
+        new_segments = []
+        for start in range(0, len(df), SEGMENT_ROWS):
+            new_segments.append(self._write_segment(df.iloc[start:start + SEGMENT_ROWS], source_name))
+        # 段文件先写（不在锁内）；锁内重新读取 manifest 再追加，其他实例的追加不会被覆盖
+        with self._exclusive():
+            self._manifest_stamp = None
+            self._refresh()
+            self._manifest["segments"].extend(new_segments)
+            self._write_manifest()
+        return [segment["id"] for segment in new_segments]
+
+    def _write_segment(self, df, source_name):
+        segment_id = uuid.uuid4().hex
+        directory = os.path.join(self.root, "segments", segment_id)
+        os.makedirs(directory)
+        stats = {}
+        for column in df.columns:
+            values = _column_array(df[column])
+            np.save(os.path.join(directory, f"{column}.npy"), values, allow_pickle=False)
+            if values.dtype.kind in "iuf":
+                stats[column] = [float(np.nanmin(values)), float(np.nanmax(values))]
+        dates = pd.to_datetime(df[DATE_COLUMN])
+        return {
+            "id": segment_id,
+            "rows": len(df),
+            "source": source_name,
+            "columns": list(map(str, df.columns)),
+            "product_lines": sorted(df[PRODUCT_LINE_COLUMN].astype(str).unique().tolist()),
+            "date_range": [dates.min().strftime("%Y-%m-%d"), dates.max().strftime("%Y-%m-%d")],
+            "stats": stats,
+        }
+
+    def open_column(self, segment, column):
+        """以 mmap 方式打开某段的一列（只读，零拷贝）"""
+        return np.load(os.path.join(self.root, "segments", segment["id"], f"{column}.npy"),
+                       mmap_mode="r", allow_pickle=False)
+
+    def query(self, product_line=None, date_from=None, date_to=None, factor_ranges=None, columns=None):
+        """
+        构建子集查询（惰性执行，调用 to_columns / to_frame 时才读取数据）
+
+        Args:
+            product_line (str | list): 产品线
+            date_from, date_to (str): 日期范围（闭区间）
+            factor_ranges (dict): 列名 → (最小值, 最大值)，闭区间
+            columns (list): 需要读取的列，默认全部列
+
+        Returns:
+            ArchiveQuery
+        """
+        if isinstance(product_line, str):
+            product_line = [product_line]
+        return ArchiveQuery(self, product_line, date_from, date_to, factor_ranges or {}, columns)
+
+
+class ArchiveQuery:
+    """归档子集查询：先按 zone map 剪枝，再按行过滤"""
+
+    def __init__(self, archive, product_lines, date_from, date_to, factor_ranges, columns):
+        self.archive = archive
+        self.product_lines = product_lines
+        self.date_from = np.datetime64(date_from, "D") if date_from is not None else None
+        self.date_to = np.datetime64(date_to, "D") if date_to is not None else None
+        self.factor_ranges = factor_ranges
+        self.columns = columns
+
+    def _segment_coverage(self, segment):
+        """
+        根据 zone map 判断段与查询的关系
+
+        Returns:
+            str: "none"（整段跳过）、"all"（整段满足，零拷贝）或 "partial"（需要逐行过滤）
+        """
+        coverage = "all"
+        if self.product_lines is not None:
+            hits = set(segment["product_lines"]) & set(self.product_lines)
+            if not hits:
+                return "none"
+            if len(hits) < len(segment["product_lines"]):
+                coverage = "partial"
+        low, high = (np.datetime64(d, "D") for d in segment["date_range"])
+        if (self.date_from is not None and high < self.date_from) or (self.date_to is not None and low > self.date_to):
+            return "none"
+        if (self.date_from is not None and low < self.date_from) or (self.date_to is not None and high > self.date_to):
+            coverage = "partial"
+        for column, (lo, hi) in self.factor_ranges.items():
+            if column not in segment["stats"]:
+                return "none"
+            seg_lo, seg_hi = segment["stats"][column]
+            if seg_hi < lo or seg_lo > hi:
+                return "none"
+            if seg_lo < lo or seg_hi > hi:
+                coverage = "partial"
+        return coverage
+
+    def _row_mask(self, segment):
+        archive = self.archive
+        mask = np.ones(segment["rows"], dtype=bool)
+        if self.product_lines is not None:
+            mask &= np.isin(archive.open_column(segment, PRODUCT_LINE_COLUMN), self.product_lines)
+        if self.date_from is not None or self.date_to is not None:
+            dates = archive.open_column(segment, DATE_COLUMN)
+            if self.date_from is not None:
+                mask &= dates >= self.date_from
+            if self.date_to is not None:
+                mask &= dates <= self.date_to
+        for column, (lo, hi) in self.factor_ranges.items():
+            values = archive.open_column(segment, column)
+            mask &= (values >= lo) & (values <= hi)
+        return mask
+
+    def segments(self):
+        """经 zone map 剪枝后需要读取的段：[(段, 覆盖类型)]"""
+        plan = [(segment, self._segment_coverage(segment)) for segment in self.archive.segments]
+        return [(segment, coverage) for segment, coverage in plan if coverage != "none"]
+
+    def to_columns(self):
+        """
+        执行查询
+
+        Returns:
+            dict: 列名 → 数组；只命中一个完整段时为 np.memmap（零拷贝）
+        """
+        plan = self.segments()
+        columns = self.columns
+        if columns is None:
+            columns = list(dict.fromkeys(c for segment, _ in plan for c in segment["columns"]))
+        if not plan:
+            return {column: np.empty(0) for column in columns}
+
+        parts = {column: [] for column in columns}
+        for segment, coverage in plan:
+            mask = None if coverage == "all" else self._row_mask(segment)
+            for column in columns:
+                if column in segment["columns"]:
+                    values = self.archive.open_column(segment, column)
+                    parts[column].append(values if mask is None else values[mask])
+                else:
+                    rows = segment["rows"] if mask is None else int(mask.sum())
+                    parts[column].append(np.full(rows, np.nan))
+        return {column: arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+                for column, arrays in parts.items()}
+
+    def to_frame(self):
+        return pd.DataFrame(self.to_columns(), copy=False)
@@ -0,0 +1,179 @@
+"""
+D / I 最优增补试验推荐
+
+🎯 作用：
+在已有设计（如 design_data.csv 或注册表中的设计数据）的基础上，从候选点集合中挑选
+下一批 n_runs 个试验点，使当前 simplified 模型的信息矩阵 M = FᵀF 最优：
+- D 最优：最大化 det(M)
+- I 最优：最小化设计区域上的平均预测方差 trace(M⁻¹W)，W 为候选区域的矩矩阵
+
+算法为基于候选集的点交换（Fedorov 型）：
+- 移除 / 加入一个点都用 Sherman–Morrison 对 M⁻¹ 做秩一更新，det 比值为 1 ± fᵀM⁻¹f
+- 每次交换对全部候选点做一次矩阵运算（向量化评估）
+- 多个随机起点在线程池中并行，取最优结果
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from doe_terms import compile_terms, model_matrix
+
+CRITERIA = ("D", "I")
+MAX_RUNS = 200  # 单次推荐的增补试验数上限
+MAX_LEVELS = 50  # 网格每个因子的水平数上限
+MAX_CANDIDATES = 200_000  # 候选网格点数上限（levels^k，超出时拒绝而不是分配巨大的矩阵）
+MAX_STARTS = 64
+
+
+def candidate_grid(factor_ranges, predictors, levels=10):
+    """
+    在因子范围内生成全因子网格候选点（原始单位）
+
+    Args:
+        factor_ranges (dict): 因子 → (最小值, 最大值)
+        predictors (list): 因子列名
+        levels (int | dict): 每个因子的水平数
+
+    Returns:
+        np.ndarray: (N, k) 候选点
+
+    Raises:
+        ValueError: 水平数越界或网格点数超过 MAX_CANDIDATES
+    """
+    counts = [int(levels[p] if isinstance(levels, dict) else levels) for p in predictors]
+    if any(not 2 <= n <= MAX_LEVELS for n in counts):
+        raise ValueError(f"levels must be between 2 and {MAX_LEVELS}")
+    size = int(np.prod(counts, dtype=float))
+    if size > MAX_CANDIDATES:
+        raise ValueError(f"Candidate grid too large: {size} points (limit {MAX_CANDIDATES}); reduce levels")
+    axes = []
+    for p, n in zip(predictors, counts):
+        low, high = factor_ranges[p]
+        axes.append(np.linspace(low, high, n))
+    return np.array(list(itertools.product(*axes)), dtype=float)
+
+
+def _add_point(Minv, f):
+    """Sherman–Morrison：M + ffᵀ 的逆"""
+    g = Minv @ f
+    return Minv - np.outer(g, g) / (1.0 + f @ g)
+
+
+def _remove_point(Minv, f):
+    """Sherman–Morrison：M − ffᵀ 的逆"""
+    g = Minv @ f
+    return Minv + np.outer(g, g) / (1.0 - f @ g)
+
+
+def _criterion_value(Minv, criterion, W):
+    if criterion == "D":
+        return -np.linalg.slogdet(Minv)[1]  # log det(M)
+    return float(np.trace(Minv @ W))  # 平均相对预测方差
+
+
+def _exchange(M0, F, n_runs, criterion, W, seed, max_passes):
+    """单个随机起点的点交换，返回 (选中的候选下标, 准则值)"""
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(len(F), size=n_runs, replace=len(F) < n_runs)
+
+    for _ in range(max_passes):
+        Minv = np.linalg.inv(M0 + F[chosen].T @ F[chosen])  # 每轮重新求逆，避免秩一更新的误差累积
+        improved = False
+        for i in range(n_runs):
+            Minv_minus = _remove_point(Minv, F[chosen[i]])
+            G = F @ Minv_minus
+            d = np.einsum("ij,ij->i", G, F)  # 全部候选点的 fᵀM⁻¹f
+            if criterion == "D":
+                score = d  # det 比值 1 + d
+            else:
+                score = np.einsum("ij,ij->i", G @ W, G) / (1.0 + d)  # trace(M⁻¹W) 的下降量
+            best = int(np.argmax(score))
+            if score[best] > score[chosen[i]] * (1 + 1e-9) + 1e-12:
+                chosen[i] = best
+                improved = True
+            Minv = _add_point(Minv_minus, F[chosen[i]])
+        if not improved:
+            break
+
+    Minv = np.linalg.inv(M0 + F[chosen].T @ F[chosen])
+    return chosen, _criterion_value(Minv, criterion, W)
+
+
+def augment_design(existing, terms, predictors, x_mean, x_scale, n_runs=6, criterion="D",
+                   candidates=None, factor_ranges=None, levels=10, n_starts=8, n_jobs=None,
+                   random_state=None, max_passes=50):
+    """
+    推荐增补试验点
+
+    Args:
+        existing (np.ndarray | pd.DataFrame): 已有试验（原始单位，列顺序同 predictors）
+        terms (list): simplified 模型项（含 "Intercept"）
+        predictors (list): 因子列名
+        x_mean, x_scale (array): 标准化参数（scaler.csv 的 Mean / StdDev）
+        n_runs (int): 增补试验数
+        criterion (str): "D" 或 "I"
+        candidates (np.ndarray): (N, k) 候选点（原始单位）；为空时在 factor_ranges 上生成网格
+        factor_ranges (dict): 因子 → (最小值, 最大值)，默认取已有设计的观测范围
+        levels (int | dict): 网格水平数
+        n_starts (int): 随机起点数
+        n_jobs (int): 并行线程数
+        random_state (int): 随机种子
+
+    Returns:
+        dict: runs（推荐试验表）及增补前后的准则值
+    """
+    criterion = criterion.upper()
+    if criterion not in CRITERIA:
+        raise ValueError(f"Unsupported criterion: {criterion}. Supported: {', '.join(CRITERIA)}")
+    if not 1 <= n_runs <= MAX_RUNS:
+        raise ValueError(f"n_runs must be between 1 and {MAX_RUNS}")
+    if not 1 <= n_starts <= MAX_STARTS:
+        raise ValueError(f"n_starts must be between 1 and {MAX_STARTS}")
+
+    if isinstance(existing, pd.DataFrame):
+        existing = existing[predictors].to_numpy(dtype=float)
+    existing = np.asarray(existing, dtype=float)
+    if candidates is None:
+        if factor_ranges is None:
+            factor_ranges = {p: (existing[:, i].min(), existing[:, i].max()) for i, p in enumerate(predictors)}
+        candidates = candidate_grid(factor_ranges, predictors, levels)
+    candidates = np.asarray(candidates, dtype=float)
+
+    x_mean = np.asarray(x_mean, dtype=float)
+    x_scale = np.asarray(x_scale, dtype=float)
+    pairs = compile_terms(terms, predictors)
+    F0 = model_matrix((existing - x_mean) / x_scale, pairs)
+    F = model_matrix((candidates - x_mean) / x_scale, pairs)
+
+    M0 = F0.T @ F0
+    if np.linalg.matrix_rank(M0) < M0.shape[0]:
+        # 已有设计无法单独估计全部项时加微小岭项，保证可逆
+        M0 = M0 + np.eye(M0.shape[0]) * 1e-8 * np.trace(M0) / M0.shape[0]
+    W = F.T @ F / len(F)
+
+    seeds = np.random.SeedSequence(random_state).spawn(n_starts)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        starts = list(pool.map(lambda seed: _exchange(M0, F, n_runs, criterion, W, seed, max_passes), seeds))
+    pick = np.argmax if criterion == "D" else np.argmin
+    chosen, value = starts[int(pick([v for _, v in starts]))]
+
+    Minv0 = np.linalg.inv(M0)
+    runs = pd.DataFrame(candidates[chosen], columns=predictors)
+    runs["Relative_Prediction_Variance_Before"] = np.einsum("ij,jk,ik->i", F[chosen], Minv0, F[chosen])
+    runs.index = pd.RangeIndex(1, n_runs + 1, name="Run")
+
+    return {
+        "criterion": criterion,
+        "runs": runs,
+        "log_det_before": float(np.linalg.slogdet(M0)[1]),
+        "log_det_after": float(np.linalg.slogdet(M0 + F[chosen].T @ F[chosen])[1]),
+        "avg_prediction_variance_before": float(np.trace(Minv0 @ W)),
+        "avg_prediction_variance_after": float(np.trace(np.linalg.inv(M0 + F[chosen].T @ F[chosen]) @ W)),
+        "n_candidates": len(F),
+    }
@@ -0,0 +1,157 @@
+"""
+拟合后端（可插拔）：统一分析引擎中的 OLS LogWorth 扫描与混合模型求解器选择
+
+🎯 作用：
+原来有两份几乎相同的分析脚本（20250802 / 20250804），各自直接调用 statsmodels。现在只有一个引擎
+（MixedModelDOE_Function_FollowOriginal_20250804.run_mixed_model_doe），数值计算经由后端完成：
+
+- "statsmodels" : 参考实现（smf.ols + anova_lm(typ=3)；混合模型默认 statsmodels.MixedLM），默认
+- "numpy"       : 快速实现（patsy 设计矩阵 + 伪逆一次求解 + Type III Wald F 检验；
+                  混合模型与 statsmodels 后端相同，由 mixed_solver 选择）
+
+新的后端只需提供 name、sparse_mixed 属性与 logworth(df, y, terms) 方法，
+可注册到 BACKENDS 或直接把实例传给 run_mixed_model_doe(backend=...)。
+更换后端前用 doe_golden 的基准输出比对确认数值一致（见 doe_golden.run_harness）。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+from statsmodels.stats.anova import anova_lm
+from patsy import dmatrices
+from scipy import stats
+
+from doe_terms import compile_terms, model_matrix
+
+
+def _logworth_table(factors, p_values, y):
+    """Factor / LogWorth 两列表（p 值为 0 时按 1e-16 截断，与原脚本一致）"""
+    p_values = pd.Series(p_values, dtype=float)
+    return pd.DataFrame({"Factor": list(factors), y: (-np.log10(p_values.replace(0, 1e-16))).to_numpy()})
+
+
+def _patsy_name(term):
+    """RSM 项名 → patsy / statsmodels 输出中的项名（如 "I(dye1**2)" → "I(dye1 ** 2)"）"""
+    if term.startswith("I("):
+        var, power = term[2:].rstrip(")").split("**")
+        return f"I({var.strip()} ** {power.strip()})"
+    return ":".join(v.strip() for v in term.split(":"))
+
+
+def _rsm_design(df, y, terms):
+    """二阶 RSM 项 → (设计矩阵, y, 各项列下标, 项名)；含其他形式的项时返回 None"""
+    predictors = []
+    try:
+        for term in terms:
+            for var in term.replace("I(", "").replace(")", "").replace("**", ":").split(":"):
+                var = var.strip()
+                if not var.isdigit() and var not in predictors:
+                    predictors.append(var)
+        pairs = compile_terms(terms, predictors)
+    except (ValueError, IndexError):
+        return None
+    if any(p not in df.columns for p in predictors):
+        return None
+    # patsy 的项顺序：Intercept，然后按交互阶数稳定排序（I(x ** 2) 视为单个因子）
+    order = sorted(range(len(terms)), key=lambda i: ":" in terms[i])
+    names = ["Intercept"] + [_patsy_name(terms[i]) for i in order]
+    pairs = np.vstack([[len(predictors), len(predictors)], pairs[order]])
+    data = df[predictors + [y]].to_numpy(dtype=float)
+    data = data[~np.isnan(data).any(axis=1)]  # 与 patsy 相同：丢弃含缺失值的行
+    X = model_matrix(data[:, :-1], pairs)
+    return X, data[:, -1], [slice(i, i + 1) for i in range(len(names))], names
+
+
+def design_matrix(df, y, terms):
+    """
+    OLS 设计矩阵（含 Intercept），列与项的对应关系与 patsy / statsmodels 相同
+
+    二阶 RSM 项由 doe_terms 直接按列相乘得到（不经过 patsy 公式解析），其他项退回 patsy
+
+    Returns:
+        tuple: (X, y, 各项的列 slice 列表, 项名列表)
+    """
+    design = _rsm_design(df, y, terms)
+    if design is None:
+        y_df, X_df = dmatrices(f"{y} ~ " + " + ".join(terms), df, return_type="dataframe")
+        slices = X_df.design_info.term_name_slices
+        design = (X_df.to_numpy(dtype=float), y_df.iloc[:, 0].to_numpy(dtype=float),
+                  list(slices.values()), list(slices))
+    return design
+
+
+class StatsmodelsBackend:
+    """参考后端：statsmodels OLS + Type III ANOVA（原脚本的计算方式）"""
+
+    name = "statsmodels"
+    sparse_mixed = False  # 单个 Config_combo 随机截距时使用 statsmodels.MixedLM
+
+    def logworth(self, df, y, terms):
+        """
+        单个响应变量的 OLS + Type III ANOVA LogWorth 扫描
+
+        Returns:
+            pd.DataFrame: 两列 Factor、y（LogWorth）
+        """
+        formula = f"{y} ~ " + " + ".join(terms)
+        model = smf.ols(formula, data=df).fit()
+        anova_tbl = anova_lm(model, typ=3)
+        anova_tbl = anova_tbl[anova_tbl.index != "Residual"]
+        return _logworth_table(anova_tbl.index, anova_tbl["PR(>F)"], y)
+
+
+class NumpyBackend:
+    """
+    快速后端：不构造 statsmodels 模型对象，直接由设计矩阵计算 Type III 检验
+
+    设计矩阵见 design_matrix；X 只做一次 SVD，得到伪逆、秩与 Cov(β̂)。每个项 T 的检验（与 anova_lm(typ=3) 相同的 Wald F 检验）：
+        F_T = β̂_Tᵀ [Cov(β̂)_TT]⁻¹ β̂_T / q_T，  Cov(β̂) = MSE · (XᵀX)⁺，自由度 (q_T, n − rank(X))
+    """
+
+    name = "numpy"
+    sparse_mixed = False  # 混合模型求解器由 mixed_solver 决定（稀疏 REML 与 MixedLM 只在优化精度内一致，会改变基准输出）
+
+    def logworth(self, df, y, terms):
+        X, yv, columns, names = design_matrix(df, y, terms)
+
+        U, sv, Vt = np.linalg.svd(X, full_matrices=False)
+        keep = sv > sv.max() * max(X.shape) * np.finfo(float).eps
+        U, sv, Vt = U[:, keep], sv[keep], Vt[keep]
+        beta = Vt.T @ ((U.T @ yv) / sv)
+        df_resid = X.shape[0] - len(sv)
+        mse = np.sum((yv - X @ beta) ** 2) / df_resid
+        cov = mse * ((Vt.T / sv ** 2) @ Vt)
+
+        p_values = []
+        for cols in columns:
+            b = beta[cols]
+            F = b @ np.linalg.pinv(cov[cols, cols]) @ b / len(b)
+            p_values.append(stats.f.sf(F, len(b), df_resid))
+        return _logworth_table(names, p_values, y)
+
+
+BACKENDS = {
+    "statsmodels": StatsmodelsBackend,
+    "numpy": NumpyBackend,
+}
+
+
+def get_backend(backend):
+    """
+    根据名称创建拟合后端；传入已构造的后端对象时原样返回
+
+    Args:
+        backend (str | object): "statsmodels" / "numpy" 或自定义后端
+
+    Returns:
+        后端对象（提供 name、sparse_mixed、logworth）
+    """
+    if not isinstance(backend, str):
+        return backend
+    try:
+        return BACKENDS[backend.lower()]()
+    except KeyError:
+        raise ValueError(f"Unsupported backend: {backend}. Supported: {', '.join(BACKENDS)}")
@@ -0,0 +1,366 @@
+"""
+DOE API 客户端库 + 命令行工具（分块流式上传、连接池复用、重试、并发批量提交）
+
+🎯 作用：
+取代 csv_to_base64_converter.py（整文件读入内存再打印 base64）和 test_api_connection.py
+（每次新建连接的一次性 requests.post）：
+
+- 上传：按块读取文件 → gzip / zstd 流式压缩 → 分块传输请求体（服务端边收边解码，见 doe_payload）
+- 连接：同一个 DOEClient 内的所有请求共用一个 keep-alive 连接池
+- 重试：连接失败、服务端断开空闲连接、429 / 502 / 503 / 504 时按指数退避 + 随机抖动重试，
+        遵守 Retry-After；上传体按需重新生成，不在内存中缓存
+- 批量：run_batch 以有界并发提交大量数据集；默认走 /jobs（服务端各任务独立工作目录并行执行），
+        /api/DoeAnalysis 在服务端是串行的
+
+示例：
+    with DOEClient("http://localhost:8000", max_connections=8) as client:
+        results = client.run_batch(glob.glob("nightly/*.csv"), max_parallel=8, threshold=1.5)
+
+命令行：
+    python doe_client.py http://localhost:8000 nightly/ --parallel 8 --compression zstd
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import zlib
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import httpx
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖，未安装时只能使用 gzip / identity
+    zstandard = None
+
+CHUNK_SIZE = 1 << 20  # 每次从文件读取的字节数
+DEFAULT_TIMEOUT = 600.0  # 单次请求的读超时（秒）：/api/DoeAnalysis 在返回前要跑完整个分析
+RETRY_STATUSES = (429, 502, 503, 504)
+MAX_BACKOFF = 30.0
+FINISHED_JOB_STATES = ("succeeded", "failed")
+PRECOMPRESSED_SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+
+# 请求可能尚未到达服务端的传输错误：重试不会重复执行分析
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError)
+# 幂等请求（GET）另外在读超时 / 读失败时重试
+_RETRYABLE_READ_ERRORS = _RETRYABLE_ERRORS + (httpx.ReadTimeout, httpx.ReadError)
+
+
+class DOEClientError(Exception):
+    """API 返回错误（非 2xx），或重试次数用尽"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def iter_file_chunks(path, compression="gzip", chunk_size=CHUNK_SIZE):
+    """
+    按块读取并压缩文件（不把整个文件读入内存）
+
+    Args:
+        path (str): CSV 文件路径
+        compression (str): "gzip" / "zstd" / "identity"
+        chunk_size (int): 每次读取的字节数
+
+    Yields:
+        bytes: 压缩后的数据块
+    """
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == "zstd":
+        if zstandard is None:
+            raise DOEClientError("zstd compression requires the 'zstandard' package")
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    elif compression == "identity":
+        compressor = None
+    else:
+        raise DOEClientError(f"Unsupported compression: {compression}. Supported: gzip, zstd, identity")
+
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            out = compressor.compress(chunk) if compressor is not None else chunk
+            if out:
+                yield out
+    if compressor is not None:
+        tail = compressor.flush()
+        if tail:
+            yield tail
+
+
+def _upload_encoding(path, compression):
+    """
+    Returns:
+        tuple: (本地压缩方式, Content-Encoding)；已压缩的 .gz / .zst 文件原样上传
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix in PRECOMPRESSED_SUFFIXES:
+        return "identity", PRECOMPRESSED_SUFFIXES[suffix]
+    return compression, compression
+
+
+def _dataset_name(path):
+    """nightly/DOEData_20250622.csv.gz → DOEData_20250622"""
+    name = os.path.basename(path)
+    for suffix in PRECOMPRESSED_SUFFIXES:
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.splitext(name)[0] or "default"
+
+
+def _error_message(response):
+    try:
+        return response.json().get("message") or response.text
+    except ValueError:
+        return response.text
+
+
+class DOEClient:
+    """
+    DOE API 客户端（线程安全：批量提交时多个线程共用同一个连接池）
+
+    Args:
+        base_url (str): 如 "http://localhost:8000"
+        max_connections (int): 连接池大小（应不小于批量并发数）
+        timeout (float): 读超时（秒）
+        retries (int): 可重试错误的最大重试次数
+        backoff (float): 退避基数（秒），第 k 次重试前等待 U(0, backoff·2^k)
+        compression (str): 上传压缩方式 "gzip" / "zstd" / "identity"
+        chunk_size (int): 上传时每次读取的字节数
+    """
+
+    def __init__(self, base_url, max_connections=8, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5,
+                 compression="gzip", chunk_size=CHUNK_SIZE):
+        self.retries = retries
+        self.backoff = backoff
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self._http = httpx.Client(
+            base_url=base_url.rstrip("/"),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=10.0, pool=None),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._http.close()
+
+    def _sleep_before_retry(self, attempt, response=None):
+        delay = random.uniform(0, min(MAX_BACKOFF, self.backoff * 2 ** attempt))
+        if response is not None:
+            retry_after = response.headers.get("retry-after", "")
+            if retry_after.isdigit():
+                delay = min(MAX_BACKOFF, float(retry_after))
+        time.sleep(delay)
+
+    def _request(self, method, url, body=None, **kwargs):
+        """
+        发送请求，遇到瞬时错误时退避重试
+
+        Args:
+            body (callable): 返回上传数据块迭代器的函数；每次重试重新调用，生成新的上传流
+
+        Returns:
+            httpx.Response: 2xx 响应
+
+        Raises:
+            DOEClientError: 非 2xx 响应，或重试次数用尽
+        """
+        retryable = _RETRYABLE_READ_ERRORS if method == "GET" else _RETRYABLE_ERRORS
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._http.request(method, url, content=body() if body else None, **kwargs)
+            except retryable as e:
+                if attempt == self.retries:
+                    raise DOEClientError(f"{method} {url} failed after {attempt + 1} attempts: {e!r}") from e
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                self._sleep_before_retry(attempt, response)
+                continue
+            if response.is_error:
+                raise DOEClientError(_error_message(response), response.status_code)
+            return response
+
+    def _upload(self, endpoint, path, params):
+        local_compression, content_encoding = _upload_encoding(path, self.compression)
+        headers = {"Content-Type": "text/csv"}
+        if content_encoding != "identity":
+            headers["Content-Encoding"] = content_encoding
+        params = {key: value for key, value in params.items() if value is not None}
+        response = self._request(
+            "POST", endpoint, params=params, headers=headers,
+            body=lambda: iter_file_chunks(path, local_compression, self.chunk_size)
+        )
+        return response.json()
+
+    def analyze(self, path, response_column="Lvalue,Avalue,Bvalue", model_name=None, **options):
+        """
+        同步分析（/api/DoeAnalysis）：流式上传 CSV，等待分析完成
+
+        Args:
+            path (str): CSV 文件路径（也可以是 .csv.gz / .csv.zst）
+            response_column (str): 响应变量，逗号分隔
+            model_name (str): 注册表中的模型名称，默认取文件名
+            **options: 其他 DoeAnalysisRequest 字段（threshold、random_effects、mixed_solver、export_format 等）
+
+        Returns:
+            dict: API 响应
+        """
+        params = {"response_column": response_column, "model_name": model_name or _dataset_name(path), **options}
+        return self._upload("/api/DoeAnalysis", path, params)
+
+    def submit_job(self, path, response_column="Lvalue,Avalue,Bvalue", model_name=None, **options):
+        """
+        提交后台任务（/jobs），数据上传并解析完成后立即返回
+
+        Returns:
+            dict: 含 job_id、status_url、events_url
+        """
+        params = {"response_column": response_column, "model_name": model_name or _dataset_name(path), **options}
+        return self._upload("/jobs", path, params)
+
+    def job_status(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}").json()
+
+    def wait_job(self, job_id, poll_interval=1.0, max_interval=10.0, timeout=None):
+        """
+        轮询任务状态直至结束（轮询间隔逐步放大到 max_interval）
+
+        Returns:
+            dict: 任务最终状态（GET /jobs/{job_id}）
+
+        Raises:
+            DOEClientError: 超过 timeout 秒仍未结束
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = poll_interval
+        while True:
+            status = self.job_status(job_id)
+            if status["status"] in FINISHED_JOB_STATES:
+                return status
+            if deadline is not None and time.monotonic() > deadline:
+                raise DOEClientError(f"Job {job_id} did not finish within {timeout} seconds")
+            time.sleep(interval)
+            interval = min(max_interval, interval * 1.5)
+
+    def predict(self, recipes, model="default", version=None):
+        payload = {"model": model, "version": version, "recipes": recipes}
+        return self._request("POST", "/predict", json=payload).json()
+
+    def _run_one(self, path, use_jobs, job_timeout, options):
+        start = time.perf_counter()
+        try:
+            if use_jobs:
+                job = self.submit_job(path, **options)
+                status = self.wait_job(job["job_id"], timeout=job_timeout)
+                if status["status"] != "succeeded":
+                    raise DOEClientError(f"Job {job['job_id']} failed: {status.get('error')}")
+                result = status["result"]
+            else:
+                result = self.analyze(path, **options)
+            return {"path": path, "ok": True, "result": result, "seconds": time.perf_counter() - start}
+        except DOEClientError as e:
+            return {"path": path, "ok": False, "error": str(e), "status_code": e.status_code,
+                    "seconds": time.perf_counter() - start}
+
+    def run_batch(self, paths, max_parallel=4, use_jobs=True, job_timeout=None, on_result=None, **options):
+        """
+        以有界并发批量分析多个数据集；单个数据集失败不影响其他数据集
+
+        Args:
+            paths (list): CSV 文件路径
+            max_parallel (int): 同时进行的数据集数（上传 + 等待）
+            use_jobs (bool): True 时走 /jobs（服务端并行），False 时走 /api/DoeAnalysis（服务端串行）
+            job_timeout (float): 单个任务的最长等待时间（秒）
+            on_result (callable): 每个数据集完成时回调（参数为该数据集的结果字典）
+            **options: 传给 analyze / submit_job 的参数
+
+        Returns:
+            list: 与 paths 同序的结果字典 {"path", "ok", "result" | "error", "seconds"}
+        """
+        results = [None] * len(paths)
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="doe-client") as pool:
+            futures = {pool.submit(self._run_one, path, use_jobs, job_timeout, options): i
+                       for i, path in enumerate(paths)}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                if on_result is not None:
+                    on_result(results[futures[future]])
+        return results
+
+
+def _expand_inputs(inputs):
+    """命令行输入：文件、目录（取其中的 CSV）或通配符"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for pattern in ("*.csv", "*.csv.gz", "*.csv.zst"):
+                paths.extend(sorted(glob.glob(os.path.join(item, pattern))))
+        else:
+            paths.extend(sorted(glob.glob(item)) or [item])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Submit DOE datasets to the Mixed Model DOE API")
+    parser.add_argument("base_url", help="API base URL, e.g. http://localhost:8000")
+    parser.add_argument("inputs", nargs="+", help="CSV files, directories or glob patterns")
+    parser.add_argument("--parallel", type=int, default=4, help="datasets in flight at once (default 4)")
+    parser.add_argument("--mode", choices=("jobs", "analyze"), default="jobs",
+                        help="jobs: /jobs background tasks (default); analyze: synchronous /api/DoeAnalysis")
+    parser.add_argument("--compression", choices=("gzip", "zstd", "identity"), default="gzip")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="per-request read timeout (s)")
+    parser.add_argument("--job-timeout", type=float, default=None, help="max wait per job (s)")
+    parser.add_argument("--response-column", default="Lvalue,Avalue,Bvalue")
+    parser.add_argument("--threshold", type=float, default=None)
+    parser.add_argument("--random-effects", default=None, help='e.g. "Day,Operator,DyeLot:Batch"')
+    parser.add_argument("--mixed-solver", default=None, choices=("auto", "statsmodels", "sparse"))
+    parser.add_argument("--export-format", default=None, choices=("csv", "arrow", "parquet"))
+    args = parser.parse_args(argv)
+
+    paths = _expand_inputs(args.inputs)
+    if not paths:
+        parser.error("no input files found")
+
+    options = {
+        "response_column": args.response_column,
+        "threshold": args.threshold,
+        "random_effects": args.random_effects,
+        "mixed_solver": args.mixed_solver,
+        "export_format": args.export_format,
+    }
+
+    def report(result):
+        # 每个数据集一行 JSON（stdout），便于夜间批处理日志解析
+        print(json.dumps(result, ensure_ascii=False, default=str), flush=True)
+
+    start = time.perf_counter()
+    with DOEClient(args.base_url, max_connections=args.parallel, timeout=args.timeout,
+                   retries=args.retries, compression=args.compression) as client:
+        results = client.run_batch(paths, max_parallel=args.parallel, use_jobs=args.mode == "jobs",
+                                   job_timeout=args.job_timeout, on_result=report, **options)
+    failed = sum(not r["ok"] for r in results)
+    print(f"{'⚠️' if failed else '✅'} {len(results) - failed}/{len(results)} datasets succeeded in "
+          f"{time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""
+光谱反射率 → CIE XYZ / L*a*b*（向量化，一次矩阵乘法）
+
+🎯 作用：
+分光光度计输出 31–401 点的反射率光谱，原来需要单独的脚本逐行换算成 Lvalue / Avalue / Bvalue 再上传。
+现在分析输入可以直接包含光谱列（如 "R400"、"400nm"、"400"），由本模块换算后继续原有建模流程：
+
+- 光谱列：列名为 [前缀]波长[nm]，波长在 300–830 nm 之间；按波长排序后组成 (N, W) 反射率矩阵
+- 权重矩阵：W_k(λ) = S(λ)·cmf_k(λ)·Δλ / Σ S(λ)·ȳ(λ)·Δλ × 100（照明体 S、观察者 cmf 线性插值到光谱波长，
+  Δλ 为相邻波长间隔的梯形权重），因此 XYZ = R · W 对全部样本只是一次 (N × W)·(W × 3) 矩阵乘法
+- L*a*b*：参考白 = 理想白（反射率恒为 1）在同一照明体 / 观察者下的 XYZ，逐元素向量化计算
+- 反射率可以是 0–1 或百分数（最大值 > 1.5 时按百分数处理）
+
+内置照明体：D65（默认）、D50、A（2856 K 普朗克辐射体）、E（等能）；观察者："2"（CIE 1931 2°，默认）、
+"10"（CIE 1964 10°）。表格为 380–780 nm、10 nm 间隔的 CIE 标准数据；1 nm 间隔的光谱由表格线性插值，
+与 CIE 1 nm 表格的结果相差通常在 0.01 ΔE 量级。也可以直接传入 (波长, 值) 数组作为自定义照明体 / 观察者。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import re
+
+import numpy as np
+
+RESPONSE_COLUMNS = ("Lvalue", "Avalue", "Bvalue")
+XYZ_COLUMNS = ("CIE_X", "CIE_Y", "CIE_Z")
+WAVELENGTH_RANGE = (300.0, 830.0)
+MIN_SPECTRAL_COLUMNS = 3
+PERCENT_THRESHOLD = 1.5  # 反射率最大值超过该值时按百分数处理
+
+_SPECTRAL_COLUMN = re.compile(r"^[A-Za-z_]*?\s*(\d{3}(?:\.\d+)?)\s*(?:nm)?$", re.IGNORECASE)
+
+# 📊 CIE 标准数据：380–780 nm，10 nm 间隔
+TABLE_WAVELENGTHS = np.arange(380.0, 781.0, 10.0)
+
+_CIE1931_2 = np.array([
+    [0.001368, 0.000039, 0.006450], [0.004243, 0.000120, 0.020050], [0.014310, 0.000396, 0.067850],
+    [0.043510, 0.001210, 0.207400], [0.134380, 0.004000, 0.645600], [0.283900, 0.011600, 1.385600],
+    [0.348280, 0.023000, 1.747060], [0.336200, 0.038000, 1.772110], [0.290800, 0.060000, 1.669200],
+    [0.195360, 0.090980, 1.287640], [0.095640, 0.139020, 0.812950], [0.032010, 0.208020, 0.465180],
+    [0.004900, 0.323000, 0.272000], [0.009300, 0.503000, 0.158200], [0.063270, 0.710000, 0.078250],
+    [0.165500, 0.862000, 0.042160], [0.290400, 0.954000, 0.020300], [0.433450, 0.994950, 0.008750],
+    [0.594500, 0.995000, 0.003900], [0.762100, 0.952000, 0.002100], [0.916300, 0.870000, 0.001650],
+    [1.026300, 0.757000, 0.001100], [1.062200, 0.631000, 0.000800], [1.002600, 0.503000, 0.000340],
+    [0.854450, 0.381000, 0.000190], [0.642400, 0.265000, 0.000050], [0.447900, 0.175000, 0.000020],
+    [0.283500, 0.107000, 0.000000], [0.164900, 0.061000, 0.000000], [0.087400, 0.032000, 0.000000],
+    [0.046770, 0.017000, 0.000000], [0.022700, 0.008210, 0.000000], [0.011359, 0.004102, 0.000000],
+    [0.005790, 0.002091, 0.000000], [0.002899, 0.001047, 0.000000], [0.001440, 0.000520, 0.000000],
+    [0.000690, 0.000249, 0.000000], [0.000332, 0.000120, 0.000000], [0.000166, 0.000060, 0.000000],
+    [0.000083, 0.000030, 0.000000], [0.000042, 0.000015, 0.000000],
+])
+
+_CIE1964_10 = np.array([
+    [0.000160, 0.000017, 0.000705], [0.002362, 0.000253, 0.010482], [0.019110, 0.002004, 0.086011],
+    [0.084736, 0.008756, 0.389366], [0.204492, 0.021391, 0.972542], [0.314679, 0.038676, 1.553480],
+    [0.383734, 0.062077, 1.967280], [0.370702, 0.089456, 1.994800], [0.302273, 0.128201, 1.745370],
+    [0.195618, 0.185190, 1.317560], [0.080507, 0.253589, 0.772125], [0.016172, 0.339133, 0.415254],
+    [0.003816, 0.460777, 0.218502], [0.037465, 0.606741, 0.112044], [0.117749, 0.761757, 0.060709],
+    [0.236491, 0.875211, 0.030451], [0.376772, 0.961988, 0.013676], [0.529826, 0.991761, 0.003988],
+    [0.705224, 0.997340, 0.000000], [0.878655, 0.955552, 0.000000], [1.014160, 0.868934, 0.000000],
+    [1.118520, 0.777405, 0.000000], [1.123990, 0.658341, 0.000000], [1.030480, 0.527963, 0.000000],
+    [0.856297, 0.398057, 0.000000], [0.647467, 0.283493, 0.000000], [0.431567, 0.179828, 0.000000],
+    [0.268329, 0.107633, 0.000000], [0.152568, 0.060281, 0.000000], [0.081261, 0.031800, 0.000000],
+    [0.040851, 0.015905, 0.000000], [0.019941, 0.007749, 0.000000], [0.009577, 0.003718, 0.000000],
+    [0.004553, 0.001768, 0.000000], [0.002175, 0.000846, 0.000000], [0.001045, 0.000407, 0.000000],
+    [0.000508, 0.000199, 0.000000], [0.000251, 0.000098, 0.000000], [0.000126, 0.000050, 0.000000],
+    [0.000065, 0.000025, 0.000000], [0.000033, 0.000013, 0.000000],
+])
+
+_D65 = np.array([
+    49.9755, 54.6482, 82.7549, 91.4860, 93.4318, 86.6823, 104.865, 117.008, 117.812, 114.861, 115.923,
+    108.811, 109.354, 107.802, 104.790, 107.689, 104.405, 104.046, 100.000, 96.3342, 95.7880, 88.6856,
+    90.0062, 89.5991, 87.6987, 83.2886, 83.6992, 80.0268, 80.2146, 82.2778, 78.2842, 69.7213, 71.6091,
+    74.3490, 61.6040, 69.8856, 75.0870, 63.5927, 46.4182, 66.8054, 63.3828,
+])
+
+_D50 = np.array([
+    24.4875, 29.8713, 49.3083, 56.5129, 60.0338, 57.8182, 74.8249, 87.2466, 90.6121, 91.3680, 95.1093,
+    91.9633, 95.7237, 96.6131, 97.1292, 102.099, 100.755, 102.317, 100.000, 97.7351, 98.9183, 93.5012,
+    97.6885, 99.2692, 99.0418, 95.7223, 98.8573, 95.6666, 98.1908, 103.003, 99.1333, 87.3818, 91.6044,
+    92.9323, 76.8543, 86.5126, 92.5807, 78.2227, 57.6885, 82.9178, 78.2748,
+])
+
+
+def _planck_a(wavelengths):
+    """CIE 标准照明体 A（c2 = 1.435e7 nm·K，T = 2848 K 的普朗克辐射体，560 nm 处归一化为 100）"""
+    c2, t = 1.435e7, 2848.0
+    return 100.0 * (560.0 / wavelengths) ** 5 * np.expm1(c2 / (t * 560.0)) / np.expm1(c2 / (t * wavelengths))
+
+
+ILLUMINANTS = {
+    "D65": (TABLE_WAVELENGTHS, _D65),
+    "D50": (TABLE_WAVELENGTHS, _D50),
+    "A": (TABLE_WAVELENGTHS, _planck_a(TABLE_WAVELENGTHS)),
+    "E": (TABLE_WAVELENGTHS, np.full(len(TABLE_WAVELENGTHS), 100.0)),
+}
+
+OBSERVERS = {
+    "2": (TABLE_WAVELENGTHS, _CIE1931_2),
+    "10": (TABLE_WAVELENGTHS, _CIE1964_10),
+}
+
+
+def get_illuminant(illuminant):
+    """
+    照明体 → (波长, 相对光谱功率)；传入 (波长, 值) 数组对时原样返回
+
+    Args:
+        illuminant (str | tuple): "D65" / "D50" / "A" / "E" 或自定义 (wavelengths, spd)
+    """
+    if not isinstance(illuminant, str):
+        return illuminant
+    try:
+        return ILLUMINANTS[illuminant.upper()]
+    except KeyError:
+        raise ValueError(f"Unsupported illuminant: {illuminant}. Supported: {', '.join(ILLUMINANTS)}")
+
+
+def get_observer(observer):
+    """
+    标准观察者 → (波长, (W, 3) 色匹配函数)；传入 (波长, 值) 数组对时原样返回
+
+    Args:
+        observer (str | int | tuple): "2"（CIE 1931）/ "10"（CIE 1964）或自定义 (wavelengths, cmfs)
+    """
+    if isinstance(observer, tuple):
+        return observer
+    key = str(observer).rstrip("°").lower().replace("deg", "")
+    try:
+        return OBSERVERS[key]
+    except KeyError:
+        raise ValueError(f"Unsupported observer: {observer}. Supported: {', '.join(OBSERVERS)}")
+
+
+def spectral_columns(columns):
+    """
+    识别光谱列
+
+    Returns:
+        tuple: (按波长排序的列名 list, 波长 np.ndarray)；少于 MIN_SPECTRAL_COLUMNS 列时为空
+    """
+    found = []
+    for column in columns:
+        match = _SPECTRAL_COLUMN.match(str(column).strip())
+        if match and WAVELENGTH_RANGE[0] <= float(match.group(1)) <= WAVELENGTH_RANGE[1]:
+            found.append((float(match.group(1)), column))
+    if len(found) < MIN_SPECTRAL_COLUMNS:
+        return [], np.empty(0)
+    found.sort(key=lambda item: item[0])
+    wavelengths = np.array([w for w, _ in found])
+    if np.any(np.diff(wavelengths) <= 0):
+        raise ValueError("Duplicate wavelengths in spectral columns")
+    return [c for _, c in found], wavelengths
+
+
+def xyz_weights(wavelengths, illuminant="D65", observer="2"):
+    """
+    三刺激值权重矩阵（理想白的 Y = 100）
+
+    Args:
+        wavelengths (np.ndarray): 光谱的波长（nm，递增）
+
+    Returns:
+        np.ndarray: (W, 3)，XYZ = 反射率 (N, W) @ 权重
+    """
+    wavelengths = np.asarray(wavelengths, dtype=float)
+    ill_wl, spd = get_illuminant(illuminant)
+    obs_wl, cmfs = get_observer(observer)
+    spd = np.interp(wavelengths, ill_wl, spd, left=0.0, right=0.0)
+    cmfs = np.column_stack([np.interp(wavelengths, obs_wl, cmfs[:, k], left=0.0, right=0.0) for k in range(3)])
+    step = np.gradient(wavelengths) if len(wavelengths) > 1 else np.ones(1)
+    weights = (spd * step)[:, None] * cmfs
+    norm = weights[:, 1].sum()
+    if norm <= 0:
+        raise ValueError(f"Spectral range {wavelengths[0]:g}–{wavelengths[-1]:g} nm has no visible-light overlap")
+    return weights * (100.0 / norm)
+
+
+def xyz_to_lab(xyz, white):
+    """XYZ (N, 3) → CIE L*a*b* (N, 3)，white 为参考白的 XYZ"""
+    t = np.asarray(xyz, dtype=float) / np.asarray(white, dtype=float)
+    delta = 6.0 / 29.0
+    f = np.where(t > delta ** 3, np.cbrt(t), t / (3 * delta ** 2) + 4.0 / 29.0)
+    return np.column_stack([116.0 * f[:, 1] - 16.0, 500.0 * (f[:, 0] - f[:, 1]), 200.0 * (f[:, 1] - f[:, 2])])
+
+
+def spectra_to_lab(reflectance, wavelengths, illuminant="D65", observer="2"):
+    """
+    反射率光谱 → XYZ 与 L*a*b*
+
+    Args:
+        reflectance (np.ndarray): (N, W) 反射率（0–1 或百分数）
+        wavelengths (np.ndarray): (W,) 波长
+
+    Returns:
+        tuple: (XYZ (N, 3), Lab (N, 3))
+    """
+    reflectance = np.asarray(reflectance, dtype=float)
+    if np.nanmax(reflectance, initial=0.0) > PERCENT_THRESHOLD:
+        reflectance = reflectance / 100.0
+    weights = xyz_weights(wavelengths, illuminant, observer)
+    xyz = reflectance @ weights
+    return xyz, xyz_to_lab(xyz, weights.sum(axis=0))
+
+
+def add_lab_responses(df, illuminant="D65", observer="2"):
+    """
+    分析输入中含光谱列且缺少 Lvalue / Avalue / Bvalue 时，换算出这三列（及 CIE_X / CIE_Y / CIE_Z），
+    并去掉光谱列；否则原样返回
+
+    Args:
+        df (pd.DataFrame): load_input_data 的结果
+
+    Returns:
+        pd.DataFrame
+    """
+    if all(c in df.columns for c in RESPONSE_COLUMNS):
+        return df
+    columns, wavelengths = spectral_columns(df.columns)
+    if not columns:
+        return df
+    xyz, lab = spectra_to_lab(df[columns].to_numpy(dtype=float), wavelengths, illuminant, observer)
+    converted = df.drop(columns=columns)
+    for k, name in enumerate(XYZ_COLUMNS):
+        converted[name] = xyz[:, k]
+    for k, name in enumerate(RESPONSE_COLUMNS):
+        converted[name] = lab[:, k]
+    return converted
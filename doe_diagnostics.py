@@ -0,0 +1,106 @@
+"""
+设计诊断引擎（基于一次 SVD 分解）
+
+🎯 作用：
+对 simplified 模型的设计矩阵 X 只做一次薄 SVD：X = U·diag(s)·Vᵀ，由同一分解得到
+- 条件数：cond(X) = s_max / s_min，cond(X'X) = cond(X)²（不显式构造 X'X，避免平方放大舍入误差）
+- (X'X)⁻¹ = V·diag(1/s²)·Vᵀ
+- VIF：VIF_j = [(X'X)⁻¹]_jj · Σ(x_ij − x̄_j)²（含截距模型中与 1/(1−R_j²) 等价）
+- 杠杆值：h_i = ‖U_i‖²
+- Alias 矩阵（相对完整 RSM 模型中被剔除的项）：A = (X'X)⁻¹X'X₂ = V·diag(1/s)·UᵀX₂
+- 预测方差剖面：x₀ᵀ(X'X)⁻¹x₀ = ‖diag(1/s)·Vᵀx₀‖²（逐因子扫描，其余因子固定在中心）
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pandas as pd
+
+from doe_terms import compile_terms, model_matrix
+
+RANK_TOL = 1e-10  # 相对最大奇异值的秩判定阈值
+
+
+def design_diagnostics(X, X_full=None, predictors=None, factor_ranges=None, n_points=21):
+    """
+    由一次 SVD 计算设计诊断指标
+
+    Args:
+        X (pd.DataFrame): simplified 模型设计矩阵（patsy dmatrix，含 Intercept）
+        X_full (pd.DataFrame): 完整 RSM 模型设计矩阵，用于 alias 矩阵（可选）
+        predictors (list): 因子列名，用于预测方差剖面（可选）
+        factor_ranges (dict): 因子 → (coded 最小值, coded 最大值)，用于预测方差剖面
+        n_points (int): 每个因子剖面的取点数
+
+    Returns:
+        dict: condition_number_x / condition_number_xtx / rank / singular_values
+              以及 DataFrame：terms（VIF 等）、alias_matrix、prediction_variance
+    """
+    values = X.to_numpy(dtype=float)
+    U, s, Vt = np.linalg.svd(values, full_matrices=False)
+    rank = int(np.sum(s > s[0] * RANK_TOL))
+    # 秩亏时用伪逆（截断极小奇异值），条件数为 inf
+    s_inv = np.where(s > s[0] * RANK_TOL, 1.0 / s, 0.0)
+    condition_number_x = s[0] / s[-1] if s[-1] > 0 else np.inf
+
+    xtx_inv_diag = np.sum((Vt.T * s_inv) ** 2, axis=1)
+    centered_ss = np.sum((values - values.mean(axis=0)) ** 2, axis=0)
+    is_intercept = centered_ss == 0
+    vif = np.where(is_intercept, np.nan, xtx_inv_diag * centered_ss)
+
+    terms = pd.DataFrame({
+        "Term": X.columns,
+        "VIF": vif,
+        "Relative_Variance": xtx_inv_diag,  # Var(β_j) / σ²
+    })
+
+    result = {
+        "rank": rank,
+        "n_columns": values.shape[1],
+        "singular_values": s,
+        "condition_number_x": condition_number_x,
+        "condition_number_xtx": condition_number_x ** 2,
+        "max_leverage": float(np.max(np.sum(U ** 2, axis=1))),
+        "terms": terms,
+        "alias_matrix": None,
+        "prediction_variance": None,
+    }
+
+    if X_full is not None:
+        omitted = [c for c in X_full.columns if c not in X.columns]
+        if omitted:
+            X2 = X_full[omitted].to_numpy(dtype=float)
+            alias = (Vt.T * s_inv) @ (U.T @ X2)
+            result["alias_matrix"] = pd.DataFrame(alias, index=X.columns, columns=omitted).rename_axis("Term")
+
+    if predictors is not None and factor_ranges is not None:
+        pairs = compile_terms(list(X.columns), predictors)
+        rows = []
+        for i, p in enumerate(predictors):
+            low, high = factor_ranges[p]
+            levels = np.linspace(low, high, n_points)
+            points = np.zeros((n_points, len(predictors)))
+            points[:, i] = levels
+            # 相对预测方差 x₀ᵀ(X'X)⁻¹x₀ —— 复用同一组奇异向量
+            z = (model_matrix(points, pairs) @ Vt.T) * s_inv
+            rows.append(pd.DataFrame({
+                "Factor": p,
+                "Coded_Level": levels,
+                "Relative_Prediction_Variance": np.sum(z ** 2, axis=1),
+            }))
+        result["prediction_variance"] = pd.concat(rows, ignore_index=True)
+
+    return result
+
+
+def condition_summary(diagnostics):
+    """将标量诊断指标整理为单行表，便于导出"""
+    return pd.DataFrame([{
+        "Rank": diagnostics["rank"],
+        "Columns": diagnostics["n_columns"],
+        "Condition_Number_X": diagnostics["condition_number_x"],
+        "Condition_Number_XtX": diagnostics["condition_number_xtx"],
+        "Max_VIF": np.nanmax(diagnostics["terms"]["VIF"]) if diagnostics["n_columns"] > 1 else np.nan,
+        "Max_Leverage": diagnostics["max_leverage"],
+    }])
@@ -0,0 +1,184 @@
+"""
+DOE 分析结果导出层（可插拔）
+
+🎯 作用：
+run_mixed_model_doe 的所有输出表都经由导出器写出，目前支持：
+- "csv"     : 原有的多 CSV 文件 + model_formulas.txt（默认，保持向后兼容）
+- "arrow"   : Arrow IPC 结果包（未压缩，可 memory-map 零拷贝读取）
+- "parquet" : Parquet 结果包（列式压缩，适合归档与跨语言读取）
+
+结果包是输出目录下的 doe_results/ 子目录：每张表一个带类型列的文件，
+scaler、模型公式、方差分量等元数据同时写入 manifest.json 和每个文件的 schema metadata。
+
+自定义导出器只需实现 write_table / write_text / close 三个方法即可传入 run_mixed_model_doe。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import json
+
+BUNDLE_DIR = "doe_results"
+MANIFEST_NAME = "manifest.json"
+METADATA_KEY = b"doe.metadata"
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Arrow/Parquet export requires the 'pyarrow' package") from e
+    return pyarrow
+
+
+class CsvExporter:
+    """原有 CSV 输出格式：每张表一个 CSV 文件"""
+
+    format = "csv"
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write_table(self, name, df, index=False):
+        df.to_csv(os.path.join(self.output_dir, f"{name}.csv"), index=index)
+
+    def write_text(self, name, text):
+        with open(os.path.join(self.output_dir, name), "w") as f:
+            f.write(text)
+
+    def close(self, metadata=None):
+        pass
+
+
+class _ArrowBundleExporter:
+    """Arrow / Parquet 结果包的公共逻辑：收集表与元数据，close 时写出 manifest"""
+
+    format = None
+    extension = None
+
+    def __init__(self, output_dir):
+        self.pa = _import_pyarrow()
+        self.output_dir = output_dir
+        self.bundle_dir = os.path.join(output_dir, BUNDLE_DIR)
+        os.makedirs(self.bundle_dir, exist_ok=True)
+        self.tables = {}
+        self.texts = {}
+
+    def write_table(self, name, df, index=False):
+        if index:
+            df = df.reset_index()
+        table = self.pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"doe.table": name.encode()})
+        self.tables[name] = table
+
+    def write_text(self, name, text):
+        self.texts[name] = text
+
+    def close(self, metadata=None):
+        metadata = dict(metadata or {})
+        metadata["texts"] = self.texts
+        encoded = json.dumps(metadata, default=_json_default).encode()
+
+        files = {}
+        for name, table in self.tables.items():
+            table = table.replace_schema_metadata({**table.schema.metadata, METADATA_KEY: encoded})
+            filename = f"{name}.{self.extension}"
+            self._write(table, os.path.join(self.bundle_dir, filename))
+            files[name] = {"file": filename, "rows": table.num_rows, "columns": table.column_names}
+
+        manifest = {"format": self.format, "tables": files, "metadata": metadata}
+        with open(os.path.join(self.bundle_dir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2, default=_json_default)
+
+    def _write(self, table, path):
+        raise NotImplementedError
+
+
+class ArrowExporter(_ArrowBundleExporter):
+    """Arrow IPC 文件格式（不压缩，便于 memory-map 零拷贝读取）"""
+
+    format = "arrow"
+    extension = "arrow"
+
+    def _write(self, table, path):
+        with self.pa.OSFile(path, "wb") as sink:
+            with self.pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+class ParquetExporter(_ArrowBundleExporter):
+    """Parquet 格式（zstd 压缩）"""
+
+    format = "parquet"
+    extension = "parquet"
+
+    def _write(self, table, path):
+        self.pa.parquet.write_table(table, path, compression="zstd")
+
+
+EXPORTERS = {
+    "csv": CsvExporter,
+    "arrow": ArrowExporter,
+    "parquet": ParquetExporter,
+}
+
+
+def get_exporter(export_format, output_dir):
+    """
+    根据格式名称创建导出器；传入已构造的导出器对象时原样返回
+
+    Args:
+        export_format (str | object): "csv" / "arrow" / "parquet" 或自定义导出器
+        output_dir (str): 输出目录
+
+    Returns:
+        导出器对象（实现 write_table / write_text / close）
+    """
+    if not isinstance(export_format, str):
+        return export_format
+    try:
+        return EXPORTERS[export_format.lower()](output_dir)
+    except KeyError:
+        raise ValueError(f"Unsupported export format: {export_format}. Supported: {', '.join(EXPORTERS)}")
+
+
+def load_bundle(path, tables=None, memory_map=True):
+    """
+    读取 Arrow / Parquet 结果包
+
+    Args:
+        path (str): 输出目录或其中的 doe_results/ 目录
+        tables (list): 仅读取指定的表（默认全部）
+        memory_map (bool): 是否 memory-map 文件（Arrow IPC 可实现零拷贝、零解析）
+
+    Returns:
+        tuple: (dict 表名 → pyarrow.Table, dict 元数据)
+    """
+    pa = _import_pyarrow()
+    if os.path.basename(os.path.normpath(path)) != BUNDLE_DIR:
+        path = os.path.join(path, BUNDLE_DIR)
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+
+    result = {}
+    for name, info in manifest["tables"].items():
+        if tables is not None and name not in tables:
+            continue
+        file_path = os.path.join(path, info["file"])
+        if manifest["format"] == "arrow":
+            source = pa.memory_map(file_path, "r") if memory_map else pa.OSFile(file_path, "rb")
+            result[name] = pa.ipc.open_file(source).read_all()
+        else:
+            result[name] = pa.parquet.read_table(file_path, memory_map=memory_map)
+    return result, manifest["metadata"]
+
+
+def _json_default(value):
+    # numpy 标量 / 数组转为原生类型
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
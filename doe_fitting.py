@@ -0,0 +1,305 @@
+"""
+混合模型拟合控制器：时间预算 + OLS 热启动 + 优化器回退链 + 拟合日志
+
+🎯 作用：
+原来每个响应变量直接 model.fit(reml=True)（默认设置），ConvergenceWarning 被全局屏蔽，
+失败只打印一行，后续在 models[y] 处才以 KeyError 暴露；条件较差的数据集有时会长时间卡住。
+本模块统一负责单个响应变量的 REML 拟合：
+
+- 热启动：先做一次 OLS，用残差的组均值（矩估计）给出各随机因子方差比 σ_k²/σ² 的初值
+- 回退链：依次尝试 lbfgs → powell → nm（可配置），后一个优化器从前一个的结果继续；
+  第一个收敛的结果即被采用
+- 时间预算：每个响应变量的全部尝试（含热启动）共享一个预算（秒）。每次计算 REML 目标函数前检查，
+  超时立即中止，最坏耗时 ≈ 预算 + 一次目标函数计算 + 收尾计算
+  （MixedLM.fit 不接受 callback，因此包装模型实例的 loglike；稀疏求解器在其目标函数内检查）
+- 警告：每次拟合内按线程收集（warnings.showwarning 钩子只安装一次，捕获列表存放在 threading.local 中，
+  不像 warnings.catch_warnings 那样反复替换进程全局状态，并发拟合互不丢失、不会恢复错误的过滤器）；
+  ConvergenceWarning 写入日志的 Message，只有优化器本身失败的消息视为未收敛
+- 边界最优：方差比 σ_k²/σ² ≤ BOUNDARY_RATIO 且似然有限时视为收敛（REML 最优点在下界上是正常结果，
+  此时 statsmodels 会报告 Hessian 非正定），不再走完整个回退链与时间预算
+- 拟合日志：每次尝试记录 优化器、状态、迭代次数、目标函数计算次数、耗时、REML 对数似然；
+  全部尝试都未收敛时采用似然最高的结果并标记为 not_converged；出错 / 超时且没有可用结果时
+  抛出 MixedFitError（附带日志），不再静默
+
+statsmodels.MixedLM（单个 Config_combo 随机截距）与 doe_sparse_mixed（多个随机因子）共用同一套控制逻辑。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import time
+import warnings
+import threading
+
+import numpy as np
+import pandas as pd
+from statsmodels.formula.api import mixedlm, ols
+from statsmodels.regression.mixed_linear_model import MixedLMParams
+from statsmodels.tools.sm_exceptions import ConvergenceWarning
+
+from doe_sparse_mixed import fit_sparse_mixed, random_effect_codes
+
+OPTIMIZER_CHAIN = ("lbfgs", "powell", "nm")
+DEFAULT_TIME_BUDGET = 60.0  # 每个响应变量的拟合时间预算（秒）
+DEFAULT_MAXITER = 200
+MIN_START_RATIO = 1e-3  # 热启动方差比的下限（避免从边界出发）
+BOUNDARY_RATIO = 1e-6  # 方差比低于该值视为落在下界（边界最优）
+# 出现这些 ConvergenceWarning 时该次尝试视为未收敛（继续回退链）；其余（边界、Hessian 非正定等）只记入日志
+FAILURE_WARNINGS = ("Gradient optimization failed", "MixedLM optimization failed")
+
+# statsmodels 优化器名称 → scipy.optimize.minimize 方法名（稀疏求解器使用）
+_SCIPY_METHODS = {"lbfgs": "L-BFGS-B", "powell": "Powell", "nm": "Nelder-Mead", "bfgs": "BFGS", "cg": "CG"}
+
+
+class MixedFitError(RuntimeError):
+    """
+    混合模型拟合失败（全部优化器出错或超出时间预算）
+
+    Attributes:
+        response (str): 响应变量
+        attempts (list): 拟合日志（见 FitController.fit）
+    """
+
+    def __init__(self, response, message, attempts=()):
+        super().__init__(f"{response}: {message}")
+        self.response = response
+        self.attempts = list(attempts)
+
+
+_capture = threading.local()  # 当前线程正在收集警告的列表（None 表示不收集）
+_hook_lock = threading.Lock()
+_original_showwarning = None
+
+
+def _showwarning(message, category, filename, lineno, file=None, line=None):
+    """进程级 showwarning 钩子：当前线程在拟合中时收集警告，否则交给原来的 showwarning"""
+    records = getattr(_capture, "records", None)
+    if records is None:
+        return _original_showwarning(message, category, filename, lineno, file, line)
+    records.append((category, str(message)))
+
+
+def _install_warning_hook():
+    """安装一次钩子，并让 ConvergenceWarning 每次都发出（默认过滤器同一位置只显示一次，会丢失后续拟合的警告）"""
+    global _original_showwarning
+    with _hook_lock:
+        if warnings.showwarning is _showwarning:
+            return
+        _original_showwarning = warnings.showwarning
+        warnings.showwarning = _showwarning
+        warnings.filterwarnings("always", category=ConvergenceWarning)
+
+
+class _CollectWarnings:
+    """在当前线程内收集警告（可嵌套；其他线程的警告不受影响）"""
+
+    def __enter__(self):
+        _install_warning_hook()
+        self._previous = getattr(_capture, "records", None)
+        self.records = []
+        _capture.records = self.records
+        return self.records
+
+    def __exit__(self, *exc):
+        _capture.records = self._previous
+        return False
+
+
+class _BudgetExceeded(Exception):
+    """目标函数计算前检测到超出时间预算"""
+
+
+class _Deadline:
+    """截止时间检查：计数目标函数的计算次数，超出截止时间时中止优化"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.evaluations = 0
+
+    def check(self, *args, **kwargs):
+        self.evaluations += 1
+        if time.perf_counter() > self.deadline:
+            raise _BudgetExceeded()
+
+    def guard(self, function):
+        def guarded(*args, **kwargs):
+            self.check()
+            return function(*args, **kwargs)
+        return guarded
+
+
+def ols_start(formula, data, random_factors):
+    """
+    OLS 热启动：固定效应取 OLS 估计，各随机因子的方差比取残差组均值的矩估计
+
+    Args:
+        formula (str): 固定效应公式
+        data (pd.DataFrame): 建模数据
+        random_factors (list): 随机因子列名（"A:B" 表示嵌套）
+
+    Returns:
+        tuple: (固定效应 pd.Series, {随机因子: σ_k²/σ²})
+    """
+    fit = ols(formula, data=data).fit()
+    resid = fit.resid
+    rows = data.loc[resid.index]
+    sigma2 = max(float(fit.mse_resid), np.finfo(float).tiny)
+    ratios = {}
+    for factor in random_factors:
+        codes, _ = random_effect_codes(rows, factor)
+        counts = np.bincount(codes)
+        means = np.bincount(codes, weights=resid.to_numpy()) / counts
+        # Var(组均值) = σ_k² + σ²/n_k  →  σ_k² ≈ Var(组均值) − σ²·mean(1/n_k)
+        between = np.var(means, ddof=1) - sigma2 * np.mean(1.0 / counts) if len(counts) > 1 else 0.0
+        ratios[factor] = max(between / sigma2, MIN_START_RATIO)
+    return fit.params, ratios
+
+
+class FitController:
+    """
+    单个响应变量的 REML 拟合控制器
+
+    Args:
+        time_budget (float): 每个响应变量的时间预算（秒），None 表示不限
+        methods (tuple): 优化器回退链
+        maxiter (int): 每个优化器的最大迭代次数
+        warm_start (bool): 是否使用 OLS 热启动（False 时第一个优化器使用求解器的默认初值）
+    """
+
+    def __init__(self, time_budget=DEFAULT_TIME_BUDGET, methods=OPTIMIZER_CHAIN, maxiter=DEFAULT_MAXITER,
+                 warm_start=True):
+        unknown = [m for m in methods if m not in _SCIPY_METHODS]
+        if not methods or unknown:
+            raise ValueError(f"Unsupported optimizer: {unknown or methods}. Supported: {', '.join(_SCIPY_METHODS)}")
+        if time_budget is not None and time_budget <= 0:
+            raise ValueError(f"time_budget must be positive, got {time_budget}")
+        self.time_budget = time_budget
+        self.methods = tuple(methods)
+        self.maxiter = maxiter
+        self.warm_start = warm_start
+
+    def settings(self):
+        """影响拟合结果的设置（用于阶段缓存的键；时间预算不影响收敛后的结果，不计入）"""
+        return {"methods": list(self.methods), "maxiter": self.maxiter, "warm_start": self.warm_start}
+
+    def _fit_once(self, formula, data, random_factors, use_sparse, method, start, deadline):
+        """单个优化器的一次拟合，返回 (拟合结果, 迭代次数)"""
+        if use_sparse:
+            theta = None if start is None else [start[f] for f in random_factors]
+            fit = fit_sparse_mixed(formula, data, random_factors, start=theta, maxiter=self.maxiter,
+                                   method=_SCIPY_METHODS[method], objective_hook=deadline.check)
+            return fit, fit.n_iter
+        model = mixedlm(formula, data=data, groups=data[random_factors[0]])
+        model.loglike = deadline.guard(model.loglike)
+        start_params = None
+        if start is not None:
+            # 固定效应在 REML 中被解析消去，只需给出方差比 σ²_Config/σ² 的初值
+            start_params = MixedLMParams.from_components(
+                fe_params=np.zeros(model.k_fe), cov_re=np.array([[start[random_factors[0]]]]))
+        fit = model.fit(reml=True, method=method, start_params=start_params, maxiter=self.maxiter,
+                        full_output=True)
+        return fit, sum(h.get("iterations", 0) for h in fit.hist)
+
+    @staticmethod
+    def _variance_ratios(fit, random_factors):
+        """拟合结果 → 各随机因子的方差比 σ_k²/σ²"""
+        scale = float(fit.scale)
+        if isinstance(getattr(fit, "vcomp", None), dict):
+            variances = [fit.vcomp[f] for f in random_factors]
+        else:
+            variances = [float(fit.cov_re.iloc[0, 0])]
+        return {f: v / scale for f, v in zip(random_factors, variances)}
+
+    @classmethod
+    def _ratios(cls, fit, random_factors):
+        """拟合结果 → 下一个优化器的初值（方差比，不低于 MIN_START_RATIO）"""
+        ratios = {f: max(r, MIN_START_RATIO) for f, r in cls._variance_ratios(fit, random_factors).items()}
+        return ratios if all(np.isfinite(list(ratios.values()))) else None
+
+    def fit(self, formula, data, random_factors, use_sparse, response=None):
+        """
+        按回退链拟合，直到某个优化器收敛或预算耗尽
+
+        Args:
+            formula (str): 固定效应公式
+            data (pd.DataFrame): 建模数据
+            random_factors (list): 随机因子（第一个为 Config_combo）
+            use_sparse (bool): 是否使用稀疏 MME 求解器
+            response (str): 响应变量名（仅用于日志与错误信息）
+
+        Returns:
+            tuple: (拟合结果, 拟合日志 list[dict])；日志每行含 Response、Optimizer、Status
+                   （converged / not_converged / error / timeout / skipped）、Iterations、Evaluations、
+                   Seconds、Log_Likelihood、Selected、Message
+
+        Raises:
+            MixedFitError: 没有任何可用的拟合结果
+        """
+        response = response or formula.split("~")[0].strip()
+        start_time = time.perf_counter()
+        deadline = start_time + self.time_budget if self.time_budget is not None else np.inf
+        attempts, results = [], []
+        start, note = None, ""
+        if self.warm_start:
+            try:
+                start = ols_start(formula, data, random_factors)[1]
+            except Exception as e:
+                note = f"OLS warm start failed ({type(e).__name__}: {e}); "
+
+        for method in self.methods:
+            record = {"Response": response, "Optimizer": method, "Status": "skipped", "Iterations": 0,
+                      "Evaluations": 0, "Seconds": 0.0, "Log_Likelihood": np.nan, "Selected": False,
+                      "Message": note}
+            note = ""
+            attempts.append(record)
+            if time.perf_counter() > deadline:
+                record["Message"] += "time budget exhausted before this optimizer started"
+                continue
+            guard = _Deadline(deadline)
+            t0 = time.perf_counter()
+            iterations = 0
+            try:
+                # 警告只在本线程的本次拟合内收集：ConvergenceWarning 写入日志并参与收敛判断，其余警告丢弃
+                with _CollectWarnings() as caught:
+                    result, iterations = self._fit_once(formula, data, random_factors, use_sparse, method, start,
+                                                        guard)
+            except _BudgetExceeded:
+                record["Status"] = "timeout"
+                record["Message"] += f"exceeded the {self.time_budget:g}s time budget"
+            except Exception as e:
+                record["Status"] = "error"
+                record["Message"] += f"{type(e).__name__}: {e}"
+            else:
+                messages = list(dict.fromkeys(message for category, message in caught
+                                              if issubclass(category, ConvergenceWarning)))
+                failed = any(token in m for m in messages for token in FAILURE_WARNINGS)
+                finite = bool(np.isfinite(result.llf))
+                ratios = self._variance_ratios(result, random_factors)
+                boundary = finite and min(ratios.values()) <= BOUNDARY_RATIO
+                converged = finite and (boundary or (bool(result.converged) and not failed))
+                if boundary:
+                    messages.append("boundary optimum: " + ", ".join(
+                        f"{f} variance at lower bound" for f, r in ratios.items() if r <= BOUNDARY_RATIO))
+                record["Message"] += "; ".join(messages)
+                record.update(Status="converged" if converged else "not_converged", Log_Likelihood=float(result.llf))
+                results.append((record, result))
+                start = self._ratios(result, random_factors) or start  # 下一个优化器从当前结果继续
+            record.update(Iterations=int(iterations), Evaluations=guard.evaluations,
+                          Seconds=round(time.perf_counter() - t0, 4))
+            if record["Status"] == "converged":
+                break
+
+        usable = [(r, fit) for r, fit in results if np.isfinite(fit.llf)]
+        if not usable:
+            reasons = "; ".join(f"{a['Optimizer']}: {a['Status']} {a['Message']}".strip() for a in attempts)
+            raise MixedFitError(response, f"mixed model fit failed ({reasons})", attempts)
+        converged = [(r, fit) for r, fit in usable if r["Status"] == "converged"]
+        record, result = converged[0] if converged else max(usable, key=lambda item: item[1].llf)
+        record["Selected"] = True
+        return result, attempts
+
+
+def fit_log_frame(attempts):
+    """拟合日志 → DataFrame（导出 mixed_model_fit_log）"""
+    return pd.DataFrame(attempts, columns=["Response", "Optimizer", "Status", "Iterations", "Evaluations",
+                                           "Seconds", "Log_Likelihood", "Selected", "Message"])
@@ -0,0 +1,228 @@
+"""
+基准输出（golden CSV）等价性检查：所有拟合后端 × 参考数据集
+
+🎯 作用：
+换用更快的拟合后端（见 doe_backends）之前，确认其输出与基准 CSV 在容差内一致，并给出耗时对比，
+避免数值悄悄漂移。仓库根目录下的 uncoded_parameters.csv、fullmodel_logworth.csv、JMP_style_lof.csv
+等即为一组基准输出；每个参考数据集 = 输入 CSV + 其基准输出目录。
+
+- 每个后端在临时目录中完整运行 run_mixed_model_doe（不使用阶段缓存；每个数据集先不计时预热一次），
+  可重复多次取最短耗时
+- 逐表按主键（Factor / Response / Variable）对齐后比较：数值列按 |实际 − 基准| <= atol + rtol·|基准|，
+  其余列要求完全相同；缺失 / 多出的行同样记为不一致
+- write_golden 用参考后端（statsmodels）重新生成基准输出，仅在确认数值变化是预期的之后使用
+
+命令行：
+    python doe_golden.py DOEData.csv --golden ./golden --backends statsmodels,numpy --repeats 3
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+# 基准表 → 主键列
+GOLDEN_TABLES = {
+    "fullmodel_logworth": ["Factor"],
+    "simplified_logworth": ["Factor"],
+    "uncoded_parameters": ["Response", "Factor"],
+    "JMP_style_lof": ["Response"],
+    "diagnostics_summary": ["Response"],
+    "scaler": ["Variable"],
+}
+DEFAULT_RTOL = 1e-4
+DEFAULT_ATOL = 1e-8
+REFERENCE_BACKEND = "statsmodels"
+
+
+def _run(data_path, output_dir, backend, options):
+    from MixedModelDOE_Function_FollowOriginal_20250804 import run_mixed_model_doe
+
+    # 分析过程的控制台输出很长，检查时不打印
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_mixed_model_doe(data_path, output_dir, memo=False, backend=backend, **options)
+
+
+def compare_table(name, golden, actual, keys, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    """
+    按主键对齐后逐列比较一张表
+
+    Returns:
+        tuple: (不一致明细 list[dict], 最大绝对误差, 最大相对误差)
+    """
+    mismatches = []
+    merged = golden.merge(actual, on=keys, how="outer", suffixes=("_golden", "_actual"), indicator=True)
+    for _, row in merged[merged["_merge"] != "both"].iterrows():
+        side = "missing" if row["_merge"] == "left_only" else "unexpected"
+        mismatches.append({"Table": name, "Key": " / ".join(str(row[k]) for k in keys), "Column": f"<{side} row>",
+                           "Golden": np.nan, "Actual": np.nan, "Abs_Diff": np.nan})
+    both = merged[merged["_merge"] == "both"]
+
+    max_abs, max_rel = 0.0, 0.0
+    for column in [c for c in golden.columns if c not in keys]:
+        if column not in actual.columns:
+            mismatches.append({"Table": name, "Key": "*", "Column": f"{column} <missing column>",
+                               "Golden": np.nan, "Actual": np.nan, "Abs_Diff": np.nan})
+            continue
+        g, a = both[f"{column}_golden"], both[f"{column}_actual"]
+        if pd.api.types.is_numeric_dtype(g) and pd.api.types.is_numeric_dtype(a):
+            g, a = g.astype(float).to_numpy(), a.astype(float).to_numpy()
+            diff = np.abs(a - g)
+            same_nan = np.isnan(a) & np.isnan(g)
+            bad = ~same_nan & ~(diff <= atol + rtol * np.abs(g))
+            finite = ~same_nan & np.isfinite(diff)
+            if finite.any():
+                max_abs = max(max_abs, float(diff[finite].max()))
+                max_rel = max(max_rel, float((diff[finite] / np.maximum(np.abs(g[finite]), atol)).max()))
+        else:
+            diff = np.full(len(g), np.nan)
+            bad = (g.astype(str) != a.astype(str)).to_numpy()
+            g, a = g.to_numpy(), a.to_numpy()
+        for i in np.flatnonzero(bad):
+            mismatches.append({"Table": name, "Key": " / ".join(str(both[k].iloc[i]) for k in keys),
+                               "Column": column, "Golden": g[i], "Actual": a[i], "Abs_Diff": diff[i]})
+    return mismatches, max_abs, max_rel
+
+
+def compare_outputs(golden_dir, output_dir, tables=None, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL):
+    """
+    比较输出目录与基准目录中的全部基准表（基准目录中不存在的表跳过）
+
+    Returns:
+        tuple: (不一致明细 pd.DataFrame, 比较的表名 list, 最大绝对误差, 最大相对误差)
+    """
+    mismatches, checked, max_abs, max_rel = [], [], 0.0, 0.0
+    for name, keys in (tables or GOLDEN_TABLES).items():
+        golden_path = os.path.join(golden_dir, f"{name}.csv")
+        if not os.path.exists(golden_path):
+            continue
+        checked.append(name)
+        actual_path = os.path.join(output_dir, f"{name}.csv")
+        if not os.path.exists(actual_path):
+            mismatches.append({"Table": name, "Key": "*", "Column": "<missing table>",
+                               "Golden": np.nan, "Actual": np.nan, "Abs_Diff": np.nan})
+            continue
+        rows, table_abs, table_rel = compare_table(name, pd.read_csv(golden_path), pd.read_csv(actual_path),
+                                                   keys, rtol, atol)
+        mismatches.extend(rows)
+        max_abs, max_rel = max(max_abs, table_abs), max(max_rel, table_rel)
+    columns = ["Table", "Key", "Column", "Golden", "Actual", "Abs_Diff"]
+    return pd.DataFrame(mismatches, columns=columns), checked, max_abs, max_rel
+
+
+def run_harness(cases, backends=None, repeats=1, rtol=DEFAULT_RTOL, atol=DEFAULT_ATOL, **options):
+    """
+    在所有参考数据集上运行所有后端，与基准输出比较并对比耗时
+
+    Args:
+        cases (list): [(输入 CSV, 基准输出目录), ...]
+        backends (list): 后端名称或对象，默认 doe_backends.BACKENDS 中的全部后端
+        repeats (int): 每个后端重复运行次数（耗时取最短一次）
+        rtol, atol: 数值容差
+        **options: 传给 run_mixed_model_doe 的其他参数（如 threshold）
+
+    Returns:
+        tuple: (汇总 pd.DataFrame, 不一致明细 pd.DataFrame)
+            汇总每行一个 数据集 × 后端：Seconds、Relative_Time（相对第一个后端）、Tables、
+            Max_Abs_Diff、Max_Rel_Diff、Mismatches、Passed
+    """
+    from doe_backends import BACKENDS, get_backend
+
+    backends = [get_backend(b) for b in (backends or list(BACKENDS))]
+    summary, details = [], []
+    for data_path, golden_dir in cases:
+        # 预热一次（不计时）：首次运行含模块初始化等开销，会使第一个后端的耗时偏大
+        with tempfile.TemporaryDirectory(prefix="doe_golden_") as output_dir:
+            _run(data_path, output_dir, backends[0], options)
+        baseline = None
+        for backend in backends:
+            with tempfile.TemporaryDirectory(prefix="doe_golden_") as output_dir:
+                timings = []
+                for _ in range(max(1, repeats)):
+                    t0 = time.perf_counter()
+                    _run(data_path, output_dir, backend, options)
+                    timings.append(time.perf_counter() - t0)
+                mismatches, checked, max_abs, max_rel = compare_outputs(golden_dir, output_dir, rtol=rtol, atol=atol)
+            seconds = min(timings)
+            baseline = baseline or seconds
+            summary.append({
+                "Dataset": os.path.basename(str(data_path)),
+                "Backend": backend.name,
+                "Seconds": seconds,
+                "Relative_Time": seconds / baseline,
+                "Tables": len(checked),
+                "Max_Abs_Diff": max_abs,
+                "Max_Rel_Diff": max_rel,
+                "Mismatches": len(mismatches),
+                "Passed": bool(checked) and mismatches.empty,
+            })
+            if not mismatches.empty:
+                details.append(mismatches.assign(Dataset=summary[-1]["Dataset"], Backend=backend.name))
+    detail_df = pd.concat(details, ignore_index=True) if details else pd.DataFrame(
+        columns=["Table", "Key", "Column", "Golden", "Actual", "Abs_Diff", "Dataset", "Backend"])
+    return pd.DataFrame(summary), detail_df
+
+
+def write_golden(data_path, golden_dir, backend=REFERENCE_BACKEND, **options):
+    """
+    用参考后端重新生成基准输出（只保留 GOLDEN_TABLES 中的表）
+
+    Returns:
+        list: 写入的文件名
+    """
+    os.makedirs(golden_dir, exist_ok=True)
+    written = []
+    with tempfile.TemporaryDirectory(prefix="doe_golden_") as output_dir:
+        _run(data_path, output_dir, backend, options)
+        for name in GOLDEN_TABLES:
+            source = os.path.join(output_dir, f"{name}.csv")
+            if os.path.exists(source):
+                pd.read_csv(source).to_csv(os.path.join(golden_dir, f"{name}.csv"), index=False)
+                written.append(f"{name}.csv")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check every fitting backend against golden DOE outputs")
+    parser.add_argument("data", nargs="+", help="reference input CSV file(s)")
+    parser.add_argument("--golden", action="append",
+                        help="golden output directory for each data file (default: the data file's directory)")
+    parser.add_argument("--backends", default=None, help="comma-separated backends (default: all)")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--rtol", type=float, default=DEFAULT_RTOL)
+    parser.add_argument("--atol", type=float, default=DEFAULT_ATOL)
+    parser.add_argument("--threshold", type=float, default=1.3)
+    parser.add_argument("--update", action="store_true", help=f"regenerate the golden files with {REFERENCE_BACKEND}")
+    args = parser.parse_args(argv)
+
+    golden = args.golden or [os.path.dirname(os.path.abspath(path)) for path in args.data]
+    if len(golden) != len(args.data):
+        parser.error("give one --golden directory per data file")
+    cases = list(zip(args.data, golden))
+
+    if args.update:
+        for data_path, golden_dir in cases:
+            print(f"{data_path} → {golden_dir}: {', '.join(write_golden(data_path, golden_dir, threshold=args.threshold))}")
+        return 0
+
+    backends = [b.strip() for b in args.backends.split(",")] if args.backends else None
+    summary, details = run_harness(cases, backends, args.repeats, args.rtol, args.atol, threshold=args.threshold)
+    with pd.option_context("display.width", 160, "display.max_columns", 20):
+        print(summary.to_string(index=False))
+        if not details.empty:
+            print("\nMismatches:")
+            print(details.to_string(index=False, max_rows=50))
+    return 0 if summary["Passed"].all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
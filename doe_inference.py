@@ -0,0 +1,271 @@
+"""
+固定效应 t 检验：Satterthwaite / Kenward–Roger 分母自由度（与 JMP REML 输出对齐）
+
+🎯 作用：
+MixedLM summary 中的 P>|z| 是渐近 z 检验；在 ~30 次试验、~15 个配置的小设计上，
+它给出的 LogWorth 明显大于 JMP。本模块用拟合得到的方差分量直接计算：
+
+- Satterthwaite：df = 2·(LΦLᵀ)² / (gᵀ W g)，g_i = ∂(LΦLᵀ)/∂θ_i
+- Kenward–Roger：小样本校正的协方差 Φ_A = Φ + 2Φ[Σ W_ij (Q_ij − P_i Φ P_j)]Φ，
+  以及按 Kenward & Roger (1997) 的矩匹配得到的 df 与缩放因子 λ
+
+其中 θ = (σ², σ_1², …, σ_K²)，V = σ²I + Σ σ_k² Z_k Z_kᵀ，Φ = (XᵀV⁻¹X)⁻¹，
+W 为 θ 的 REML 期望信息矩阵之逆，P_i = XᵀV⁻¹V_iV⁻¹X，Q_ij = XᵀV⁻¹V_iV⁻¹V_jV⁻¹X。
+
+💡 所有量都由 Henderson 方程矩阵 C = WᵀW + Λ（W = [X Z]，Λ = diag(0, σ²/σ_k²)，规模 p + q）的稀疏分解
+（复用 doe_sparse_mixed 的 _factorize_mme）解析得到，不构造 n×n 的 V，也不构造 (p + q) 阶稠密矩阵：
+    ΦXᵀV⁻¹ = C⁻¹[X, :]·Wᵀ        （MME 解即 GLS 解；只需对 p 个固定效应列求解）
+    P = V⁻¹ − V⁻¹XΦXᵀV⁻¹ = σ⁻²(I − W C⁻¹ Wᵀ)
+REML 信息矩阵只依赖 C⁻¹ 随机效应块的对角元之和与各分块元素平方和（由 WᵀPW 的恒等式 S − SC⁻¹S = Λ − ΛC⁻¹Λ 化简），
+按列分块求解累加（选择性求逆），内存为 O((p + q)·块宽)。数千个随机效应水平时耗时为亚秒级。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy import stats
+
+from doe_sparse_mixed import random_effect_codes, _factorize, _factorize_mme
+
+DF_METHODS = ("kenward-roger", "satterthwaite", "asymptotic")
+BOUNDARY_RATIO = 1e-8  # σ_k²/σ² 低于该值的方差分量视为落在边界（固定为 0，不参与 df 计算）
+INVERSE_CHUNK = 256  # 选择性求逆每次求解的列数（内存 ≈ (p + q) × 块宽 × 8 字节）
+
+
+def _mme_blocks(X, random_codes, scale, variances):
+    """
+    Henderson 方程的稀疏分块量
+
+    Returns:
+        dict: S = WᵀW（稀疏）、C = S + Λ 的求解函数、D = (ZᵀZ + Λ_Z)⁻¹ 的求解函数、
+              惩罚向量 λ 以及各随机因子在 W 中的列下标
+    """
+    n, p = X.shape
+    # 水平数最多的随机因子放在最后：其 ZᵀZ + Λ 为对角阵，由 _factorize_mme 精确消去（与拟合时相同）
+    order = sorted(range(len(random_codes)), key=lambda k: int(random_codes[k].max()))
+    blocks, columns, lam, start = [], [None] * len(random_codes), np.zeros(p), p
+    for k in order:
+        q = int(random_codes[k].max()) + 1
+        blocks.append(sp.csr_matrix((np.ones(n), (np.arange(n), random_codes[k])), shape=(n, q)))
+        columns[k] = np.arange(start, start + q)
+        lam = np.concatenate([lam, np.full(q, scale / variances[k])])
+        start += q
+
+    Xs = sp.csc_matrix(X)
+    if not blocks:
+        S = (Xs.T @ Xs).tocsc()
+        return {"S": S, "solve": _factorize(S)[1], "solve_re": None, "lam": lam, "columns": columns,
+                "n": n, "p": p}
+    Z = sp.hstack(blocks, format="csc")
+    S = sp.bmat([[Xs.T @ Xs, Xs.T @ Z], [Z.T @ Xs, Z.T @ Z]], format="csc")
+    C = (S + sp.diags(lam)).tocsc()
+    last = start - blocks[-1].shape[1]
+    solve = _factorize_mme(C, last)[1]
+    # V⁻¹ = σ⁻²(I − Z·D·Zᵀ) 只涉及随机效应块
+    solve_re = _factorize_mme(C[p:, p:].tocsc(), last - p)[1]
+    return {"S": S, "solve": solve, "solve_re": solve_re, "lam": lam, "columns": columns, "n": n, "p": p}
+
+
+def _inverse_block_sums(blocks):
+    """
+    C⁻¹ 随机效应块的选择性求逆：按列分块求解，只累加信息矩阵需要的量
+
+    Returns:
+        tuple: diag_sum (K,)：tr(C⁻¹[J_a, J_a])；square_sum (K, K)：‖C⁻¹[J_a, J_b]‖²_F
+    """
+    solve, columns, p = blocks["solve"], blocks["columns"], blocks["p"]
+    size = blocks["S"].shape[0]
+    owner = np.zeros(size, dtype=int)
+    for a, J in enumerate(columns):
+        owner[J] = a
+    onehot = sp.csr_matrix((np.ones(size - p), (np.arange(size - p), owner[p:])), shape=(size - p, len(columns)))
+    diag_sum = np.zeros(len(columns))
+    square_sum = np.zeros((len(columns), len(columns)))
+    for first in range(p, size, INVERSE_CHUNK):
+        cols = np.arange(first, min(first + INVERSE_CHUNK, size))
+        rhs = np.zeros((size, len(cols)))
+        rhs[cols, np.arange(len(cols))] = 1.0
+        Y = solve(rhs)[p:]  # C⁻¹[随机效应行, cols]
+        np.add.at(diag_sum, owner[cols], Y[cols - p, np.arange(len(cols))])
+        by_row = onehot.T @ (Y ** 2)  # (K, 块宽)：各随机因子行上的平方和
+        for b in np.unique(owner[cols]):
+            square_sum[:, b] += by_row[:, owner[cols] == b].sum(axis=1)
+    return diag_sum, square_sum
+
+
+def _derivative_terms(blocks, scale):
+    """
+    Returns:
+        tuple: (Φ, [ΦP_iΦ], [[ΦQ_ijΦ]], W)，i = 0 为残差方差 σ²，其余为各随机因子
+    """
+    S, solve, solve_re, lam, columns, n, p = (blocks[k] for k in
+                                              ("S", "solve", "solve_re", "lam", "columns", "n", "p"))
+    size = S.shape[0]
+    E_p = np.zeros((size, p))
+    E_p[:p] = np.eye(p)
+    Cx = solve(E_p).T  # C⁻¹[X, :]，ΦXᵀV⁻¹ = Cx·Wᵀ
+    Phi = scale * Cx[:, :p]
+    F = E_p.T - Cx * lam  # Cx·S = Cx·(C − Λ)；ΦXᵀV⁻¹Z_k = F[:, J_k]
+
+    # V_0 = I：ΦP_0Φ = Cx·S·Cxᵀ；V_k = Z_kZ_kᵀ：ΦP_kΦ = F[:, J_k]·F[:, J_k]ᵀ
+    phi_p = [F @ Cx.T] + [F[:, J] @ F[:, J].T for J in columns]
+
+    # ΦQ_ijΦ = T_iᵀV⁻¹T_j，T_i = V_iV⁻¹XΦ = W·R_i（R_0 = Cxᵀ，R_k 只在 J_k 行上取 F[:, J_k]ᵀ）
+    # T_iᵀT_j = R_iᵀSR_j，ZᵀT_j = (SR_j)[Z 行]，V⁻¹ = σ⁻²(I − Z·D·Zᵀ)
+    R = [Cx.T]
+    for J in columns:
+        R_k = np.zeros((size, p))
+        R_k[J] = F[:, J].T
+        R.append(R_k)
+    SR = [S @ r for r in R]
+    DZ = [solve_re(sr[p:]) for sr in SR] if solve_re is not None else None
+    k = len(R)
+    phi_q = [[(R[i].T @ SR[j] - (SR[i][p:].T @ DZ[j] if DZ is not None else 0.0)) / scale for j in range(k)]
+             for i in range(k)]
+
+    # REML 期望信息：I_ij = ½ tr(P V_i P V_j)，P = σ⁻²(I − W C⁻¹ Wᵀ)。
+    # 由 S − SC⁻¹S = Λ − ΛC⁻¹Λ，全部迹化为 C⁻¹ 随机效应块的对角和 d_a 与分块平方和 F_ab：
+    #   I_00 ∝ n − (p + q) + Σ λ_aλ_b F_ab
+    #   I_0a ∝ λ_a²·d_a − λ_a²·Σ_b λ_b F_ab
+    #   I_ab ∝ δ_ab(λ_a²|J_a| − 2λ_a³·d_a) + λ_a²λ_b² F_ab
+    info = np.empty((k, k))
+    info[0, 0] = n - size
+    if columns:
+        diag_sum, square_sum = _inverse_block_sums(blocks)
+        lam_k = np.array([lam[J[0]] for J in columns])
+        sizes = np.array([len(J) for J in columns])
+        info[0, 0] += lam_k @ square_sum @ lam_k
+        info[0, 1:] = info[1:, 0] = lam_k ** 2 * (diag_sum - square_sum @ lam_k)
+        info[1:, 1:] = np.outer(lam_k ** 2, lam_k ** 2) * square_sum + np.diag(
+            lam_k ** 2 * sizes - 2 * lam_k ** 3 * diag_sum)
+    info *= 0.5 / scale ** 2
+    return Phi, phi_p, phi_q, np.linalg.pinv(info)
+
+
+def kenward_roger(Phi, phi_p, phi_q, W):
+    """
+    Kenward–Roger 校正协方差 Φ_A（方差结构对 θ 线性，二阶导数项 R_ij = 0）
+
+    Returns:
+        np.ndarray: (p, p)
+    """
+    Phi_inv = np.linalg.inv(Phi)
+    k = len(phi_p)
+    correction = np.zeros_like(Phi)
+    for i in range(k):
+        for j in range(k):
+            correction += W[i, j] * (phi_q[i][j] - phi_p[i] @ Phi_inv @ phi_p[j])
+    Phi_adj = Phi + 2 * correction
+    return (Phi_adj + Phi_adj.T) / 2
+
+
+def kenward_roger_df(L, Phi, Phi_adj, phi_p, W):
+    """
+    Kenward–Roger 检验的分母自由度与缩放因子（L 为 ℓ×p 对比矩阵）
+
+    Returns:
+        tuple: (m, λ)；F_KR = λ·F 服从 F(ℓ, m)
+    """
+    L = np.atleast_2d(L)
+    ell = L.shape[0]
+    Theta = L.T @ np.linalg.solve(L @ Phi_adj @ L.T, L)
+    M = [Theta @ pp for pp in phi_p]  # ΘΦP_iΦ
+    traces = np.array([np.trace(m) for m in M])
+    A1 = traces @ W @ traces
+    A2 = sum(W[i, j] * np.trace(M[i] @ M[j]) for i in range(len(M)) for j in range(len(M)))
+    B = (A1 + 6 * A2) / (2 * ell)
+    g = ((ell + 1) * A1 - (ell + 4) * A2) / ((ell + 2) * A2)
+    denom = 3 * ell + 2 * (1 - g)
+    c1, c2, c3 = g / denom, (ell - g) / denom, (ell + 2 - g) / denom
+    E_star = 1 / (1 - A2 / ell)
+    V_star = (2 / ell) * (1 + c1 * B) / ((1 - c2 * B) ** 2 * (1 - c3 * B))
+    rho = V_star / (2 * E_star ** 2)
+    m = 4 + (ell + 2) / (ell * rho - 1)
+    lam = m / (E_star * (m - 2))
+    return m, lam
+
+
+def satterthwaite_df(L, Phi, phi_p, W):
+    """单自由度对比 LΦLᵀ 的 Satterthwaite 自由度"""
+    L = np.atleast_2d(L)
+    var = (L @ Phi @ L.T).item()
+    grad = np.array([(L @ pp @ L.T).item() for pp in phi_p])  # ∂Φ/∂θ_i = −ΦP_iΦ（符号不影响 df）
+    return 2 * var ** 2 / (grad @ W @ grad)
+
+
+def fixed_effect_tests(X, random_codes, beta, scale, variances, method="kenward-roger"):
+    """
+    每个固定效应项的 t 检验
+
+    Args:
+        X (np.ndarray): (n, p) 固定效应设计矩阵（与拟合时相同）
+        random_codes (list): 每个随机因子的整数编码数组
+        beta (np.ndarray): 固定效应估计
+        scale (float): 残差方差 σ²
+        variances (list): 各随机因子的方差分量 σ_k²
+        method (str): "kenward-roger" / "satterthwaite" / "asymptotic"
+
+    Returns:
+        pd.DataFrame: 列 Std_Error、DF、t_Ratio、Prob_t（asymptotic 时 DF 为 inf）
+    """
+    if method not in DF_METHODS:
+        raise ValueError(f"Unsupported df method: {method}. Supported: {', '.join(DF_METHODS)}")
+    X = np.asarray(X, dtype=float)
+    beta = np.asarray(beta, dtype=float)
+    p = X.shape[1]
+
+    # 边界上的方差分量（≈ 0）固定为 0：其对应的 θ 不可估，不参与 df 计算
+    active = [(codes, var) for codes, var in zip(random_codes, variances) if var > BOUNDARY_RATIO * scale]
+    blocks = _mme_blocks(X, [c for c, _ in active], scale, [v for _, v in active])
+    Phi, phi_p, phi_q, W = _derivative_terms(blocks, scale)
+
+    if method == "kenward-roger":
+        cov = kenward_roger(Phi, phi_p, phi_q, W)
+    else:
+        cov = Phi
+    se = np.sqrt(np.diag(cov))
+    t_ratio = beta / se
+
+    df = np.full(p, np.inf)
+    if method != "asymptotic":
+        for j in range(p):
+            L = np.zeros((1, p))
+            L[0, j] = 1.0
+            if method == "kenward-roger":
+                df[j] = kenward_roger_df(L, Phi, cov, phi_p, W)[0]
+            else:
+                df[j] = satterthwaite_df(L, Phi, phi_p, W)
+    prob = 2 * stats.t.sf(np.abs(t_ratio), df)
+    return pd.DataFrame({"Std_Error": se, "DF": df, "t_Ratio": t_ratio, "Prob_t": prob})
+
+
+def mixed_fit_tests(fit, data, formula_terms, random_factors, method="kenward-roger"):
+    """
+    对 run_mixed_model_doe 中的拟合结果（MixedLM 或 SparseMixedResult）做固定效应 t 检验
+
+    Args:
+        fit: 拟合结果（需提供 fe_params、scale 与方差分量）
+        data (pd.DataFrame): 建模数据（含随机因子列）
+        formula_terms (list): 固定效应项（不含 Intercept）
+        random_factors (list): 随机因子列名，第一个为 Config_combo
+        method (str): df 方法
+
+    Returns:
+        pd.DataFrame: 以固定效应项名为索引
+    """
+    from patsy import dmatrix
+
+    X = dmatrix(" + ".join(formula_terms), data=data, return_type="dataframe")
+    X = X[list(fit.fe_params.index)]
+    rows = data.loc[X.index]
+    if isinstance(getattr(fit, "vcomp", None), dict):  # SparseMixedResult：随机因子 → 方差分量
+        variances = [fit.vcomp[f] for f in random_factors]
+    else:
+        variances = [float(fit.cov_re.iloc[0, 0])]
+    codes = [random_effect_codes(rows, f)[0] for f in random_factors]
+    table = fixed_effect_tests(X.to_numpy(), codes, fit.fe_params.to_numpy(), float(fit.scale), variances, method)
+    table.index = fit.fe_params.index
+    return table
@@ -0,0 +1,161 @@
+"""
+后台分析任务（Job）管理 + 进度事件流
+
+🎯 作用：
+- 每个任务有独立的工作目录（./outputDOE/jobs/<job_id>），在后台线程池中执行
+- run_mixed_model_doe 的进度事件通过 progress_callback 追加到任务的事件列表
+- HTTP 客户端可以通过 SSE（text/event-stream）订阅事件，分析未结束前就能看到
+  LogWorth 扫描、simplified 因子等部分结果
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import json
+import math
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+KEEPALIVE_SECONDS = 15
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def _jsonable(value):
+    """numpy 标量 / NaN 等转换为 JSON 可表示的值（NaN、Inf → null）"""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "tolist"):
+        return _jsonable(value.tolist())
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class Job:
+    """单个分析任务：状态、工作目录与进度事件"""
+
+    def __init__(self, job_id, workspace):
+        self.id = job_id
+        self.workspace = workspace
+        self.status = "queued"
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.result = None
+        self.error = None
+        self.events = []
+        self._lock = threading.Lock()
+        self._subscribers = []  # [(event loop, asyncio.Event)]
+
+    def publish(self, event, status=None):
+        """追加一个进度事件（可在任意线程调用），并唤醒所有 SSE 订阅者；status 与事件原子更新"""
+        event = _jsonable(event)
+        with self._lock:
+            if status is not None:
+                self.status = status
+            event["seq"] = len(self.events)
+            self.events.append(event)
+            subscribers = list(self._subscribers)
+        for loop, wakeup in subscribers:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "output_dir": self.workspace,
+            "events": len(self.events),
+            "result": self.result,
+            "error": self.error,
+        }
+
+    async def stream_events(self, start=0):
+        """
+        SSE 事件生成器：先补发 start 之后的历史事件，再实时推送，任务结束后关闭
+
+        Yields:
+            str: SSE 格式的文本块
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        with self._lock:
+            self._subscribers.append((loop, wakeup))
+        try:
+            index = start
+            while True:
+                wakeup.clear()
+                with self._lock:
+                    pending = self.events[index:]
+                    finished = self.status in TERMINAL_STATUSES
+                for event in pending:
+                    yield f"id: {event['seq']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+                index += len(pending)
+                if finished:
+                    return
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.remove((loop, wakeup))
+
+
+class JobManager:
+    """
+    后台任务管理器
+
+    Args:
+        root_dir (str): 任务工作目录的根目录
+        max_workers (int): 并行执行的分析任务数
+        max_jobs (int): 内存中保留的任务记录数（超出时丢弃最早结束的任务记录，工作目录保留）
+    """
+
+    def __init__(self, root_dir, max_workers=2, max_jobs=200):
+        self.root_dir = root_dir
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="doe-job")
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit(self, run):
+        """
+        提交任务
+
+        Args:
+            run (callable): run(job) → 结果摘要 dict；进度通过 job.publish 上报
+
+        Returns:
+            Job
+        """
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, os.path.join(self.root_dir, job_id))
+        os.makedirs(job.workspace, exist_ok=True)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+        self._executor.submit(self._execute, job, run)
+        return job
+
+    def _execute(self, job, run):
+        job.publish({"stage": "started"}, status="running")
+        try:
+            job.result = _jsonable(run(job))
+            job.publish({"stage": "completed", "result": job.result}, status="succeeded")
+        except Exception as e:
+            job.error = str(e)
+            job.publish({"stage": "failed", "error": job.error}, status="failed")
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in TERMINAL_STATUSES]
+        while len(self._jobs) > self.max_jobs and finished:
+            del self._jobs[finished.pop(0).id]
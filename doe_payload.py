@@ -0,0 +1,182 @@
+"""
+DOE 请求负载解码工具（压缩 + 流式）
+
+🎯 作用：
+把 API 收到的数据（JSON 中的 base64 字符串，或分块传输的原始请求体）逐块解码成 CSV 字节流，
+直接交给 pd.read_csv 读取。整个过程按块推进：
+    原始字节块 → base64 解码（可选）→ gzip / zstd 解压（可选）→ CSV 字节块 → pandas
+
+因此原始请求体、base64 文本和解码后的 CSV 不会同时完整驻留在内存中。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import io
+import zlib
+import binascii
+import itertools
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖，未安装时仅影响 zstd 负载
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SUPPORTED_COMPRESSIONS = ("identity", "gzip", "zstd")
+TEXT_CHUNK_SIZE = 1 << 20  # 每次从 base64 字符串切出的字符数（4 的倍数）
+_B64_WHITESPACE = b" \t\r\n"
+
+
+class PayloadDecodeError(ValueError):
+    """负载无法解码（base64 非法、压缩数据损坏或压缩格式不受支持）"""
+
+
+def normalize_compression(value):
+    """
+    规范化压缩格式名称
+
+    Args:
+        value (str): 如 "gzip"、"x-gzip"、"zstd"、"identity"，为空表示按魔数自动识别
+
+    Returns:
+        str | None: "identity" / "gzip" / "zstd"，None 表示自动识别
+    """
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value in ("gzip", "x-gzip", "gz"):
+        return "gzip"
+    if value in ("zstd", "zstandard", "zst"):
+        return "zstd"
+    if value in ("identity", "none"):
+        return "identity"
+    raise PayloadDecodeError(f"Unsupported compression: {value}. Supported: {', '.join(SUPPORTED_COMPRESSIONS)}")
+
+
+def iter_text_chunks(text, chunk_size=TEXT_CHUNK_SIZE):
+    """
+    将（已在内存中的）字符串按块切片并编码为字节，避免一次性生成完整副本
+
+    Args:
+        text (str): base64 文本或原始 CSV 文本
+        chunk_size (int): 每块字符数
+
+    Yields:
+        bytes: 当前块的字节
+    """
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size].encode("utf-8")
+
+
+def _iter_base64_decoded(chunks):
+    """逐块 base64 解码，未满 4 字符的尾部留到下一块"""
+    pending = b""
+    for chunk in chunks:
+        chunk = pending + chunk.translate(None, _B64_WHITESPACE)
+        usable = len(chunk) - len(chunk) % 4
+        pending = chunk[usable:]
+        if usable:
+            try:
+                yield binascii.a2b_base64(chunk[:usable])
+            except binascii.Error as e:
+                raise PayloadDecodeError(f"Invalid base64 data format: {e}") from e
+    if pending:
+        raise PayloadDecodeError("Invalid base64 data format: truncated input")
+
+
+def _new_decompressor(compression):
+    if compression == "gzip":
+        return zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    if zstandard is None:
+        raise PayloadDecodeError("zstd payloads require the 'zstandard' package")
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _iter_decompressed(chunks, compression):
+    """逐块解压；compression 为 None 时根据首块魔数自动识别（支持多成员 gzip / 多帧 zstd）"""
+    chunks = iter(chunks)
+    if compression is None:
+        # 先攒够 4 个字节用于识别魔数
+        head = b""
+        for chunk in chunks:
+            head += chunk
+            if len(head) >= len(ZSTD_MAGIC):
+                break
+        if head.startswith(GZIP_MAGIC):
+            compression = "gzip"
+        elif head.startswith(ZSTD_MAGIC):
+            compression = "zstd"
+        else:
+            compression = "identity"
+        chunks = itertools.chain([head], chunks)
+
+    if compression == "identity":
+        yield from chunks
+        return
+
+    decompressor = _new_decompressor(compression)
+    try:
+        for chunk in chunks:
+            while chunk:
+                out = decompressor.decompress(chunk)
+                if out:
+                    yield out
+                chunk = b""
+                if getattr(decompressor, "eof", False):
+                    # 当前成员/帧已结束，剩余字节属于下一个成员/帧
+                    chunk = decompressor.unused_data
+                    if chunk:
+                        decompressor = _new_decompressor(compression)
+        if not getattr(decompressor, "eof", True):
+            raise PayloadDecodeError(f"Invalid {compression} payload: truncated input")
+    except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+        raise PayloadDecodeError(f"Invalid {compression} payload: {e}") from e
+
+
+class _ChunkStream(io.RawIOBase):
+    """把字节块迭代器包装成只读文件对象，读到哪一块才解码哪一块"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._current = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # 尽量填满缓冲区：网络分块可能很小，过短的读取会让下游解析器频繁回调
+        filled = 0
+        while filled < len(buffer):
+            if not self._current:
+                try:
+                    self._current = memoryview(next(self._chunks))
+                except StopIteration:
+                    break
+                continue
+            n = min(len(buffer) - filled, len(self._current))
+            buffer[filled:filled + n] = self._current[:n]
+            self._current = self._current[n:]
+            filled += n
+        return filled
+
+
+def open_payload_stream(chunks, base64_encoded=False, compression=None, buffer_size=1 << 16):
+    """
+    构建逐块解码的 CSV 字节流
+
+    Args:
+        chunks (Iterable[bytes]): 原始数据块（请求体分块，或 iter_text_chunks 的输出）
+        base64_encoded (bool): 数据块是否为 base64 文本
+        compression (str): "gzip" / "zstd" / "identity"，为空时按魔数自动识别
+        buffer_size (int): 读缓冲大小
+
+    Returns:
+        io.BufferedReader: 可直接传给 pd.read_csv / run_mixed_model_doe 的文件对象
+    """
+    compression = normalize_compression(compression)
+    if base64_encoded:
+        chunks = _iter_base64_decoded(chunks)
+    chunks = _iter_decompressed(chunks, compression)
+    return io.BufferedReader(_ChunkStream(chunks), buffer_size=buffer_size)
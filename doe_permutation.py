@@ -0,0 +1,143 @@
+"""
+效应 LogWorth 的置换检验（Freedman–Lane，批量矩阵运算）
+
+🎯 作用：
+小样本设计中，fullmodel_logworth / simplified_logworth 的 F 检验 LogWorth 对颜色误差的非正态很敏感。
+本模块为每个 Type III 项计算置换 p 值，与参数 LogWorth 并列报告：
+
+- Freedman–Lane：对项 T，先拟合去掉 T 的简化模型，置换其残差 e_T 后加回简化模型的拟合值，
+  再计算完整模型中 T 的 F 统计量；p = (1 + #{F* ≥ F_obs}) / (B + 1)
+- 所有量都来自完整设计矩阵 X 的一次 SVD（X = U·S·Vᵀ，A = X⁺ 的行）：
+    简化模型残差   e_T = e + A_Tᵀ · C_T⁻¹ · β̂_T          （C = (XᵀX)⁺，H − H₋T = A_Tᵀ C_T⁻¹ A_T）
+    置换后 T 的估计 β*_T = A_T · e_T[π]                  （简化模型的拟合值对 β_T 无贡献）
+    置换后残差平方和 RSS* = ‖e_T[π]‖² − ‖Uᵀ e_T[π]‖²
+  因此一批 b 个置换只是 (b × n)·(n × r) 的矩阵乘法，不需要逐次调用 anova_lm
+- 置换按块（默认 1000 个一块，行数很多时按 MAX_CHUNK_ELEMENTS 减小）在线程池中并行计算（NumPy 矩阵乘法释放 GIL），
+  每块使用由 seed 派生的独立随机流，结果与线程数无关、可复现
+- Intercept 不做置换检验（置换残差不改变其原假设下的分布），置换 p 值记为 NaN
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from doe_backends import design_matrix
+
+DEFAULT_PERMUTATIONS = 10000
+CHUNK_SIZE = 1000  # 每块的置换次数
+MAX_CHUNK_ELEMENTS = 2_000_000  # 每块 b × n 临时矩阵的元素数上限（行数很多时减小块大小，约 16 MB / 矩阵）
+TIE_TOLERANCE = 1e-10  # F* 与 F_obs 在该相对误差内视为相等（恒等置换应计入）
+
+
+def permutation_tests(X, y, columns, names=None, n_permutations=DEFAULT_PERMUTATIONS, seed=0, n_jobs=None):
+    """
+    Type III 项的 Freedman–Lane 置换检验
+
+    Args:
+        X (np.ndarray): (n, p) 完整模型设计矩阵
+        y (np.ndarray): (n,) 响应
+        columns (list): 每个项在 X 中的列（slice 或下标数组）
+        names (list): 项名，"Intercept" 不做置换检验
+        n_permutations (int): 置换次数 B
+        seed (int): 随机种子
+        n_jobs (int): 线程数，默认 CPU 核数
+
+    Returns:
+        dict: F（观测 F 值）、p_value（参数 F 检验）、perm_p（置换 p 值），均为 (m,) 数组
+    """
+    n = len(y)
+    names = names or [""] * len(columns)
+    U, sv, Vt = np.linalg.svd(X, full_matrices=False)
+    keep = sv > sv.max() * max(X.shape) * np.finfo(float).eps
+    U, sv, Vt = U[:, keep], sv[keep], Vt[keep]
+    pinv = (Vt.T / sv) @ U.T
+    cov_unscaled = (Vt.T / sv ** 2) @ Vt
+    df_resid = n - len(sv)
+    beta = pinv @ y
+    e = y - U @ (U.T @ y)
+    mse = (e @ e) / df_resid
+
+    tested, F_obs, p_value = [], np.full(len(columns), np.nan), np.full(len(columns), np.nan)
+    for k, cols in enumerate(columns):
+        A = pinv[cols]
+        C_inv = np.linalg.pinv(cov_unscaled[cols, cols])
+        b = beta[cols]
+        q = len(b)
+        F_obs[k] = b @ C_inv @ b / q / mse
+        p_value[k] = stats.f.sf(F_obs[k], q, df_resid)
+        if names[k] != "Intercept":
+            tested.append((k, A, C_inv, e + A.T @ (C_inv @ b), q))
+
+    counts = np.zeros(len(columns))
+    chunk_size = max(1, min(CHUNK_SIZE, MAX_CHUNK_ELEMENTS // n))
+    chunks = [min(chunk_size, n_permutations - start) for start in range(0, n_permutations, chunk_size)]
+    streams = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    def run_chunk(size, stream):
+        perm = np.random.default_rng(stream).permuted(np.tile(np.arange(n), (size, 1)), axis=1)
+        chunk_counts = np.zeros(len(columns))
+        for k, A, C_inv, e_reduced, q in tested:
+            E = e_reduced[perm]  # (b, n) 置换后的简化模型残差
+            B = E @ A.T
+            num = np.einsum("bq,qr,br->b", B, C_inv, B) / q
+            rss = np.einsum("bn,bn->b", E, E) - np.sum((E @ U) ** 2, axis=1)
+            F = num / (np.maximum(rss, np.finfo(float).tiny) / df_resid)
+            chunk_counts[k] = np.count_nonzero(F >= F_obs[k] * (1 - TIE_TOLERANCE))
+        return chunk_counts
+
+    if chunks:
+        with ThreadPoolExecutor(max_workers=min(n_jobs or os.cpu_count() or 1, len(chunks))) as pool:
+            for chunk_counts in pool.map(run_chunk, chunks, streams):
+                counts += chunk_counts
+
+    perm_p = (1 + counts) / (n_permutations + 1)
+    perm_p[[k for k in range(len(columns)) if names[k] == "Intercept"]] = np.nan
+    return {"F": F_obs, "p_value": p_value, "perm_p": perm_p}
+
+
+def permutation_logworth(df, y, terms, n_permutations=DEFAULT_PERMUTATIONS, seed=0, n_jobs=None):
+    """
+    单个响应变量的 OLS Type III 项：参数 LogWorth 与置换 LogWorth 并列
+
+    Returns:
+        pd.DataFrame: Factor、Response、F_Ratio、p_Value、LogWorth、Perm_p、Perm_LogWorth、Permutations
+    """
+    X, yv, columns, names = design_matrix(df, y, terms)
+    result = permutation_tests(X, yv, columns, names, n_permutations, seed, n_jobs)
+    p_value = pd.Series(result["p_value"])
+    return pd.DataFrame({
+        "Factor": names,
+        "Response": y,
+        "F_Ratio": result["F"],
+        "p_Value": result["p_value"],
+        "LogWorth": -np.log10(p_value.replace(0, 1e-16)).to_numpy(),
+        "Perm_p": result["perm_p"],
+        "Perm_LogWorth": -np.log10(result["perm_p"]),
+        "Permutations": n_permutations,
+    })
+
+
+def add_permutation_columns(logworth_table, permutation_tables):
+    """
+    在合并后的 LogWorth 表中追加各响应变量的置换 p 值列（<响应>_Perm_p）与 Max_Perm_LogWorth
+
+    Args:
+        logworth_table (pd.DataFrame): combine_logworth 的结果
+        permutation_tables (list): permutation_logworth 的结果
+
+    Returns:
+        pd.DataFrame: 行顺序不变
+    """
+    responses = [table["Response"].iloc[0] for table in permutation_tables]
+    perm = pd.concat(permutation_tables).pivot(index="Factor", columns="Response", values="Perm_p")[responses]
+    perm.columns = [f"{y}_Perm_p" for y in responses]
+    merged = logworth_table.merge(perm, left_on="Factor", right_index=True, how="left")
+    merged["Max_Perm_LogWorth"] = -np.log10(merged[list(perm.columns)].min(axis=1))
+    merged.index = logworth_table.index
+    return merged
@@ -0,0 +1,268 @@
+"""
+响应曲面 / 残差图的后台并行渲染与缓存
+
+🎯 作用：
+以前要手工从 residual_data_*_from_MixedModel.csv 画残差图和等高线图。现在每次分析完成、模型登记后，
+把以下图表交给后台进程池渲染（不占用分析请求的时间）：
+
+- <响应>_residual_vs_predicted.png  ← 残差 vs 预测值
+- <响应>_normal_probability.png     ← 残差正态概率图（Blom 分位数）
+- <响应>_contours.png               ← 两两因子的预测等高线（其余因子固定在范围中点），叠加设计点
+
+渲染结果按 模型哈希（规格 + 设计数据的内容指纹）存放在 <root>/<哈希>/ 下；同一模型重复查看、
+或重新登记了内容相同的模型时都直接读取已有文件，不会重复渲染。
+
+- 使用 spawn 进程池 + matplotlib Agg 的 Figure 对象（不经过 pyplot 全局状态），与 Web 服务线程隔离
+- 先写入临时目录，全部完成后原子改名，读者不会看到渲染了一半的结果
+- 传入 arena（doe_shm.SharedArena）时，设计数据经共享段交给渲染进程（只 pickle 句柄），渲染结束后释放
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import json
+import shutil
+import threading
+import multiprocessing
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+from doe_stages import fingerprint
+from doe_shm import attach
+
+PLOT_KINDS = ("residual_vs_predicted", "normal_probability", "contours")
+MANIFEST_NAME = "manifest.json"
+CONTOUR_POINTS = 60  # 等高线网格每个方向的点数
+PLOT_DPI = 110
+
+
+def model_hash(spec, design):
+    """
+    模型哈希：模型规格与设计数据的内容指纹
+
+    Args:
+        spec (dict): doe_registry 中的模型规格
+        design (pd.DataFrame): 注册设计（因子、实测响应、拟合值）
+
+    Returns:
+        str: 前 32 位十六进制
+    """
+    return fingerprint([fingerprint(spec), fingerprint(design)])[:32]
+
+
+def _residual_plot(path, y, predicted, residual):
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 4.5))
+    ax = fig.subplots()
+    ax.scatter(predicted, residual, s=18, alpha=0.75, edgecolors="none")
+    ax.axhline(0.0, color="grey", linewidth=1)
+    ax.set_xlabel(f"{y} Predicted")
+    ax.set_ylabel(f"{y} Residual")
+    ax.set_title(f"Residual by Predicted – {y}")
+    fig.tight_layout()
+    fig.savefig(path, dpi=PLOT_DPI)
+
+
+def _normal_probability_plot(path, y, residual):
+    from matplotlib.figure import Figure
+
+    n = len(residual)
+    ordered = np.sort(residual)
+    quantiles = stats.norm.ppf((np.arange(1, n + 1) - 0.375) / (n + 0.25))
+    slope, intercept = np.std(residual, ddof=1), np.mean(residual)
+
+    fig = Figure(figsize=(6, 4.5))
+    ax = fig.subplots()
+    ax.scatter(quantiles, ordered, s=18, alpha=0.75, edgecolors="none")
+    ax.plot(quantiles, intercept + slope * quantiles, color="red", linewidth=1)
+    ax.set_xlabel("Normal Quantile")
+    ax.set_ylabel(f"{y} Residual")
+    ax.set_title(f"Normal Probability – {y}")
+    fig.tight_layout()
+    fig.savefig(path, dpi=PLOT_DPI)
+
+
+def _contour_plot(path, y, model, design):
+    from matplotlib.figure import Figure
+
+    predictors = model.predictors
+    ranges = model.spec["factor_ranges"]
+    center = np.array([np.mean(ranges[p]) for p in predictors])
+    pairs = list(combinations(range(len(predictors)), 2))
+    n_cols = min(3, len(pairs))
+    n_rows = int(np.ceil(len(pairs) / n_cols))
+    column = model.responses.index(y)
+
+    fig = Figure(figsize=(4.6 * n_cols, 3.9 * n_rows))
+    axes = np.atleast_1d(fig.subplots(n_rows, n_cols)).ravel()
+    for ax, (i, j) in zip(axes, pairs):
+        gi = np.linspace(*ranges[predictors[i]], CONTOUR_POINTS)
+        gj = np.linspace(*ranges[predictors[j]], CONTOUR_POINTS)
+        mesh_i, mesh_j = np.meshgrid(gi, gj)
+        X = np.tile(center, (mesh_i.size, 1))
+        X[:, i] = mesh_i.ravel()
+        X[:, j] = mesh_j.ravel()
+        Z = model.predict(X)[:, column].reshape(mesh_i.shape)
+        filled = ax.contourf(mesh_i, mesh_j, Z, levels=12, cmap="viridis")
+        lines = ax.contour(mesh_i, mesh_j, Z, levels=6, colors="white", linewidths=0.6)
+        ax.clabel(lines, fontsize=7, fmt="%.2f")
+        ax.scatter(design[predictors[i]], design[predictors[j]], s=8, c="black", alpha=0.5)
+        ax.set_xlabel(predictors[i])
+        ax.set_ylabel(predictors[j])
+        fig.colorbar(filled, ax=ax)
+    for ax in axes[len(pairs):]:
+        ax.set_visible(False)
+    fig.suptitle(f"{y} – prediction contours (other factors at range midpoint)")
+    fig.tight_layout()
+    fig.savefig(path, dpi=PLOT_DPI)
+
+
+def render_plots(name, version, spec, design, directory):
+    """
+    渲染一个模型的全部图表（在工作进程中执行）
+
+    Args:
+        name, version: 模型名称与版本（仅记录在 manifest 中）
+        spec (dict): 模型规格
+        design (pd.DataFrame): 注册设计
+        directory (str): 最终输出目录
+
+    Returns:
+        list: 生成的文件名
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    from doe_registry import CompiledModel
+
+    model = CompiledModel(name, version, spec)
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    files = []
+    for y in model.responses:
+        predicted = design[f"{y}_fitted"].to_numpy()
+        residual = design[y].to_numpy() - predicted
+        _residual_plot(os.path.join(tmp, f"{y}_residual_vs_predicted.png"), y, predicted, residual)
+        _normal_probability_plot(os.path.join(tmp, f"{y}_normal_probability.png"), y, residual)
+        _contour_plot(os.path.join(tmp, f"{y}_contours.png"), y, model, design)
+        files.extend(f"{y}_{kind}.png" for kind in PLOT_KINDS)
+    with open(os.path.join(tmp, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump({"model": {"name": name, "version": version}, "files": files}, f, indent=2)
+    try:
+        os.replace(tmp, directory)
+    except OSError:
+        # 其他进程已完成同一模型哈希的渲染
+        shutil.rmtree(tmp, ignore_errors=True)
+    return files
+
+
+def _render_shared(name, version, spec, handle, directory):
+    """渲染进程入口：设计数据映射自共享段"""
+    return render_plots(name, version, spec, attach(handle), directory)
+
+
+class PlotRenderer:
+    """
+    后台图表渲染器：按模型哈希去重、缓存
+
+    Args:
+        root (str): 图表缓存根目录
+        max_workers (int): 渲染进程数
+        arena (SharedArena): 设计数据的共享段所有者；为 None 时设计数据随任务 pickle
+    """
+
+    def __init__(self, root, max_workers=2, arena=None):
+        self.root = root
+        self.max_workers = max_workers
+        self.arena = arena
+        self._executor = None
+        self._pending = {}  # 模型哈希 → Future
+        self._errors = {}  # 模型哈希 → 渲染失败信息
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn：工作进程不继承 Web 服务的线程与锁
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _manifest_path(self, plot_hash):
+        return os.path.join(self.root, plot_hash, MANIFEST_NAME)
+
+    def submit(self, model, design):
+        """
+        提交渲染（已渲染或正在渲染时不重复提交），立即返回
+
+        Args:
+            model (CompiledModel): 已登记的模型
+            design (pd.DataFrame): 注册设计（doe_registry.load_design）
+
+        Returns:
+            str: 模型哈希
+        """
+        plot_hash = model_hash(model.spec, design)
+        with self._lock:
+            if plot_hash in self._pending or os.path.exists(self._manifest_path(plot_hash)):
+                return plot_hash
+            self._errors.pop(plot_hash, None)
+            directory = os.path.join(self.root, plot_hash)
+            if self.arena is not None:
+                handle = self.arena.share(design)
+                future = self._pool().submit(_render_shared, model.name, model.version, model.spec, handle, directory)
+                future.add_done_callback(lambda f: self.arena.release(handle))
+            else:
+                future = self._pool().submit(render_plots, model.name, model.version, model.spec, design, directory)
+            self._pending[plot_hash] = future
+        future.add_done_callback(lambda f: self._finish(plot_hash, f))
+        return plot_hash
+
+    def _finish(self, plot_hash, future):
+        with self._lock:
+            self._pending.pop(plot_hash, None)
+            if future.exception() is not None:
+                self._errors[plot_hash] = repr(future.exception())
+
+    def status(self, plot_hash):
+        """
+        Returns:
+            dict: {"status": "ready" | "rendering" | "failed" | "missing", "files": [...], "error": ...}
+        """
+        manifest = self._manifest_path(plot_hash)
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                return {"status": "ready", "files": json.load(f)["files"]}
+        with self._lock:
+            if plot_hash in self._pending:
+                return {"status": "rendering", "files": []}
+            if plot_hash in self._errors:
+                return {"status": "failed", "files": [], "error": self._errors[plot_hash]}
+        return {"status": "missing", "files": []}
+
+    def wait(self, plot_hash, timeout=None):
+        """等待渲染完成（供脚本 / 批处理使用；Web 请求不应调用）"""
+        with self._lock:
+            future = self._pending.get(plot_hash)
+        if future is not None:
+            future.result(timeout)
+        return self.status(plot_hash)
+
+    def file_path(self, plot_hash, name):
+        """
+        已渲染图表的文件路径
+
+        Raises:
+            KeyError: 图表不存在（含非法的哈希 / 文件名）
+        """
+        status = self.status(plot_hash) if all(c in "0123456789abcdef" for c in plot_hash) else {"files": []}
+        if name not in status["files"]:
+            raise KeyError(f"Plot not found: {plot_hash}/{name}")
+        return os.path.join(self.root, plot_hash, name)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,140 @@
+"""
+Monte Carlo 功效（power）与系数精度模拟
+
+🎯 作用：
+在投入实验之前评估一个拟定设计能否检出 simplified 模型保留的效应：
+按混合模型 Y = Fβ + Zu + e 生成成千上万组模拟响应
+（u ~ N(0, Group_Var) 为 Config_combo 随机效应，e ~ N(0, Residual_Var)），
+然后一次性拟合全部模拟数据，统计每个模型项的检出率与系数精度。
+
+批量拟合方式（不逐个调用 statsmodels）：
+- 方差比 γ = Group_Var / Residual_Var 已知时，每个配置组的协方差为 I + γ·11ᵀ，
+  其逆平方根为 I − c·11ᵀ/m（c = 1 − 1/√(1+γm)），白化只需减去组均值的 c 倍
+- 白化后的模型矩阵只做一次 QR 分解，所有模拟响应作为矩阵右端项一起求解（GLS）
+- t 检验、置信区间半宽等均按列向量化计算
+- 每批模拟只累加各项的 Σ(β̂ − β)、Σ(β̂ − β)²、ΣSE 与拒绝次数，内存只与 chunk_size 有关，与 n_sim 无关
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from doe_terms import compile_terms, model_matrix
+
+MAX_SIMULATIONS = 100_000  # 单次请求的模拟次数上限（耗时随 n_sim 线性增长）
+
+
+def load_variance_components(path):
+    """
+    读取 mixed_model_variance_summary.csv
+
+    Returns:
+        dict: 响应变量 → (Group_Var, Residual_Var)
+    """
+    df = pd.read_csv(path)
+    return {row.Response: (float(row.Group_Var), float(row.Residual_Var)) for row in df.itertuples()}
+
+
+def _config_groups(X):
+    """与 Config_combo 一致：因子取值完全相同的试验属于同一配置组"""
+    _, codes = np.unique(X, axis=0, return_inverse=True)
+    return codes.ravel()
+
+
+def simulate_power(design, terms, predictors, x_mean, x_scale, coef, group_var, residual_var,
+                   groups=None, n_sim=2000, alpha=0.05, random_state=None, chunk_size=2000):
+    """
+    模拟拟定设计的功效与系数精度
+
+    Args:
+        design (np.ndarray | pd.DataFrame): 拟定设计（原始单位，列顺序同 predictors）
+        terms (list): simplified 模型项（含 "Intercept"）
+        predictors (list): 因子列名
+        x_mean, x_scale (array): 标准化参数（scaler.csv 的 Mean / StdDev）
+        coef (array): 各项的真实 coded 系数（通常取已拟合模型的 fe_params）
+        group_var (float): 配置组随机效应方差
+        residual_var (float): 残差方差
+        groups (array): 配置组标签，默认按因子取值相同划分
+        n_sim (int): 模拟次数（2 ~ MAX_SIMULATIONS）
+        alpha (float): 显著性水平（LogWorth 阈值 1.3 ≈ alpha 0.05）
+        random_state (int): 随机种子
+        chunk_size (int): 每批模拟的列数，控制内存占用
+
+    Returns:
+        pd.DataFrame: 每个模型项的 Power、估计偏差、经验标准差、平均标准误与置信区间半宽
+
+    Raises:
+        ValueError: 模拟次数越界，或设计无法估计全部模型项
+    """
+    if not 2 <= n_sim <= MAX_SIMULATIONS:
+        raise ValueError(f"n_sim must be between 2 and {MAX_SIMULATIONS}")
+    if isinstance(design, pd.DataFrame):
+        design = design[predictors].to_numpy(dtype=float)
+    X = np.asarray(design, dtype=float)
+    coef = np.asarray(coef, dtype=float)
+    group_var = 0.0 if not np.isfinite(group_var) else max(float(group_var), 0.0)
+    residual_var = float(residual_var)
+
+    F = model_matrix((X - np.asarray(x_mean)) / np.asarray(x_scale), compile_terms(terms, predictors))
+    n, p = F.shape
+    df_resid = n - p
+    if df_resid <= 0 or np.linalg.matrix_rank(F) < p:
+        raise ValueError(f"Design cannot estimate the model: {n} runs for {p} terms")
+
+    codes = _config_groups(X) if groups is None else pd.factorize(np.asarray(groups))[0]
+    n_groups = codes.max() + 1
+    sizes = np.bincount(codes)
+    gamma = group_var / residual_var
+    shrink = (1.0 - 1.0 / np.sqrt(1.0 + gamma * sizes))[codes]  # 每行的 c_g
+    onehot = np.zeros((n, n_groups))
+    onehot[np.arange(n), codes] = 1.0
+
+    def whiten(A):
+        group_means = (onehot.T @ A) / sizes[:, None]
+        return A - shrink[:, None] * group_means[codes]
+
+    # 一次 QR 分解，所有模拟响应共用
+    Q, R = np.linalg.qr(whiten(F))
+    R_inv = np.linalg.inv(R)
+    unscaled_se = np.sqrt(np.sum(R_inv ** 2, axis=1))  # sqrt(diag((F*ᵀF*)⁻¹))
+    t_crit = stats.t.ppf(1 - alpha / 2, df_resid)
+
+    rng = np.random.default_rng(random_state)
+    mean_y = F @ coef
+    # 按批累加统计量，不保留 (p, n_sim) 的全部估计值；偏差相对真实系数累加，避免平方和相消
+    sum_dev = np.zeros(p)
+    sum_dev_sq = np.zeros(p)
+    sum_se = np.zeros(p)
+    rejections = np.zeros(p)
+    for start in range(0, n_sim, chunk_size):
+        m = min(chunk_size, n_sim - start)
+        u = rng.normal(0.0, np.sqrt(group_var), size=(n_groups, m))
+        e = rng.normal(0.0, np.sqrt(residual_var), size=(n, m))
+        Y = whiten(mean_y[:, None] + u[codes] + e)
+        QtY = Q.T @ Y
+        beta = R_inv @ QtY
+        sse = np.sum(Y ** 2, axis=0) - np.sum(QtY ** 2, axis=0)
+        sigma = np.sqrt(np.maximum(sse, 0.0) / df_resid)
+        se = unscaled_se[:, None] * sigma
+        dev = beta - coef[:, None]
+        sum_dev += dev.sum(axis=1)
+        sum_dev_sq += np.sum(dev ** 2, axis=1)
+        sum_se += se.sum(axis=1)
+        rejections += np.sum(np.abs(beta / se) > t_crit, axis=1)
+    bias = sum_dev / n_sim
+    mean_se = sum_se / n_sim
+
+    return pd.DataFrame({
+        "Term": terms,
+        "True_Coef": coef,
+        "Power": rejections / n_sim,
+        "Mean_Estimate": coef + bias,
+        "Bias": bias,
+        "Empirical_SD": np.sqrt(np.maximum(sum_dev_sq - n_sim * bias ** 2, 0.0) / (n_sim - 1)),
+        "Expected_Std_Error": unscaled_se * np.sqrt(residual_var),
+        "Mean_Std_Error": mean_se,
+        "Mean_CI_Half_Width": t_crit * mean_se,
+    })
@@ -0,0 +1,178 @@
+"""
+预测刻画器（Prediction Profiler）：各因子的预测轨迹 + 置信带
+
+🎯 作用：
+对应 JMP Profiler：给定当前设定（各因子取值），返回每个因子在其范围内变化、其余因子固定时
+各响应变量的预测轨迹与均值置信带，替代把模型导回 JMP 查看的往返。
+
+- 所有因子的轨迹点与当前设定拼成一个 (k·points + 1, k) 的配方矩阵，一次构造模型矩阵 M，
+  一次矩阵乘法得到全部响应变量的预测：Ŷ = M·B
+- 标准误使用注册表中保存的固定效应协方差（各响应变量的 Cov(β̂) 预先叠成 (r, m, m) 数组）：
+  Var(ŷ) = diag(M·Cov·Mᵀ)，对所有响应变量一次 einsum 求得
+- 每个模型的刻画器（网格、协方差）与最近的计算结果都在进程内缓存，滑块拖回之前的位置时直接命中
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import stats
+
+from doe_terms import model_matrix
+
+DEFAULT_POINTS = 41  # 每个因子轨迹的取点数
+MAX_POINTS = 1001  # 取点数上限：配方矩阵为 (k·points + 1, k)，超出时拒绝而不是分配巨大的模型矩阵
+DEFAULT_CACHE_MODELS = 32
+DEFAULT_CACHE_RESULTS = 2048
+
+
+class PredictionProfiler:
+    """
+    单个已注册模型的刻画器
+
+    Args:
+        model (CompiledModel): doe_registry 中编译好的模型
+        factor_ranges (dict): 因子 → (最小值, 最大值)，默认取注册设计的因子范围
+        points (int): 每个因子轨迹的取点数（2 ~ MAX_POINTS）
+
+    Raises:
+        ValueError: 取点数越界
+    """
+
+    def __init__(self, model, factor_ranges=None, points=DEFAULT_POINTS):
+        if not 2 <= points <= MAX_POINTS:
+            raise ValueError(f"points must be between 2 and {MAX_POINTS}")
+        self.model = model
+        self.points = points
+        self.predictors = model.predictors
+        self.responses = model.responses
+        ranges = {**model.spec["factor_ranges"], **(factor_ranges or {})}
+        self.low = np.array([ranges[p][0] for p in self.predictors], dtype=float)
+        self.high = np.array([ranges[p][1] for p in self.predictors], dtype=float)
+        # (k, points) 原始单位的轨迹网格
+        self.grid = np.linspace(self.low, self.high, points, axis=1)
+        k = len(self.predictors)
+        self._rows = np.arange(k * points)
+        self._cols = np.repeat(np.arange(k), points)
+        # (r, m, m) 各响应变量的固定效应协方差
+        self.cov = np.stack([np.asarray(model.spec["responses"][y]["cov"], dtype=float) for y in self.responses])
+
+    def default_setting(self):
+        """默认当前设定：各因子范围的中点"""
+        return dict(zip(self.predictors, map(float, (self.low + self.high) / 2)))
+
+    def traces(self, setting=None, confidence=0.95):
+        """
+        计算所有因子的预测轨迹与置信带
+
+        Args:
+            setting (dict): 当前设定（原始单位），缺省的因子取范围中点
+            confidence (float): 置信水平
+
+        Returns:
+            dict: {"setting", "current": {响应: {...}}, "traces": {因子: {"x", 响应: {...}}}}
+        """
+        if not 0 < confidence < 1:
+            raise ValueError(f"confidence must be between 0 and 1, got {confidence}")
+        current = self.default_setting()
+        unknown = [p for p in (setting or {}) if p not in current]
+        if unknown:
+            raise ValueError(f"Unknown factor in setting: {unknown}")
+        current.update({p: float(v) for p, v in (setting or {}).items()})
+        x0 = np.array([current[p] for p in self.predictors])
+
+        # 轨迹点：第 j 段为因子 j 扫过其网格、其余因子固定在当前设定；最后一行为当前设定本身
+        X = np.tile(x0, (len(self._rows) + 1, 1))
+        X[self._rows, self._cols] = self.grid.ravel()
+        M = model_matrix(self.model.code(X), self.model.pairs)
+        pred = M @ self.model.coef
+        se = np.sqrt(np.maximum(np.einsum("nm,rmp,np->nr", M, self.cov, M), 0.0))
+        half_width = stats.norm.ppf(0.5 + confidence / 2) * se
+        lower, upper = pred - half_width, pred + half_width
+
+        def band(rows, j):
+            return {"pred": pred[rows, j].tolist(), "lower": lower[rows, j].tolist(), "upper": upper[rows, j].tolist()}
+
+        traces = {}
+        for i, p in enumerate(self.predictors):
+            rows = slice(i * self.points, (i + 1) * self.points)
+            traces[p] = {"x": self.grid[i].tolist(), **{y: band(rows, j) for j, y in enumerate(self.responses)}}
+        current_values = {
+            y: {"pred": float(pred[-1, j]), "lower": float(lower[-1, j]), "upper": float(upper[-1, j]),
+                "std_error": float(se[-1, j])}
+            for j, y in enumerate(self.responses)
+        }
+        return {"setting": current, "confidence": confidence, "current": current_values, "traces": traces}
+
+
+class ProfilerCache:
+    """
+    刻画器与计算结果的进程内 LRU 缓存（按 模型名 + 版本 区分）
+
+    Args:
+        max_models (int): 缓存的刻画器个数
+        max_results (int): 缓存的计算结果个数
+    """
+
+    def __init__(self, max_models=DEFAULT_CACHE_MODELS, max_results=DEFAULT_CACHE_RESULTS):
+        self.max_models = max_models
+        self.max_results = max_results
+        self._profilers = OrderedDict()
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _put(cache, key, value, limit):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def _keys(model, setting, confidence, points, factor_ranges):
+        ranges_key = tuple(sorted((p, tuple(map(float, r))) for p, r in (factor_ranges or {}).items()))
+        profiler_key = (model.name, model.version, points, ranges_key)
+        setting_key = tuple(sorted((p, float(v)) for p, v in (setting or {}).items()))
+        return profiler_key, profiler_key + (setting_key, float(confidence))
+
+    def cached(self, model, setting=None, confidence=0.95, points=DEFAULT_POINTS, factor_ranges=None):
+        """
+        只查缓存、不计算：命中时返回结果（同 profile），未命中返回 None
+
+        供事件循环直接调用；未命中时调用方应把 profile 放到线程池中执行
+        """
+        _, result_key = self._keys(model, setting, confidence, points, factor_ranges)
+        with self._lock:
+            result = self._results.get(result_key)
+            if result is not None:
+                self._results.move_to_end(result_key)
+            return result
+
+    def profile(self, model, setting=None, confidence=0.95, points=DEFAULT_POINTS, factor_ranges=None):
+        """
+        返回（或计算并缓存）模型在当前设定下的轨迹；返回值被多次复用，调用方不得修改
+
+        Returns:
+            dict: 同 PredictionProfiler.traces
+        """
+        profiler_key, result_key = self._keys(model, setting, confidence, points, factor_ranges)
+
+        with self._lock:
+            result = self._results.get(result_key)
+            if result is not None:
+                self._results.move_to_end(result_key)
+                return result
+            profiler = self._profilers.get(profiler_key)
+            if profiler is not None:
+                self._profilers.move_to_end(profiler_key)
+
+        if profiler is None:
+            profiler = PredictionProfiler(model, factor_ranges, points)
+        result = profiler.traces(setting, confidence)
+        with self._lock:
+            self._put(self._profilers, profiler_key, profiler, self.max_models)
+            self._put(self._results, result_key, result, self.max_results)
+        return result
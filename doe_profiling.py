@@ -0,0 +1,119 @@
+"""
+按请求开启的性能剖析（cProfile + 调用栈采样）
+
+🎯 作用：
+客户数据集分析变慢时，无需把数据拉到本地复现：请求中带 profile=true，且管理员已打开
+剖析开关时，本次 run_mixed_model_doe 调用会被剖析，产物写入该请求 / 任务的工作目录：
+
+- profile.pstats     ← cProfile 原始数据（pstats / snakeviz 可直接打开）
+- profile_top.txt    ← 按累计耗时排序的前 40 个函数
+- profile.collapsed  ← 调用栈采样的折叠格式（"a;b;c 次数"），可直接导入 speedscope /
+                       flamegraph.pl 生成火焰图
+
+剖析只作用于执行分析的那个线程，不影响同时进行的其他请求。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import io
+import os
+import sys
+import cProfile
+import pstats
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+PROFILE_ARTIFACTS = ("profile.pstats", "profile_top.txt", "profile.collapsed")
+SAMPLE_INTERVAL = 0.005  # 调用栈采样间隔（秒）
+TOP_FUNCTIONS = 40
+
+
+class _StackSampler(threading.Thread):
+    """定时采样目标线程的调用栈，累计为折叠格式的计数"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name="doe-profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """
+    剖析开关 + 剖析产物登记
+
+    Args:
+        enabled (bool): 初始开关状态（管理员可在运行时切换）
+        max_profiles (int): 内存中保留的剖析记录数（超出时丢弃最早的记录，文件保留）
+    """
+
+    def __init__(self, enabled=False, max_profiles=200):
+        self.enabled = enabled
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()  # profile_id → 产物目录
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def capture(self, profile_id, directory):
+        """
+        剖析 with 块内当前线程的执行，结束后写出产物并登记
+
+        Yields:
+            list: 产物文件名（with 块结束后填充）
+        """
+        os.makedirs(directory, exist_ok=True)
+        artifacts = []
+        profiler = cProfile.Profile()
+        sampler = _StackSampler(threading.get_ident())
+        sampler.start()
+        profiler.enable()
+        try:
+            yield artifacts
+        finally:
+            profiler.disable()
+            sampler.stop()
+            profiler.dump_stats(os.path.join(directory, "profile.pstats"))
+            report = io.StringIO()
+            pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+            with open(os.path.join(directory, "profile_top.txt"), "w", encoding="utf-8") as f:
+                f.write(report.getvalue())
+            with open(os.path.join(directory, "profile.collapsed"), "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in sampler.counts.most_common())
+            artifacts.extend(PROFILE_ARTIFACTS)
+            with self._lock:
+                self._profiles[profile_id] = directory
+                while len(self._profiles) > self.max_profiles:
+                    self._profiles.popitem(last=False)
+
+    def artifact_path(self, profile_id, name):
+        """
+        已登记剖析产物的文件路径
+
+        Raises:
+            KeyError: 剖析记录或产物不存在
+        """
+        if name not in PROFILE_ARTIFACTS:
+            raise KeyError(f"Unknown profile artifact: {name}")
+        with self._lock:
+            directory = self._profiles.get(profile_id)
+        if directory is None:
+            raise KeyError(f"Profile not found: {profile_id}")
+        return os.path.join(directory, name)
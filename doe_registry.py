@@ -0,0 +1,240 @@
+"""
+本地模型注册表（SQLite）+ 低延迟预测
+
+🎯 作用：
+每次 DOE 分析完成后，把拟合好的固定效应模型（coded β、fixed intercept、scaler、协方差等）
+按 名称 + 版本号 存入本地 SQLite 文件；预测时直接加载并编译成 NumPy 求值器，
+无需重新读取 coded_parameters.csv / fixed_intercepts.csv / scaler.csv，也无需重跑 DOE 拟合。
+
+- 模型规格（JSON）与设计数据（npz BLOB）分列存储，预测只读取规格
+- 进程内 LRU 缓存热点模型，命中时预测仅为一次标准化 + 一次矩阵乘法
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import io
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from doe_terms import compile_terms, model_matrix
+
+DEFAULT_CACHE_SIZE = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS models (
+    name       TEXT    NOT NULL,
+    version    INTEGER NOT NULL,
+    created_at TEXT    NOT NULL,
+    spec       TEXT    NOT NULL,
+    design     BLOB,
+    PRIMARY KEY (name, version)
+)
+"""
+
+
+def build_model_spec(results):
+    """
+    从 run_mixed_model_doe 的返回结果构建可序列化的模型规格
+
+    Args:
+        results (dict): run_mixed_model_doe 的返回值
+
+    Returns:
+        tuple: (spec dict, design DataFrame)
+    """
+    predictors = results["predictors"]
+    models = results["models"]
+    responses = [y for y in results["response_vars"] if y in models]
+    if not responses:
+        raise ValueError("No fitted mixed models to register")
+
+    # 所有响应变量共用同一组 simplified 项
+    terms = list(models[responses[0]].fe_params.index)
+    var_by_response = {r["Response"]: r for r in results["variance_components"]}
+    design = results["design"]
+
+    spec = {
+        "predictors": predictors,
+        "x_mean": list(map(float, results["scaler"].mean_)),
+        "x_scale": list(map(float, results["scaler"].scale_)),
+        "terms": terms,
+        "factor_ranges": {p: [float(design[p].min()), float(design[p].max())] for p in predictors},
+        "responses": {},
+    }
+    for y in responses:
+        fit = models[y]
+        fe = fit.fe_params.reindex(terms)
+        cov = fit.cov_params().loc[terms, terms]
+        spec["responses"][y] = {
+            "coef": fe.tolist(),
+            "cov": cov.values.tolist(),
+            "group_var": float(var_by_response.get(y, {}).get("Group_Var", np.nan)),
+            "residual_var": float(fit.scale),
+            "formula": results["formulas"][y],
+        }
+
+    design_df = design[predictors + responses].copy()
+    for y in responses:
+        design_df[f"{y}_fitted"] = np.asarray(models[y].fittedvalues)
+    return spec, design_df
+
+
+class CompiledModel:
+    """编译后的预测器：标准化 → 模型矩阵 → 与系数矩阵相乘"""
+
+    def __init__(self, name, version, spec):
+        self.name = name
+        self.version = version
+        self.spec = spec
+        self.predictors = spec["predictors"]
+        self.responses = list(spec["responses"])
+        self.terms = spec["terms"]
+        self.x_mean = np.asarray(spec["x_mean"])
+        self.x_scale = np.asarray(spec["x_scale"])
+        self.pairs = compile_terms(self.terms, self.predictors)
+        # (m, r) 系数矩阵：一次矩阵乘法得到全部响应变量的预测
+        self.coef = np.column_stack([spec["responses"][y]["coef"] for y in self.responses])
+
+    def code(self, X):
+        """原始单位 → coded 单位"""
+        return (np.asarray(X, dtype=float) - self.x_mean) / self.x_scale
+
+    def predict(self, X):
+        """
+        Args:
+            X (np.ndarray): (n, k) 原始单位的配方，列顺序同 self.predictors
+
+        Returns:
+            np.ndarray: (n, r) 预测值，列顺序同 self.responses
+        """
+        return model_matrix(self.code(np.atleast_2d(X)), self.pairs) @ self.coef
+
+    def predict_records(self, recipes):
+        """按字典列表预测，返回字典列表"""
+        X = np.array([[recipe[p] for p in self.predictors] for recipe in recipes], dtype=float)
+        Y = self.predict(X)
+        return [dict(zip(self.responses, map(float, row))) for row in Y]
+
+
+class ModelRegistry:
+    """
+    SQLite 模型注册表，带进程内 LRU 缓存
+
+    Args:
+        path (str): SQLite 文件路径
+        cache_size (int): LRU 缓存的模型个数
+    """
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def register(self, name, results):
+        """
+        注册一次分析结果，版本号在同名模型内自增
+
+        Returns:
+            int: 新版本号
+        """
+        spec, design_df = build_model_spec(results)
+        return self.register_spec(name, spec, design_df)
+
+    def register_spec(self, name, spec, design_df):
+        """
+        注册已构建好的模型规格（分析在工作进程中执行时，只有规格与设计表回到 API 进程）
+
+        Returns:
+            int: 新版本号
+        """
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            columns=np.array(list(design_df.columns), dtype=str),
+            values=design_df.to_numpy(dtype=float),
+        )
+        with self._connect() as conn:
+            # 版本号在同一条 INSERT 语句内分配：并发登记同名模型时不会抢到相同的版本号
+            cursor = conn.execute(
+                "INSERT INTO models (name, version, created_at, spec, design) "
+                "SELECT ?, COALESCE(MAX(version), 0) + 1, ?, ?, ? FROM models WHERE name = ?",
+                (name, datetime.now(timezone.utc).isoformat(), json.dumps(spec), buffer.getvalue(), name),
+            )
+            version = conn.execute("SELECT version FROM models WHERE rowid = ?", (cursor.lastrowid,)).fetchone()[0]
+        return version
+
+    def resolve_version(self, name, version=None):
+        if version is not None:
+            return int(version)
+        row = self._connect().execute("SELECT MAX(version) FROM models WHERE name = ?", (name,)).fetchone()
+        if row[0] is None:
+            raise KeyError(f"Model not found: {name}")
+        return row[0]
+
+    def get(self, name, version=None):
+        """
+        获取编译后的模型（优先命中 LRU 缓存）
+
+        Args:
+            name (str): 模型名称
+            version (int): 版本号，默认最新版本
+
+        Returns:
+            CompiledModel
+        """
+        version = self.resolve_version(name, version)
+        key = (name, version)
+        with self._lock:
+            model = self._cache.get(key)
+            if model is not None:
+                self._cache.move_to_end(key)
+                return model
+
+        row = self._connect().execute(
+            "SELECT spec FROM models WHERE name = ? AND version = ?", key
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"Model not found: {name} v{version}")
+        model = CompiledModel(name, version, json.loads(row[0]))
+
+        with self._lock:
+            self._cache[key] = model
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return model
+
+    def load_design(self, name, version=None):
+        """读取模型对应的设计数据（因子、实测响应与拟合值）"""
+        version = self.resolve_version(name, version)
+        row = self._connect().execute(
+            "SELECT design FROM models WHERE name = ? AND version = ?", (name, version)
+        ).fetchone()
+        if row is None or row[0] is None:
+            raise KeyError(f"Model not found: {name} v{version}")
+        with np.load(io.BytesIO(row[0]), allow_pickle=False) as data:
+            return pd.DataFrame(data["values"], columns=list(data["columns"]))
+
+    def list_models(self):
+        rows = self._connect().execute(
+            "SELECT name, version, created_at FROM models ORDER BY name, version"
+        ).fetchall()
+        return [{"name": n, "version": v, "created_at": c} for n, v, c in rows]
@@ -0,0 +1,260 @@
+"""
+任务结果下载：单个结果表 / zip 打包，强 ETag、条件请求、压缩与断点续传
+
+🎯 作用：
+分析响应里只有 os.listdir 得到的文件名，客户端只能去扫共享目录或重跑分析。
+本模块为每个任务的工作目录提供可直接下载的"表示"（representation）：
+
+- 强 ETag 取文件内容的 SHA-256（按 路径 + 大小 + mtime 缓存，不重复计算）；
+  仪表盘轮询时带 If-None-Match，内容未变直接 304，不传输正文
+- 按 Accept-Encoding 协商 zstd（已安装 zstandard 时）/ gzip；压缩结果按内容哈希缓存在 <工作目录>/.results/ 下，
+  每种编码只压缩一次，且压缩后的表示同样可以按字节范围下载；不同编码的 ETag 不同（"<哈希>.gzip"）；
+  写入新的缓存项时删除哈希已不对应任何当前文件（或当前 zip 打包）的旧缓存项，缓存目录不会随结果更新无限增长
+- 字节范围（Range / If-Range）由 Starlette 的 FileResponse 处理，大表（design_data、residual_data_*）可断点续传
+- zip 打包：成员按名称排序、时间戳固定，相同内容得到逐字节相同的 zip，因此同样可以使用强 ETag 与字节范围
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import gzip
+import uuid
+import shutil
+import hashlib
+import zipfile
+import mimetypes
+import threading
+from collections import OrderedDict
+
+try:
+    import zstandard
+except ImportError:  # zstd 为可选依赖，未安装时只提供 gzip
+    zstandard = None
+
+CACHE_DIR = ".results"  # 工作目录下的压缩 / 打包缓存（以 . 开头，不出现在结果列表中）
+EXCLUDED_DIRS = ("profile", "profiles")  # 剖析产物另有下载接口
+INCOMPRESSIBLE_SUFFIXES = (".zip", ".gz", ".zst", ".parquet", ".png", ".jpg", ".jpeg")
+MIN_COMPRESS_BYTES = 1024  # 更小的文件压缩收益可以忽略
+HASH_CHUNK = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BUNDLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # zip 成员的固定时间戳（保证相同内容逐字节相同）
+BUNDLE_NAME = "results.zip"
+
+mimetypes.add_type("text/csv", ".csv")
+mimetypes.add_type("application/vnd.apache.arrow.file", ".arrow")
+mimetypes.add_type("application/vnd.apache.parquet", ".parquet")
+
+
+def available_encodings():
+    """服务端支持的内容编码（按偏好排序）"""
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding, encodings=None):
+    """
+    按 Accept-Encoding（含 q 值）选择内容编码
+
+    Args:
+        accept_encoding (str): 请求头，如 "gzip, zstd;q=0.9"
+        encodings (tuple): 可用编码（服务端偏好顺序），默认 available_encodings()
+
+    Returns:
+        str | None: 选中的编码，None 表示原样（identity）
+    """
+    encodings = encodings or available_encodings()
+    weights = {}
+    for item in (accept_encoding or "").split(","):
+        parts = [p.strip() for p in item.split(";")]
+        if not parts[0]:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        weights[parts[0].lower()] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match 的弱比较（忽略 W/ 前缀，支持列表与 *）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    strip = lambda tag: tag.strip().removeprefix("W/")
+    return strip(etag) in {strip(tag) for tag in if_none_match.split(",")}
+
+
+def _compress(source, target, encoding):
+    """流式压缩到临时文件后原子改名（并发请求重复压缩时结果相同，后写者覆盖）"""
+    tmp = f"{target}.tmp-{uuid.uuid4().hex[:8]}"
+    with open(source, "rb") as src, open(tmp, "wb") as dst:
+        if encoding == "zstd":
+            zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst)
+        else:
+            # mtime=0、filename=""（否则头部写入随机的临时文件名）：相同内容得到相同的 gzip 字节
+            with gzip.GzipFile(filename="", fileobj=dst, mode="wb", compresslevel=GZIP_LEVEL, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, HASH_CHUNK)
+    os.replace(tmp, target)
+
+
+class ResultStore:
+    """
+    任务工作目录中结果文件的下载表示（内容哈希缓存 + 压缩 / 打包缓存）
+
+    Args:
+        max_hashes (int): 内存中缓存的文件哈希个数
+    """
+
+    def __init__(self, max_hashes=4096):
+        self.max_hashes = max_hashes
+        self._hashes = OrderedDict()  # (路径, 大小, mtime_ns) → SHA-256
+        self._lock = threading.Lock()
+
+    def content_hash(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._hashes.get(key)
+            if digest is not None:
+                self._hashes.move_to_end(key)
+                return digest
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._hashes[key] = digest
+            while len(self._hashes) > self.max_hashes:
+                self._hashes.popitem(last=False)
+        return digest
+
+    def list_files(self, workspace):
+        """
+        工作目录中的结果文件（递归，含 doe_results/ 等子目录；跳过缓存与剖析目录）
+
+        Returns:
+            list: [{"name": 相对路径（/ 分隔）, "size", "etag"}]，按名称排序
+        """
+        files = []
+        for root, dirs, names in os.walk(workspace):
+            top = os.path.relpath(root, workspace) == "."
+            dirs[:] = sorted(d for d in dirs if not d.startswith(".") and not (top and d in EXCLUDED_DIRS))
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                files.append({
+                    "name": os.path.relpath(path, workspace).replace(os.sep, "/"),
+                    "size": os.path.getsize(path),
+                    "etag": f'"{self.content_hash(path)}"',
+                })
+        return sorted(files, key=lambda f: f["name"])
+
+    def listing_etag(self, files):
+        """结果列表的 ETag：全部 名称 + 内容哈希 的摘要（任何文件变化都会改变）"""
+        sha = hashlib.sha256("\n".join(f"{f['name']}:{f['etag']}" for f in files).encode())
+        return f'"{sha.hexdigest()}"'
+
+    def resolve(self, workspace, name):
+        """
+        结果文件名 → 绝对路径
+
+        Raises:
+            KeyError: 文件不存在，或名称越出工作目录 / 指向缓存与剖析目录
+        """
+        parts = name.replace("\\", "/").split("/")
+        if any(p in ("", ".", "..") or p.startswith(".") for p in parts) or parts[0] in EXCLUDED_DIRS:
+            raise KeyError(f"Result not found: {name}")
+        root = os.path.realpath(workspace)
+        path = os.path.realpath(os.path.join(root, *parts))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            raise KeyError(f"Result not found: {name}")
+        return path
+
+    def prune(self, workspace, files=None):
+        """
+        删除缓存目录中不再对应任何当前结果文件 / 当前打包的缓存项（写入中的临时文件保留）
+
+        Returns:
+            int: 删除的缓存项数
+        """
+        cache = os.path.join(workspace, CACHE_DIR)
+        if not os.path.isdir(cache):
+            return 0
+        files = self.list_files(workspace) if files is None else files
+        keep = {f["etag"].strip('"') for f in files} | {self.listing_etag(files).strip('"')}
+        removed = 0
+        for name in os.listdir(cache):
+            if ".tmp-" in name or name.split(".")[0] in keep:
+                continue
+            try:
+                os.remove(os.path.join(cache, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def representation(self, workspace, name, accept_encoding=""):
+        """
+        选择一个结果文件的下载表示（必要时生成压缩缓存）
+
+        Returns:
+            dict: {"path", "etag", "encoding", "media_type", "filename"}
+        """
+        path = self.resolve(workspace, name)
+        digest = self.content_hash(path)
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        representation = {"path": path, "etag": f'"{digest}"', "encoding": None, "media_type": media_type,
+                          "filename": os.path.basename(path)}
+        if os.path.getsize(path) < MIN_COMPRESS_BYTES or path.lower().endswith(INCOMPRESSIBLE_SUFFIXES):
+            return representation
+        encoding = negotiate_encoding(accept_encoding)
+        if encoding is None:
+            return representation
+        cache = os.path.join(workspace, CACHE_DIR)
+        os.makedirs(cache, exist_ok=True)
+        target = os.path.join(cache, f"{digest}.{encoding}")
+        if not os.path.exists(target):
+            _compress(path, target, encoding)
+            self.prune(workspace)
+        return {**representation, "path": target, "etag": f'"{digest}.{encoding}"', "encoding": encoding}
+
+    def bundle(self, workspace):
+        """
+        全部结果文件的 zip 包（按内容缓存，相同内容不重复打包）
+
+        Returns:
+            dict: {"path", "etag", "encoding": None, "media_type", "filename"}
+        """
+        files = self.list_files(workspace)
+        if not files:
+            raise KeyError("No result files")
+        digest = self.listing_etag(files).strip('"')
+        cache = os.path.join(workspace, CACHE_DIR)
+        os.makedirs(cache, exist_ok=True)
+        target = os.path.join(cache, f"{digest}.zip")
+        if not os.path.exists(target):
+            tmp = f"{target}.tmp-{uuid.uuid4().hex[:8]}"
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                for f in files:
+                    info = zipfile.ZipInfo(f["name"], date_time=BUNDLE_DATE_TIME)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    with open(os.path.join(workspace, *f["name"].split("/")), "rb") as src, \
+                            archive.open(info, "w", force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, HASH_CHUNK)
+            os.replace(tmp, target)
+            self.prune(workspace, files)
+        return {"path": target, "etag": f'"{digest}.zip"', "encoding": None, "media_type": "application/zip",
+                "filename": BUNDLE_NAME}
@@ -0,0 +1,234 @@
+"""
+共享内存交接：API 进程 ↔ 分析工作进程之间传递数据表
+
+🎯 作用：
+分析移到工作进程后，如果把解析好的 DataFrame / 结果表 pickle 后经管道传递，
+大数据集在发送端、管道缓冲与接收端各有一份，内存翻倍且序列化本身就要数秒。
+本模块把数据表按列写入内存映射文件（优先放在 /dev/shm 的 tmpfs 上），
+进程之间只传递几百字节的句柄（handle），接收端直接 np.load(mmap_mode=...) 映射同一批物理页，零拷贝。
+
+- 每列一个 .npy 文件：数值 / 布尔列原样写入；字符串等对象列转成 Categorical 编码（int32）+ 类别列表（放在句柄中）
+- attach 默认以 copy-on-write（mmap_mode="c"）映射：读取共享物理页，引擎若原地修改只影响本进程的私有页
+- 生命周期显式管理：SharedArena 拥有自己目录下的全部段（segment），release 立即删除文件；
+  Linux 上已映射的页在删除后仍然有效，最后一个引用释放时内核回收，因此"映射后立即 release"是安全的；
+  Windows 上删除被映射的文件会失败，失败的段延后到下一次 release / close 时重试
+- 进程退出（atexit）时删除整个目录；启动时清理已退出进程遗留的目录（进程崩溃的情况）
+- /dev/shm 剩余空间不足（如 Docker 默认的 64MB）时自动改用临时目录下的普通文件：
+  仍经由页缓存共享，只是可能落盘；用 np.save（write 系统调用）而不是预分配的 memmap 写入，
+  空间不足时得到 OSError 而不是 SIGBUS
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import uuid
+import atexit
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+SEGMENT_PREFIX = "doe-shm-"
+SHM_ROOT = "/dev/shm"
+SHM_HEADROOM = 2.0  # /dev/shm 剩余空间至少为数据量的这么多倍才使用（给其他进程留余量）
+
+
+def _default_roots():
+    """候选根目录：DOE_SHM_DIR（若设置）→ /dev/shm → 系统临时目录"""
+    roots = [os.environ.get("DOE_SHM_DIR")]
+    if os.path.isdir(SHM_ROOT) and os.access(SHM_ROOT, os.W_OK):
+        roots.append(SHM_ROOT)
+    roots.append(tempfile.gettempdir())
+    return [r for r in roots if r]
+
+
+def _free_bytes(path):
+    try:
+        stat = os.statvfs(path)
+    except (AttributeError, OSError):
+        return float("inf")  # Windows 无 statvfs：不做预检查，写入失败时再回退
+    return stat.f_bavail * stat.f_frsize
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def sweep_stale(root):
+    """
+    删除已退出进程遗留的段目录（目录名为 doe-shm-<pid>-<随机串>）
+
+    Returns:
+        int: 删除的目录数
+    """
+    removed = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        pid = name[len(SEGMENT_PREFIX):].split("-")[0]
+        if pid.isdigit() and int(pid) != os.getpid() and not _pid_alive(int(pid)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def frame_nbytes(df):
+    """写入共享段所需的字节数（对象列按 int32 编码估计）"""
+    return int(sum(df[c].dtype.itemsize if df[c].dtype.kind in "biufc" else 4 for c in df.columns) * len(df))
+
+
+def write_frame(df, path):
+    """
+    把数据表按列写入 path 目录（写入方可以是任意进程）
+
+    Args:
+        df (pd.DataFrame): 数据表（行索引不保留）
+        path (str): 段目录（不存在时创建）
+
+    Returns:
+        dict: 句柄 {"path", "rows", "columns": [{"name", "file", "categories", "dtype"}], "nbytes"}，可廉价 pickle
+    """
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    nbytes = 0
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        categories, dtype = None, None
+        if series.dtype.kind in "biufc":
+            values = np.ascontiguousarray(series.to_numpy())
+        else:
+            # 字符串 / 对象 / 分类列：编码为 int32，类别（去重后通常很少）放在句柄中
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            values = codes.astype(np.int32, copy=False)
+            categories = [v.item() if hasattr(v, "item") else v for v in uniques]
+            dtype = str(series.dtype)
+        filename = f"c{i}.npy"
+        np.save(os.path.join(path, filename), values, allow_pickle=False)
+        nbytes += values.nbytes
+        columns.append({"name": name, "file": filename, "categories": categories, "dtype": dtype})
+    return {"path": path, "rows": int(len(df)), "columns": columns, "nbytes": int(nbytes)}
+
+
+def attach(handle, mode="c"):
+    """
+    映射共享段为 DataFrame（数值列零拷贝）
+
+    Args:
+        handle (dict): write_frame / SharedArena.share 返回的句柄
+        mode (str): np.load 的 mmap_mode："c"（copy-on-write，默认）或 "r"（只读）
+
+    Returns:
+        pd.DataFrame
+    """
+    data = {}
+    for column in handle["columns"]:
+        values = np.load(os.path.join(handle["path"], column["file"]), mmap_mode=mode, allow_pickle=False)
+        if column["categories"] is not None:
+            # 对象列按编码还原（缺失值编码为 -1），恢复原 dtype（如 pandas 的 str）
+            codes = np.asarray(values)
+            values = np.array(column["categories"] + [np.nan], dtype=object)[codes]
+            values = pd.array(values, dtype=column["dtype"]) if column["dtype"] != "object" else values
+        data[column["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+class SharedArena:
+    """
+    共享段的所有者：分配、登记与释放本进程创建（或为其他进程预留）的段
+
+    Args:
+        roots (list): 候选根目录，默认 DOE_SHM_DIR → /dev/shm → 临时目录
+    """
+
+    def __init__(self, roots=None):
+        self.roots = list(roots or _default_roots())
+        self._token = f"{SEGMENT_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._segments = {}  # 段目录 → 字节数（分配时为 0，写入后更新）
+        self._deferred = set()  # 删除失败（Windows 上仍被映射）待重试的段
+        self._lock = threading.Lock()
+        for root in self.roots:
+            sweep_stale(root)
+        atexit.register(self.close)
+
+    def _root_for(self, nbytes):
+        for root in self.roots[:-1]:
+            if _free_bytes(root) >= nbytes * SHM_HEADROOM:
+                return root
+        return self.roots[-1]
+
+    def allocate(self, nbytes=0):
+        """
+        预留一个段目录（可交给工作进程写入结果，所有权仍属于本进程）
+
+        Returns:
+            str: 段目录
+        """
+        path = os.path.join(self._root_for(nbytes), self._token, uuid.uuid4().hex)
+        with self._lock:
+            self._segments[path] = 0
+        return path
+
+    def share(self, df):
+        """
+        写入数据表并返回句柄；/dev/shm 写满时回退到最后一个根目录
+
+        Returns:
+            dict: 句柄（见 write_frame）
+        """
+        nbytes = frame_nbytes(df)
+        path = self.allocate(nbytes)
+        try:
+            handle = write_frame(df, path)
+        except OSError:
+            self.release(path)
+            if path.startswith(self.roots[-1]):
+                raise
+            path = os.path.join(self.roots[-1], self._token, uuid.uuid4().hex)
+            with self._lock:
+                self._segments[path] = 0
+            handle = write_frame(df, path)
+        with self._lock:
+            self._segments[path] = handle["nbytes"]
+        return handle
+
+    def release(self, handle_or_path):
+        """删除段（已映射的页在 Linux 上仍可继续使用，最后一个引用释放时回收）"""
+        path = handle_or_path["path"] if isinstance(handle_or_path, dict) else handle_or_path
+        with self._lock:
+            self._segments.pop(path, None)
+            pending = {path} | self._deferred
+            self._deferred = set()
+        for p in pending:
+            try:
+                shutil.rmtree(p)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                with self._lock:
+                    self._deferred.add(p)
+
+    def stats(self):
+        with self._lock:
+            return {"segments": len(self._segments), "bytes": int(sum(self._segments.values())),
+                    "deferred": len(self._deferred), "roots": self.roots}
+
+    def close(self):
+        """删除本进程的全部段目录"""
+        with self._lock:
+            self._segments.clear()
+            self._deferred.clear()
+        for root in self.roots:
+            shutil.rmtree(os.path.join(root, self._token), ignore_errors=True)
@@ -0,0 +1,292 @@
+"""
+稀疏 Henderson 混合模型方程（MME）求解器 —— 多个交叉 / 嵌套随机效应
+
+🎯 作用：
+statsmodels.MixedLM 只适合单个分组（Config_combo）随机截距；实际数据中还有 Day、Operator、
+DyeLot 等区组，形成水平数成千上万的交叉随机效应。本模块直接求解稀疏 Henderson 方程：
+
+    C(θ) = [ XᵀX   XᵀZ          ]   [β]   [Xᵀy]
+           [ ZᵀX   ZᵀZ + Λ(θ)⁻¹ ] · [u] = [Zᵀy]
+
+其中 Z 为各随机因子的 one-hot 稀疏矩阵横向拼接，Λ(θ) = diag(θ_k)，θ_k = σ_k² / σ²。
+REML 目标函数（σ² 已解析消去）只需要 C 的一次稀疏分解：
+
+    −2ℓ_R(θ) = (n − p)·log(yᵀPy / (n − p)) + Σ q_k·log θ_k + log|C(θ)|
+    yᵀPy = yᵀy − [β; u]ᵀ[Xᵀy; Zᵀy]
+
+- 优先使用 scikit-sparse（CHOLMOD）的稀疏 Cholesky；未安装时退回 scipy 的 SuperLU
+  （对称模式 + MMD_AT_PLUS_A 最小度排序，减少分解的填充）
+- 消去最大随机因子后的 Schur 补始终保持稀疏分解。局限：多个水平数相近的交叉因子会使 Schur 补
+  本身接近稠密（每对同时出现的水平都产生非零元），此时内存随 (Schur 补阶数)² 增长，只能靠排序减少
+  分解中额外的填充；dense_schur=True 可在 Schur 补阶数 ≤ DENSE_SCHUR_MAX 时改用稠密 Cholesky（BLAS，更快），
+  超过上限时仍走稀疏分解，避免分配 GB 级的稠密矩阵
+- 所有矩阵均以稀疏形式保存，内存随非零元数增长，而不是随水平数平方增长
+- 嵌套因子写作 "DyeLot:Batch"（按两列组合编码，即 Batch 嵌套在 DyeLot 内）
+
+拟合结果 SparseMixedResult 提供与 MixedLMResults 相同的常用属性
+（fe_params、fittedvalues、scale、cov_re、k_fe、df_modelwc、cov_params()、summary() 等），
+可直接替换 run_mixed_model_doe 中的 statsmodels 拟合结果。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy import stats
+from scipy.optimize import minimize
+from scipy.sparse.linalg import splu
+from scipy.linalg import cho_factor, cho_solve
+from patsy import dmatrices
+
+try:
+    from sksparse.cholmod import cholesky as _cholmod_cholesky
+except ImportError:  # 可选依赖：scikit-sparse
+    _cholmod_cholesky = None
+
+LOG_THETA_BOUNDS = (-20.0, 10.0)  # log(σ_k² / σ²) 的搜索范围
+DENSE_SCHUR_MAX = 4000  # dense_schur=True 时允许稠密分解的 Schur 补最大阶数（4000² × 8 字节 ≈ 128 MB）
+BOUNDED_METHODS = ("L-BFGS-B", "Powell", "Nelder-Mead")  # 支持 LOG_THETA_BOUNDS 的优化方法
+
+
+def _factorize(C, dense=False):
+    """
+    对称正定矩阵分解
+
+    Args:
+        C: 稀疏（或稠密）对称正定矩阵
+        dense (bool): 阶数 ≤ DENSE_SCHUR_MAX 时改用稠密 Cholesky（opt-in 快速路径）
+
+    Returns:
+        tuple: (log|C|, solve 函数)
+    """
+    if not sp.issparse(C) or (dense and C.shape[0] <= DENSE_SCHUR_MAX):
+        factor = cho_factor(C.toarray() if sp.issparse(C) else C)
+        return 2.0 * np.sum(np.log(np.diag(factor[0]))), lambda b: cho_solve(factor, b)
+    if _cholmod_cholesky is not None:
+        factor = _cholmod_cholesky(C.tocsc())
+        return factor.logdet(), factor
+    # 对称模式下 MMD_AT_PLUS_A 对 Aᵀ + A 做最小度排序，交叉随机效应的填充明显少于 COLAMD
+    lu = splu(C.tocsc(), permc_spec="MMD_AT_PLUS_A", diag_pivot_thresh=0.0,
+              options={"SymmetricMode": True})
+    return float(np.sum(np.log(np.abs(lu.U.diagonal())))), lu.solve
+
+
+def _factorize_mme(C, m, dense=False):
+    """
+    先精确消去末尾的对角块（水平数最多的随机因子，其 ZᵀZ + Λ⁻¹ 为对角阵），
+    再分解规模小得多的 Schur 补 S = A − B·D⁻¹·Bᵀ
+
+    Args:
+        C (sp.csc_matrix): 完整 MME 系数矩阵
+        m (int): 对角块的起始下标
+        dense (bool): Schur 补是否允许走稠密快速路径（见 _factorize）
+
+    Returns:
+        tuple: (log|C|, solve 函数)
+    """
+    d = C.diagonal()[m:]
+    B = C[:m, m:]
+    S = C[:m, :m] - B @ sp.diags(1.0 / d) @ B.T
+    logdet_s, solve_s = _factorize(S, dense)
+
+    def solve(b):
+        b1, b2 = b[:m], b[m:]
+        scaled = b2 / d[:, None] if b.ndim == 2 else b2 / d
+        x1 = solve_s(b1 - B @ scaled)
+        x2 = b2 - B.T @ x1
+        x2 = x2 / d[:, None] if b.ndim == 2 else x2 / d
+        return np.concatenate([x1, x2])
+
+    return logdet_s + float(np.sum(np.log(d))), solve
+
+
+def random_effect_codes(data, factor):
+    """
+    随机因子 → 整数编码；"A:B" 表示 B 嵌套在 A 内（按组合编码）
+
+    Returns:
+        tuple: (codes, 水平标签)
+    """
+    columns = [c.strip() for c in factor.split(":")]
+    keys = data[columns].astype(str).agg("_".join, axis=1) if len(columns) > 1 else data[columns[0]]
+    codes, levels = pd.factorize(keys, sort=True)
+    if (codes < 0).any():
+        raise ValueError(f"Missing values in random factor: {factor}")
+    return codes, levels
+
+
+class _SummaryTables:
+    """与 statsmodels Summary 相同的 tables 结构（tables[1] 为系数表）"""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+
+class SparseMixedResult:
+    """稀疏 MME 的 REML 拟合结果，属性命名与 MixedLMResults 保持一致"""
+
+    def __init__(self, fe_names, beta, cov_fe, scale, vcomp, random_effects, fittedvalues, resid,
+                 llf, converged, n_iter):
+        self.fe_params = pd.Series(beta, index=fe_names)
+        self._cov_fe = pd.DataFrame(cov_fe, index=fe_names, columns=fe_names)
+        self.bse_fe = pd.Series(np.sqrt(np.diag(cov_fe)), index=fe_names)
+        self.scale = scale
+        self.vcomp = vcomp  # 随机因子 → 方差分量
+        self.cov_re = pd.DataFrame(np.diag(list(vcomp.values())), index=list(vcomp), columns=list(vcomp))
+        self.random_effects = random_effects  # 随机因子 → 各水平的 BLUP
+        self.fittedvalues = fittedvalues
+        self.resid = resid
+        self.llf = llf
+        self.converged = converged
+        self.n_iter = n_iter
+        self.k_fe = len(fe_names)
+        self.k_vc = len(vcomp)
+        self.df_modelwc = self.k_fe + self.k_vc
+        self.nobs = len(fittedvalues)
+
+    @property
+    def params(self):
+        return self.fe_params
+
+    @property
+    def tvalues(self):
+        return self.fe_params / self.bse_fe
+
+    @property
+    def pvalues(self):
+        return pd.Series(2 * stats.norm.sf(np.abs(self.tvalues)), index=self.fe_params.index)
+
+    def cov_params(self):
+        return self._cov_fe
+
+    def variance_rows(self):
+        """
+        方差分量行（绝对单位 σ_k²，与 MixedLM 的 cov_re 相同）；第一个随机因子与 MixedLM 一样记为 "Group Var"
+
+        Returns:
+            pd.Series: 行名 → 方差
+        """
+        names = [("Group" if i == 0 else name) + " Var" for i, name in enumerate(self.vcomp)]
+        return pd.Series(list(self.vcomp.values()), index=names, dtype=float)
+
+    def summary(self):
+        """系数表与 MixedLM summary().tables[1] 同列，末尾附各随机因子的方差行"""
+        half_width = stats.norm.ppf(0.975) * self.bse_fe
+        coef = pd.DataFrame({
+            "Coef.": self.fe_params,
+            "Std.Err.": self.bse_fe,
+            "z": self.tvalues,
+            "P>|z|": self.pvalues,
+            "[0.025": self.fe_params - half_width,
+            "0.975]": self.fe_params + half_width,
+        })
+        vc = pd.DataFrame({"Coef.": self.variance_rows()})
+        info = pd.DataFrame({"Value": [self.nobs, self.scale, self.llf, self.converged]},
+                            index=["No. Observations", "Scale", "REML log-likelihood", "Converged"])
+        return _SummaryTables([info, pd.concat([coef, vc])])
+
+
+def fit_sparse_mixed(formula, data, random_factors, start=None, maxiter=200, method="L-BFGS-B",
+                     objective_hook=None, dense_schur=False):
+    """
+    REML 拟合含多个交叉 / 嵌套随机截距的线性混合模型
+
+    Args:
+        formula (str): 固定效应公式，如 "Lvalue ~ dye1 + I(dye1**2)"
+        data (pd.DataFrame): 建模数据
+        random_factors (list): 随机因子列名，如 ["Config_combo", "Day", "Operator", "DyeLot:Batch"]
+        start (array): 方差比 θ_k = σ_k²/σ² 的初值，默认全为 1
+        maxiter (int): 优化器最大迭代次数
+        method (str): scipy.optimize.minimize 的方法名（L-BFGS-B / Powell / Nelder-Mead 在 θ 的范围内搜索）
+        objective_hook (callable): 每次计算目标函数前调用（见 doe_fitting 的时间预算控制）
+        dense_schur (bool): Schur 补阶数 ≤ DENSE_SCHUR_MAX 时用稠密 Cholesky（更快，内存随阶数平方增长）
+
+    Returns:
+        SparseMixedResult
+    """
+    y_df, X_df = dmatrices(formula, data, return_type="dataframe")
+    rows = data.loc[X_df.index]
+    y = y_df.iloc[:, 0].to_numpy(dtype=float)
+    X = X_df.to_numpy(dtype=float)
+    n, p = X.shape
+
+    # 各随机因子的 one-hot 稀疏矩阵横向拼接；水平数最多的因子放在最后，由 _factorize_mme 精确消去
+    requested = list(random_factors)
+    encoded = {factor: random_effect_codes(rows, factor) for factor in requested}
+    random_factors = sorted(requested, key=lambda f: len(encoded[f][1]))
+    blocks, level_labels, sizes = [], [], []
+    for factor in random_factors:
+        codes, levels = encoded[factor]
+        blocks.append(sp.csr_matrix((np.ones(n), (np.arange(n), codes)), shape=(n, len(levels))))
+        level_labels.append(levels)
+        sizes.append(len(levels))
+    Z = sp.hstack(blocks, format="csc")
+    sizes = np.array(sizes)
+    n_schur = p + Z.shape[1] - sizes[-1]
+    owner = np.repeat(np.arange(len(random_factors)), sizes)  # 每个随机效应水平所属的因子
+
+    # θ 无关的交叉积只计算一次
+    Xs = sp.csc_matrix(X)
+    base = sp.bmat([[Xs.T @ Xs, Xs.T @ Z], [Z.T @ Xs, Z.T @ Z]], format="csc")
+    rhs = np.concatenate([X.T @ y, Z.T @ y])
+    yty = y @ y
+    n_random = Z.shape[1]
+    penalty_index = np.arange(p, p + n_random)
+
+    def system(log_theta):
+        penalty = sp.csc_matrix((np.exp(-log_theta)[owner], (penalty_index, penalty_index)),
+                                shape=base.shape)
+        logdet, solve = _factorize_mme(base + penalty, n_schur, dense_schur)
+        sol = solve(rhs)
+        ypy = max(yty - sol @ rhs, np.finfo(float).tiny)
+        return logdet, solve, sol, ypy
+
+    def objective(log_theta):
+        if objective_hook is not None:
+            objective_hook()
+        logdet, _, _, ypy = system(log_theta)
+        return (n - p) * np.log(ypy / (n - p)) + sizes @ log_theta + logdet
+
+    x0 = np.zeros(len(random_factors))
+    if start is not None:
+        x0 = np.log(np.asarray(start, dtype=float))[[requested.index(f) for f in random_factors]]
+    bounds = [LOG_THETA_BOUNDS] * len(x0) if method in BOUNDED_METHODS else None
+    opt = minimize(objective, x0, method=method, bounds=bounds, options={"maxiter": maxiter})
+
+    logdet, solve, sol, ypy = system(opt.x)
+    scale = ypy / (n - p)
+    theta = np.exp(opt.x)
+    beta, u = sol[:p], sol[p:]
+
+    # Cov(β̂) = σ² · [C⁻¹]_XX（对 p 个单位向量求解）
+    unit = np.zeros((p + n_random, p))
+    unit[np.arange(p), np.arange(p)] = 1.0
+    cov_fe = scale * solve(unit)[:p]
+    cov_fe = (cov_fe + cov_fe.T) / 2
+
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    # 输出按调用方给出的随机因子顺序（cov_re.iloc[0, 0] 为第一个因子的方差）
+    position = {factor: k for k, factor in enumerate(random_factors)}
+    random_effects = {
+        factor: pd.Series(u[offsets[position[factor]]:offsets[position[factor] + 1]],
+                          index=level_labels[position[factor]])
+        for factor in requested
+    }
+    fitted = X @ beta + Z @ u
+    llf = -0.5 * (opt.fun + (n - p) * (1 + np.log(2 * np.pi)))
+
+    return SparseMixedResult(
+        fe_names=list(X_df.columns),
+        beta=beta,
+        cov_fe=cov_fe,
+        scale=scale,
+        vcomp={factor: theta[position[factor]] * scale for factor in requested},
+        random_effects=random_effects,
+        fittedvalues=pd.Series(fitted, index=X_df.index),
+        resid=pd.Series(y - fitted, index=X_df.index),
+        llf=llf,
+        converged=bool(opt.success),
+        n_iter=int(opt.nit),
+    )
@@ -0,0 +1,134 @@
+"""
+分析阶段的内容哈希与记忆化（memo）存储
+
+🎯 作用：
+run_mixed_model_doe 被拆成若干阶段（全模型 OLS、simplified 因子、阈值路径、共线性检查、
+simplified OLS、混合模型拟合……），每个阶段的缓存键由三部分组成：
+- 阶段名
+- 上游阶段的缓存键（只传键，不重新哈希上游的结果）
+- 本阶段直接读取的数据列 / 参数的内容指纹
+
+因此各阶段构成一个以键相连的有向无环图：只修改 Bvalue 列时，只有依赖 Bvalue 的阶段键会变化，
+Lvalue / Avalue 的 OLS 与混合模型拟合直接命中缓存；只换导出格式时所有计算阶段都命中缓存。
+
+缓存结果会被多次复用，调用方不得原地修改。缓存是进程内共享的（由条目数限制），
+阶段结果应只包含导出表 / 规格等普通数据，不要缓存 MixedLMResults 这类引用设计矩阵与数据副本的拟合结果对象。
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES = 256
+
+StageResult = namedtuple("StageResult", ["value", "key", "cached"])
+
+
+def fingerprint(value):
+    """
+    内容指纹（sha256 十六进制）
+
+    Args:
+        value: DataFrame / Series / ndarray / 可 JSON 序列化的参数
+
+    Returns:
+        str
+    """
+    digest = hashlib.sha256()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        frame = value.to_frame() if isinstance(value, pd.Series) else value
+        digest.update(json.dumps([list(map(str, frame.columns)), list(map(str, frame.dtypes))]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(f"{value.dtype}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=repr).encode())
+    return digest.hexdigest()
+
+
+class StageMemo:
+    """
+    阶段结果缓存：进程内 LRU，可选落盘（pickle）
+
+    Args:
+        max_entries (int): 内存中保留的阶段结果数
+        directory (str): 落盘目录，为空时只缓存在内存中
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return True, self._entries[key]
+        if self.directory:
+            path = os.path.join(self.directory, f"{key}.pkl")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    value = pickle.load(f)
+                self._store(key, value, persist=False)
+                return True, value
+        return False, None
+
+    def _store(self, key, value, persist=True):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if persist and self.directory:
+            tmp = os.path.join(self.directory, f"{key}.pkl.tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, os.path.join(self.directory, f"{key}.pkl"))
+
+    def run(self, stage, compute, deps=(), **inputs):
+        """
+        执行（或复用）一个阶段
+
+        Args:
+            stage (str): 阶段名
+            compute (callable): 无参函数，缓存未命中时调用
+            deps (iterable): 上游 StageResult 或其键
+            **inputs: 本阶段直接读取的数据 / 参数（DataFrame、Series 会按内容计算指纹）
+
+        Returns:
+            StageResult: (value, key, cached)
+        """
+        parts = {
+            "stage": stage,
+            "deps": [d.key if isinstance(d, StageResult) else d for d in deps],
+            "inputs": {name: fingerprint(value) for name, value in sorted(inputs.items())},
+        }
+        key = fingerprint(parts)
+        found, value = self._load(key)
+        if found:
+            self.hits += 1
+            return StageResult(value, key, True)
+        value = compute()
+        self.misses += 1
+        self._store(key, value)
+        return StageResult(value, key, False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
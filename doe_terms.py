@@ -0,0 +1,79 @@
+"""
+RSM 模型项解析与向量化求值
+
+🎯 作用：
+把 simplified 模型中的 patsy 项名（如 "dye1"、"I(Time ** 2)"、"dye1:Temp"）编译成因子下标对，
+在 coded（标准化）空间内一次性构造整批配方的模型矩阵，供预测、优化设计、模拟等模块共用。
+
+每个项都表示为两个因子下标 (a, b) 的乘积，下标 k（因子个数）指向常数 1 列：
+    Intercept    → (k, k)
+    dye1         → (i, k)
+    I(dye1 ** 2) → (i, i)
+    dye1:Temp    → (i, j)
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+
+
+def parse_term(term, predictors):
+    """
+    将单个项名解析为参与相乘的因子下标
+
+    Args:
+        term (str): patsy 项名
+        predictors (list): 因子列名
+
+    Returns:
+        tuple: 因子下标（Intercept 为空元组）
+    """
+    term = term.strip()
+    if term == "Intercept":
+        return ()
+    if term.startswith("I("):
+        var = term.split("(")[1].split("**")[0].strip()
+        power = int(term.split("**")[1].rstrip(")").strip())
+        return (predictors.index(var),) * power
+    if ":" in term:
+        return tuple(predictors.index(v.strip()) for v in term.split(":"))
+    return (predictors.index(term),)
+
+
+def compile_terms(terms, predictors):
+    """
+    将项名列表编译为 (m, 2) 的下标对数组（仅支持二阶 RSM 项）
+
+    Args:
+        terms (list): 项名列表（含或不含 "Intercept"）
+        predictors (list): 因子列名
+
+    Returns:
+        np.ndarray: 每行为该项的两个因子下标，常数列下标为 len(predictors)
+    """
+    one = len(predictors)
+    pairs = []
+    for term in terms:
+        idx = parse_term(term, predictors)
+        if len(idx) > 2:
+            raise ValueError(f"Only second-order RSM terms are supported: {term}")
+        pairs.append(idx + (one,) * (2 - len(idx)))
+    return np.array(pairs, dtype=np.intp).reshape(-1, 2)
+
+
+def model_matrix(X_coded, pairs):
+    """
+    构造模型矩阵
+
+    Args:
+        X_coded (np.ndarray): (n, k) 标准化后的因子取值
+        pairs (np.ndarray): compile_terms 的输出
+
+    Returns:
+        np.ndarray: (n, m) 模型矩阵
+    """
+    X1 = np.empty((X_coded.shape[0], X_coded.shape[1] + 1))
+    X1[:, :-1] = X_coded
+    X1[:, -1] = 1.0
+    return X1[:, pairs[:, 0]] * X1[:, pairs[:, 1]]
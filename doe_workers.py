@@ -0,0 +1,186 @@
+"""
+分析工作进程池：DOE 分析在独立进程中执行，数据经共享内存交接
+
+🎯 作用：
+混合模型拟合是 CPU 密集的纯 Python / NumPy 计算，在 Web 进程的线程池中执行时会与事件循环争用 GIL。
+本模块把 run_mixed_model_doe 放到 spawn 进程池中执行，进程之间不传递 DataFrame：
+
+- 输入：API 进程把解析好的数据表写入共享段（doe_shm.SharedArena.share），只把句柄交给工作进程，
+  工作进程 attach 后直接映射同一批物理页
+- 输出：API 进程预留结果段目录，工作进程把注册所需的设计表 / stage_memory 表写入其中；
+  经管道返回的只有模型规格（系数、协方差等几 KB 的 JSON）与句柄
+- 进度事件：所有工作进程共用一个 multiprocessing.Queue（进程池初始化时传入），
+  API 进程的后台线程按任务令牌分发到各自的 progress_callback（如 Job.publish）
+- max_workers=0 时在调用线程中执行同一流程（同样经共享段，便于剖析与调试）
+- StageMemo 阶段缓存是进程内的：每个工作进程各有一份，重复分析命中与否取决于分配到的进程
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from doe_shm import SharedArena, attach, write_frame
+from doe_registry import build_model_spec
+from MixedModelDOE_Function_FollowOriginal_20250804 import run_mixed_model_doe
+
+EVENT_FLUSH_TIMEOUT = 10.0  # 等待剩余进度事件送达的最长时间（秒）
+
+_worker_events = None  # 工作进程内：进度事件队列（进程池 initializer 设置）
+
+
+def _init_worker(events):
+    global _worker_events
+    _worker_events = events
+
+
+def _analysis_task(handle, result_path, output_dir, token, options, events=None):
+    """
+    工作进程（或 max_workers=0 时的调用线程）中执行一次分析
+
+    Returns:
+        dict: {"spec", "design": 句柄, "stage_memory": 句柄或 None}
+    """
+    events = events if events is not None else _worker_events
+    progress = (lambda event: events.put((token, event))) if events is not None else None
+    try:
+        results = run_mixed_model_doe(attach(handle), output_dir, progress_callback=progress, **options)
+    finally:
+        if events is not None:
+            events.put((token, None))  # 结束标记：API 进程据此确认进度事件已全部送达
+    spec, design_df = build_model_spec(results)
+    stage_memory = results.get("stage_memory")
+    return {
+        "spec": spec,
+        "design": write_frame(design_df, os.path.join(result_path, "design")),
+        "stage_memory": (write_frame(stage_memory, os.path.join(result_path, "stage_memory"))
+                         if stage_memory is not None else None),
+    }
+
+
+def _dispatch(callbacks, item):
+    """进度事件 → 对应任务的回调；None 为结束标记"""
+    token, event = item
+    entry = callbacks.get(token)
+    if entry is None:
+        return
+    callback, finished = entry
+    if event is None:
+        finished.set()
+        return
+    try:
+        callback(event)
+    except Exception as e:
+        print(f"⚠️ Progress callback failed: {e}")
+
+
+class _LocalEvents:
+    """max_workers=0 时的进度通道：直接回调"""
+
+    def __init__(self, callbacks):
+        self._callbacks = callbacks
+
+    def put(self, item):
+        _dispatch(self._callbacks, item)
+
+
+class AnalysisWorkers:
+    """
+    DOE 分析进程池
+
+    Args:
+        max_workers (int): 工作进程数；0 表示在调用线程中执行
+        arena (SharedArena): 共享段的所有者，默认新建
+    """
+
+    def __init__(self, max_workers=2, arena=None):
+        self.max_workers = max_workers
+        self.arena = arena or SharedArena()
+        self._executor = None
+        self._events = None
+        self._callbacks = {}  # 任务令牌 → (progress_callback, 结束标记 Event)
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context("spawn")  # 工作进程不继承 Web 服务的线程与锁
+                self._events = context.Queue()
+                self._executor = ProcessPoolExecutor(self.max_workers, mp_context=context,
+                                                     initializer=_init_worker, initargs=(self._events,))
+                threading.Thread(target=self._pump, args=(self._events,), name="doe-worker-events", daemon=True).start()
+            return self._executor
+
+    def _pump(self, events):
+        """把工作进程的进度事件分发给对应任务的回调（收到 None 时退出）"""
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            _dispatch(self._callbacks, item)
+
+    def share(self, df):
+        """把输入数据表写入共享段（调用方随后可以释放自己的 DataFrame）"""
+        return self.arena.share(df)
+
+    def release(self, handle):
+        self.arena.release(handle)
+
+    def run(self, handle, output_dir, progress_callback=None, in_process=False, **options):
+        """
+        执行分析（阻塞，应在工作线程中调用）
+
+        Args:
+            handle (dict): 输入数据的共享段句柄（见 share）
+            output_dir (str): 结果导出目录
+            progress_callback (callable): 进度事件回调
+            in_process (bool): 强制在调用线程中执行（如需要剖析当前线程时）
+            **options: run_mixed_model_doe 的其余参数
+
+        Returns:
+            dict: {"spec": 模型规格, "design": 设计表, "stage_memory": 阶段内存表或 None}
+                  （表格映射自共享段，段在返回前已释放）
+        """
+        token = uuid.uuid4().hex
+        result_path = self.arena.allocate()
+        finished = threading.Event()
+        self._callbacks[token] = (progress_callback or (lambda event: None), finished)
+        try:
+            if in_process or self.max_workers == 0:
+                output = _analysis_task(handle, result_path, output_dir, token, options, _LocalEvents(self._callbacks))
+            else:
+                try:
+                    output = self._pool().submit(_analysis_task, handle, result_path, output_dir, token,
+                                                 options).result()
+                except BrokenProcessPool:
+                    # 工作进程崩溃（如被 OOM killer 终止）：丢弃进程池，下次调用时重建
+                    with self._lock:
+                        self._executor = None
+                        self._events.put(None)  # 停止旧队列的分发线程
+                    raise RuntimeError("Analysis worker process terminated unexpectedly")
+                # 结果经进程池管道返回，进度事件经队列返回：等队列中的事件分发完再返回
+                finished.wait(EVENT_FLUSH_TIMEOUT)
+            return {
+                "spec": output["spec"],
+                "design": attach(output["design"]),
+                "stage_memory": attach(output["stage_memory"]) if output["stage_memory"] is not None else None,
+            }
+        finally:
+            self._callbacks.pop(token, None)
+            self.arena.release(result_path)
+
+    def stats(self):
+        return {"processes": self.max_workers, "running": self._executor is not None, **self.arena.stats()}
+
+    def shutdown(self):
+        with self._lock:
+            executor, events, self._executor = self._executor, self._events, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            events.put(None)
+        self.arena.close()
@@ -0,0 +1,91 @@
+"""
+doe_archive 的核对：多实例 / 多进程并发追加不丢段、长期存在的实例能看到其他实例的追加、
+zone map 剪枝与逐行过滤结果和 pandas 过滤一致
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import threading
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from doe_archive import ExperimentArchive
+
+
+def _batch(product_line, run_date, temp_low, rows=20, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "dye1": rng.uniform(0, 1, rows),
+        "Temp": np.linspace(temp_low, temp_low + 10, rows),
+        "Lvalue": rng.normal(60, 1, rows),
+        "product_line": product_line,
+        "run_date": run_date,
+    })
+
+
+def _append_many(root, worker, count):
+    archive = ExperimentArchive(root)
+    for i in range(count):
+        archive.append(_batch(f"PL-{worker}", "2025-06-01", 10, seed=i), source_name=f"{worker}-{i}")
+
+
+def test_appends_from_separate_instances_are_all_kept(tmp_path):
+    root = str(tmp_path / "archive")
+    first, second = ExperimentArchive(root), ExperimentArchive(root)
+    first.append(_batch("PL-A", "2025-06-01", 10))
+    second.append(_batch("PL-B", "2025-06-02", 10))
+    first.append(_batch("PL-A", "2025-06-03", 10))
+    second.append(_batch("PL-B", "2025-06-04", 10))
+    assert len(ExperimentArchive(root).segments) == 4
+    # 长期存在的实例在查询时重新加载 manifest
+    assert len(first.segments) == 4
+    assert len(first.query(product_line="PL-B").to_frame()) == 40
+
+
+def test_concurrent_appends_across_threads_and_processes(tmp_path):
+    root = str(tmp_path / "archive")
+    ExperimentArchive(root)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_append_many, args=(root, f"p{w}", 5)) for w in range(3)]
+    threads = [threading.Thread(target=_append_many, args=(root, f"t{w}", 5)) for w in range(3)]
+    for worker in processes + threads:
+        worker.start()
+    for worker in processes + threads:
+        worker.join()
+    assert all(p.exitcode == 0 for p in processes)
+    segments = ExperimentArchive(root).segments
+    assert len(segments) == 30
+    assert len({s["id"] for s in segments}) == 30
+    assert sorted(s["source"] for s in segments) == sorted(f"{kind}{w}-{i}" for kind in "pt" for w in range(3)
+                                                           for i in range(5))
+
+
+def test_zone_map_pruning_matches_row_filter(tmp_path):
+    archive = ExperimentArchive(str(tmp_path / "archive"))
+    batches = [
+        _batch("PL-A", "2025-01-10", 10, seed=1),  # Temp 10–20
+        _batch("PL-A", "2025-03-10", 30, seed=2),  # Temp 30–40
+        _batch("PL-B", "2025-03-12", 10, seed=3),
+        _batch("PL-A", "2025-05-01", 15, seed=4),  # Temp 15–25，跨越查询上限
+    ]
+    for batch in batches:
+        archive.append(batch)
+    everything = pd.concat(batches, ignore_index=True)
+
+    query = archive.query(product_line="PL-A", date_from="2025-01-01", factor_ranges={"Temp": (10, 20)})
+    coverage = [c for _, c in query.segments()]
+    # 第 2 段（Temp 不相交）与第 3 段（产品线不符）被 zone map 跳过
+    assert coverage == ["all", "partial"]
+
+    result = query.to_frame()
+    expected = everything[(everything["product_line"] == "PL-A") & everything["Temp"].between(10, 20)]
+    np.testing.assert_allclose(np.sort(result["Lvalue"].to_numpy()), np.sort(expected["Lvalue"].to_numpy()))
+
+    # 只命中一个完整段时零拷贝返回 memmap
+    single = archive.query(product_line="PL-B", columns=["Lvalue"]).to_columns()
+    assert isinstance(single["Lvalue"], np.memmap)
+
+    assert archive.query(date_from="2026-01-01").segments() == []
@@ -0,0 +1,67 @@
+"""
+doe_augment 的数值核对：Sherman–Morrison 秩一更新与点交换结果对照穷举最优解
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from doe_augment import augment_design, candidate_grid, _add_point, _remove_point
+from doe_terms import compile_terms, model_matrix
+
+PREDICTORS = ["A", "B"]
+TERMS = ["Intercept", "A", "B", "A:B", "I(A ** 2)"]
+RANGES = {"A": (-1.0, 1.0), "B": (-1.0, 1.0)}
+EXISTING = np.array([[-1.0, -1.0], [1.0, -1.0], [-1.0, 1.0], [1.0, 1.0], [0.0, 0.0]])
+
+
+def _brute_force(criterion, n_runs, levels):
+    """枚举全部可重复组合，返回最优准则值（D：log det(M)，I：trace(M⁻¹W)）"""
+    pairs = compile_terms(TERMS, PREDICTORS)
+    F0 = model_matrix(EXISTING, pairs)
+    F = model_matrix(candidate_grid(RANGES, PREDICTORS, levels), pairs)
+    W = F.T @ F / len(F)
+    values = []
+    for combo in itertools.combinations_with_replacement(range(len(F)), n_runs):
+        M = F0.T @ F0 + F[list(combo)].T @ F[list(combo)]
+        if criterion == "D":
+            values.append(np.linalg.slogdet(M)[1])
+        else:
+            values.append(np.trace(np.linalg.solve(M, W)))
+    return max(values) if criterion == "D" else min(values)
+
+
+def test_sherman_morrison_updates_match_direct_inverse():
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(12, 5))
+    M = A.T @ A
+    f = rng.normal(size=5)
+    Minv = np.linalg.inv(M)
+    np.testing.assert_allclose(_add_point(Minv, f), np.linalg.inv(M + np.outer(f, f)), rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(_remove_point(Minv, A[0]), np.linalg.inv(M - np.outer(A[0], A[0])),
+                               rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize("criterion,n_runs", [("D", 2), ("D", 3), ("I", 2), ("I", 3)])
+def test_exchange_reaches_brute_force_optimum(criterion, n_runs):
+    levels = 3
+    result = augment_design(EXISTING, TERMS, PREDICTORS, x_mean=[0.0, 0.0], x_scale=[1.0, 1.0], n_runs=n_runs,
+                            criterion=criterion, factor_ranges=RANGES, levels=levels, n_starts=16, random_state=0)
+    best = _brute_force(criterion, n_runs, levels)
+    if criterion == "D":
+        assert result["log_det_after"] == pytest.approx(best, rel=1e-9)
+        assert result["log_det_after"] > result["log_det_before"]
+    else:
+        assert result["avg_prediction_variance_after"] == pytest.approx(best, rel=1e-9)
+        assert result["avg_prediction_variance_after"] < result["avg_prediction_variance_before"]
+
+
+def test_recommendation_is_reproducible():
+    kwargs = dict(x_mean=[0.0, 0.0], x_scale=[1.0, 1.0], n_runs=4, factor_ranges=RANGES, levels=5, random_state=7)
+    first = augment_design(EXISTING, TERMS, PREDICTORS, **kwargs)["runs"]
+    second = augment_design(EXISTING, TERMS, PREDICTORS, n_jobs=1, **kwargs)["runs"]
+    assert first.equals(second)
@@ -0,0 +1,92 @@
+"""
+doe_fitting 拟合控制器的核对：回退链顺序、超时状态、边界最优视为收敛、并发拟合的警告收集
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import threading
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from doe_fitting import FitController, MixedFitError
+
+FORMULA = "y ~ x"
+
+
+def _data(n_groups=40, per_group=4, group_sd=0.0, seed=0, anticorrelated=False):
+    rng = np.random.default_rng(seed)
+    group = np.repeat(np.arange(n_groups), per_group)
+    x = rng.uniform(-1, 1, len(group))
+    if anticorrelated:
+        # 组内残差成对相反：组均值几乎没有组间波动，REML 最优点落在 Group Var = 0 的边界上
+        e = np.repeat(rng.normal(0, 0.5, len(group) // 2), 2) * np.tile([1.0, -1.0], len(group) // 2)
+    else:
+        e = rng.normal(0, 0.5, len(group))
+    y = 1.0 + 2.0 * x + rng.normal(0, group_sd, n_groups)[group] + e
+    return pd.DataFrame({"y": y, "x": x, "g": group})
+
+
+def test_converged_fit_stops_the_chain():
+    fit, attempts = FitController().fit(FORMULA, _data(group_sd=0.8), ["g"], use_sparse=False)
+    assert [a["Optimizer"] for a in attempts] == ["lbfgs"]
+    assert attempts[0]["Status"] == "converged" and attempts[0]["Selected"]
+
+
+@pytest.mark.parametrize("use_sparse", [False, True])
+def test_fallback_chain_runs_in_order_and_selects_best_likelihood(use_sparse):
+    # maxiter=1：每个优化器都在收敛前停下，回退链按顺序全部尝试，采用似然最高的结果
+    controller = FitController(methods=("lbfgs", "powell", "nm"), maxiter=1, warm_start=False)
+    fit, attempts = controller.fit(FORMULA, _data(group_sd=0.8), ["g"], use_sparse=use_sparse)
+    assert [a["Optimizer"] for a in attempts] == ["lbfgs", "powell", "nm"]
+    assert all(a["Status"] == "not_converged" for a in attempts)
+    selected = [a for a in attempts if a["Selected"]]
+    assert len(selected) == 1
+    assert selected[0]["Log_Likelihood"] == max(a["Log_Likelihood"] for a in attempts)
+    assert fit.llf == pytest.approx(selected[0]["Log_Likelihood"])
+
+
+def test_time_budget_marks_timeout_and_skips_remaining_optimizers():
+    controller = FitController(time_budget=0.02, warm_start=False)
+    with pytest.raises(MixedFitError) as info:
+        controller.fit(FORMULA, _data(n_groups=3000, per_group=5, group_sd=0.8), ["g"], use_sparse=False)
+    statuses = [a["Status"] for a in info.value.attempts]
+    assert statuses[0] == "timeout"
+    assert set(statuses[1:]) <= {"timeout", "skipped"}
+
+
+@pytest.mark.parametrize("use_sparse", [False, True])
+def test_boundary_optimum_is_converged(use_sparse):
+    fit, attempts = FitController().fit(FORMULA, _data(anticorrelated=True), ["g"], use_sparse=use_sparse)
+    assert len(attempts) == 1
+    assert attempts[0]["Status"] == "converged"
+    assert np.isfinite(attempts[0]["Log_Likelihood"])
+    assert fit.cov_re.iloc[0, 0] / fit.scale <= 1e-6
+    assert "boundary optimum" in attempts[0]["Message"]
+
+
+def test_concurrent_fits_keep_their_own_warnings():
+    filters = list(warnings.filters)
+    logs = {}
+
+    def run(name, data):
+        logs[name] = FitController().fit(FORMULA, data, ["g"], use_sparse=False)[1]
+
+    threads = [threading.Thread(target=run, args=(f"boundary{i}", _data(seed=i, anticorrelated=True)))
+               for i in range(4)]
+    threads += [threading.Thread(target=run, args=(f"interior{i}", _data(seed=i, group_sd=1.0))) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for name, attempts in logs.items():
+        if name.startswith("boundary"):
+            assert "boundary optimum" in attempts[0]["Message"]
+            assert "The MLE may be on the boundary" in attempts[0]["Message"]
+        else:
+            assert attempts[0]["Message"] == ""
+    # 拟合结束后不残留 catch_warnings 式的过滤器替换（只允许钩子安装时加入的 ConvergenceWarning 规则）
+    assert all(f in warnings.filters for f in filters)
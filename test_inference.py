@@ -0,0 +1,84 @@
+"""
+doe_inference 的数值核对：
+- 平衡单因素随机截距设计的已知自由度（截距 g − 1，组内协变量 N − g − 1）
+- 与直接按 n×n 矩阵 V、P 计算的 Satterthwaite / Kenward–Roger 教科书公式一致
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pytest
+
+from doe_inference import fixed_effect_tests, kenward_roger
+
+SCALE = 0.6
+
+
+def _balanced(n_groups=8, per_group=5):
+    codes = np.repeat(np.arange(n_groups), per_group)
+    x = np.tile(np.linspace(-1, 1, per_group), n_groups)  # 组内中心化，各组相同
+    return np.column_stack([np.ones_like(x), x]), codes
+
+
+def _dense_reference(X, random_codes, scale, variances):
+    """直接由 V = σ²I + Σ σ_k² Z_kZ_kᵀ 计算 Φ、ΦP_iΦ、ΦQ_ijΦ 与 W（仅用于小 n）"""
+    n = len(X)
+    V_i = [np.eye(n)]
+    for codes in random_codes:
+        Z = np.zeros((n, codes.max() + 1))
+        Z[np.arange(n), codes] = 1.0
+        V_i.append(Z @ Z.T)
+    V = scale * V_i[0] + sum(v * Vk for v, Vk in zip(variances, V_i[1:]))
+    V_inv = np.linalg.inv(V)
+    Phi = np.linalg.inv(X.T @ V_inv @ X)
+    P = V_inv - V_inv @ X @ Phi @ X.T @ V_inv
+    G = V_inv @ X @ Phi
+    phi_p = [G.T @ Vi @ G for Vi in V_i]
+    phi_q = [[G.T @ Vi @ V_inv @ Vj @ G for Vj in V_i] for Vi in V_i]
+    info = np.array([[0.5 * np.trace(P @ Vi @ P @ Vj) for Vj in V_i] for Vi in V_i])
+    return Phi, phi_p, phi_q, np.linalg.inv(info)
+
+
+@pytest.mark.parametrize("method", ["kenward-roger", "satterthwaite"])
+@pytest.mark.parametrize("group_var", [0.05, 0.5, 5.0])
+def test_balanced_one_way_degrees_of_freedom(method, group_var):
+    X, codes = _balanced()
+    table = fixed_effect_tests(X, [codes], np.array([1.0, 0.5]), SCALE, [group_var], method)
+    n_groups = codes.max() + 1
+    assert table["DF"].iloc[0] == pytest.approx(n_groups - 1, rel=1e-8)
+    assert table["DF"].iloc[1] == pytest.approx(len(X) - n_groups - 1, rel=1e-8)
+
+
+def test_asymptotic_method_has_infinite_df():
+    X, codes = _balanced()
+    table = fixed_effect_tests(X, [codes], np.array([1.0, 0.5]), SCALE, [0.5], "asymptotic")
+    assert np.isinf(table["DF"]).all()
+
+
+def test_crossed_design_matches_dense_formulas():
+    rng = np.random.default_rng(4)
+    n = 60
+    x = rng.normal(size=(n, 2))
+    X = np.column_stack([np.ones(n), x, x[:, 0] * x[:, 1]])
+    codes = [rng.integers(0, 12, n), rng.integers(0, 4, n)]
+    variances = [0.4, 0.2]
+    Phi, phi_p, phi_q, W = _dense_reference(X, codes, SCALE, variances)
+    beta = rng.normal(size=X.shape[1])
+
+    satterthwaite = fixed_effect_tests(X, codes, beta, SCALE, variances, "satterthwaite")
+    np.testing.assert_allclose(satterthwaite["Std_Error"], np.sqrt(np.diag(Phi)), rtol=1e-9)
+    for j in range(X.shape[1]):
+        grad = np.array([pp[j, j] for pp in phi_p])
+        assert satterthwaite["DF"].iloc[j] == pytest.approx(2 * Phi[j, j] ** 2 / (grad @ W @ grad), rel=1e-7)
+
+    kr = fixed_effect_tests(X, codes, beta, SCALE, variances, "kenward-roger")
+    np.testing.assert_allclose(kr["Std_Error"], np.sqrt(np.diag(kenward_roger(Phi, phi_p, phi_q, W))), rtol=1e-8)
+
+
+def test_boundary_variance_is_dropped():
+    X, codes = _balanced()
+    table = fixed_effect_tests(X, [codes], np.array([1.0, 0.5]), SCALE, [0.0], "kenward-roger")
+    # 方差分量为 0 时退化为 OLS：残差自由度 N − p
+    np.testing.assert_allclose(table["DF"], len(X) - X.shape[1], rtol=1e-8)
+    np.testing.assert_allclose(table["Std_Error"], np.sqrt(SCALE * np.diag(np.linalg.inv(X.T @ X))), rtol=1e-10)
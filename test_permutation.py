@@ -0,0 +1,64 @@
+"""
+doe_permutation 的核对：观测 F / p 值与 statsmodels anova_lm(typ=3) 一致，
+置换 p 值的取值范围、可复现性（与线程数无关）及原假设下的校准
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.formula.api as smf
+from statsmodels.stats.anova import anova_lm
+
+from doe_permutation import permutation_logworth
+
+TERMS = ["x1", "x2", "x1:x2", "I(x1 ** 2)"]
+
+
+def _data(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(-1, 1, n)
+    x2 = rng.uniform(-1, 1, n)
+    y = 1.0 + 2.0 * x1 + 0.0 * x2 + rng.standard_t(4, n) * 0.5
+    return pd.DataFrame({"y": y, "x1": x1, "x2": x2})
+
+
+def test_observed_statistics_match_anova_lm():
+    data = _data()
+    table = permutation_logworth(data, "y", TERMS, n_permutations=200, seed=0).set_index("Factor")
+    anova = anova_lm(smf.ols("y ~ " + " + ".join(TERMS), data=data).fit(), typ=3)
+    anova = anova[anova.index != "Residual"]
+    np.testing.assert_allclose(table.loc[anova.index, "F_Ratio"], anova["F"], rtol=1e-8)
+    np.testing.assert_allclose(table.loc[anova.index, "p_Value"], anova["PR(>F)"], rtol=1e-6, atol=1e-300)
+
+
+def test_permutation_p_values_are_bounded():
+    B = 499
+    table = permutation_logworth(_data(), "y", TERMS, n_permutations=B, seed=0).set_index("Factor")
+    assert np.isnan(table.loc["Intercept", "Perm_p"])
+    perm_p = table["Perm_p"].drop("Intercept")
+    assert ((perm_p >= 1 / (B + 1)) & (perm_p <= 1)).all()
+    # p·(B + 1) − 1 为超过观测值的置换次数（整数）
+    np.testing.assert_allclose(perm_p * (B + 1) - 1, np.round(perm_p * (B + 1) - 1), atol=1e-9)
+    # 强效应项所有置换都不超过观测值
+    assert table.loc["x1", "Perm_p"] == pytest.approx(1 / (B + 1))
+
+
+def test_seed_reproducibility_is_independent_of_threads():
+    data = _data()
+    first = permutation_logworth(data, "y", TERMS, n_permutations=2500, seed=11, n_jobs=1)
+    second = permutation_logworth(data, "y", TERMS, n_permutations=2500, seed=11, n_jobs=4)
+    other = permutation_logworth(data, "y", TERMS, n_permutations=2500, seed=12, n_jobs=4)
+    pd.testing.assert_frame_equal(first, second)
+    assert not np.allclose(first["Perm_p"].dropna(), other["Perm_p"].dropna())
+
+
+def test_null_term_is_close_to_parametric_p():
+    # 正态误差、原假设成立时置换 p 值应接近参数 F 检验的 p 值
+    rng = np.random.default_rng(5)
+    data = pd.DataFrame({"x1": rng.uniform(-1, 1, 60), "x2": rng.uniform(-1, 1, 60)})
+    data["y"] = 1.0 + 2.0 * data["x1"] + rng.normal(0, 1, 60)
+    table = permutation_logworth(data, "y", ["x1", "x2"], n_permutations=5000, seed=0).set_index("Factor")
+    assert table.loc["x2", "Perm_p"] == pytest.approx(table.loc["x2", "p_Value"], abs=0.03)
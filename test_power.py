@@ -0,0 +1,60 @@
+"""
+doe_power 的数值核对：γ = 0（无配置组随机效应）时模拟功效与 OLS 非中心 t 分布的解析功效一致
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pytest
+from scipy import stats
+
+from doe_power import simulate_power, MAX_SIMULATIONS
+from doe_terms import compile_terms, model_matrix
+
+PREDICTORS = ["A", "B"]
+TERMS = ["Intercept", "A", "B", "A:B"]
+COEF = np.array([10.0, 0.6, 0.25, 0.0])
+RESIDUAL_VAR = 0.5
+
+
+def _design():
+    grid = np.array([[a, b] for a in (-1.0, 0.0, 1.0) for b in (-1.0, 0.0, 1.0)])
+    return np.vstack([grid, grid])  # 每个配方重复两次
+
+
+def _analytic_power(design, alpha):
+    """OLS 双侧 t 检验的功效：|T| > t_crit，T ~ 非中心 t(n − p, β_j / SE_j)"""
+    F = model_matrix(design, compile_terms(TERMS, PREDICTORS))
+    df_resid = F.shape[0] - F.shape[1]
+    se = np.sqrt(RESIDUAL_VAR * np.diag(np.linalg.inv(F.T @ F)))
+    t_crit = stats.t.ppf(1 - alpha / 2, df_resid)
+    delta = COEF / se
+    return stats.nct.sf(t_crit, df_resid, delta) + stats.nct.cdf(-t_crit, df_resid, delta), se
+
+
+def test_power_without_group_variance_matches_ols():
+    design = _design()
+    table = simulate_power(design, TERMS, PREDICTORS, x_mean=[0.0, 0.0], x_scale=[1.0, 1.0], coef=COEF,
+                           group_var=0.0, residual_var=RESIDUAL_VAR, n_sim=20000, random_state=1)
+    power, se = _analytic_power(design, alpha=0.05)
+    # 20000 次模拟的功效标准误 ≤ 0.0036
+    np.testing.assert_allclose(table["Power"], power, atol=0.015)
+    np.testing.assert_allclose(table["Expected_Std_Error"], se, rtol=1e-12)
+    np.testing.assert_allclose(table["Empirical_SD"], se, rtol=0.03)
+    assert table.loc[table["Term"] == "A:B", "Power"].item() == pytest.approx(0.05, abs=0.01)
+
+
+def test_power_is_reproducible_for_a_seed():
+    kwargs = dict(x_mean=[0.0, 0.0], x_scale=[1.0, 1.0], coef=COEF, group_var=0.2, residual_var=RESIDUAL_VAR,
+                  n_sim=500, random_state=3)
+    first = simulate_power(_design(), TERMS, PREDICTORS, **kwargs)
+    second = simulate_power(_design(), TERMS, PREDICTORS, **kwargs)
+    assert first.equals(second)
+
+
+def test_n_sim_is_bounded():
+    kwargs = dict(x_mean=[0.0, 0.0], x_scale=[1.0, 1.0], coef=COEF, group_var=0.0, residual_var=RESIDUAL_VAR)
+    for n_sim in (1, MAX_SIMULATIONS + 1):
+        with pytest.raises(ValueError, match="n_sim must be between"):
+            simulate_power(_design(), TERMS, PREDICTORS, n_sim=n_sim, **kwargs)
@@ -0,0 +1,149 @@
+"""
+doe_results 的核对：ETag 条件请求、Accept-Encoding 协商、压缩表示上的字节范围、
+结果名称越出工作目录时拒绝、缓存清理只删除过期项
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import os
+import gzip
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse
+from fastapi.testclient import TestClient
+
+from doe_results import ResultStore, CACHE_DIR, MIN_COMPRESS_BYTES, etag_matches, negotiate_encoding
+
+TABLE = "".join(f"{i},{i * 0.5:.3f},{60 + i % 7}\n" for i in range(2000)).encode()
+
+
+def _workspace(tmp_path):
+    workspace = tmp_path / "job"
+    (workspace / "doe_results").mkdir(parents=True)
+    (workspace / "design_data.csv").write_bytes(TABLE)
+    (workspace / "doe_results" / "coded_parameters.csv").write_bytes(b"Factor,Estimate\nIntercept,81.2\n")
+    (workspace / "profiles").mkdir()
+    (workspace / "profiles" / "profile.prof").write_bytes(b"x")
+    return str(workspace)
+
+
+def test_etag_matches_if_none_match_forms():
+    etag = '"abc.gzip"'
+    assert etag_matches('"abc.gzip"', etag)
+    assert etag_matches('"zzz", W/"abc.gzip"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abc"', etag)  # 不同编码的表示 ETag 不同
+    assert not etag_matches("", etag)
+    assert not etag_matches(None, etag)
+
+
+def test_negotiate_encoding_uses_q_values_and_server_preference():
+    both = ("zstd", "gzip")
+    assert negotiate_encoding("gzip, zstd", both) == "zstd"
+    assert negotiate_encoding("gzip;q=1.0, zstd;q=0.5", both) == "gzip"
+    assert negotiate_encoding("zstd;q=0, gzip;q=0.1", both) == "gzip"
+    assert negotiate_encoding("*;q=0.2, zstd;q=0", both) == "gzip"
+    assert negotiate_encoding("gzip;q=abc", both) is None
+    assert negotiate_encoding("identity", both) is None
+    assert negotiate_encoding("", both) is None
+    assert negotiate_encoding(None, ("gzip",)) is None
+
+
+def test_representation_etags_and_small_files(tmp_path):
+    store = ResultStore()
+    workspace = _workspace(tmp_path)
+    identity = store.representation(workspace, "design_data.csv")
+    encoded = store.representation(workspace, "design_data.csv", "gzip")
+    digest = identity["etag"].strip('"')
+    assert identity["encoding"] is None and identity["path"].endswith("design_data.csv")
+    assert encoded["etag"] == f'"{digest}.gzip"' and encoded["encoding"] == "gzip"
+    with gzip.open(encoded["path"]) as f:
+        assert f.read() == TABLE
+    # 同一内容只压缩一次
+    mtime = os.stat(encoded["path"]).st_mtime_ns
+    assert store.representation(workspace, "design_data.csv", "gzip")["path"] == encoded["path"]
+    assert os.stat(encoded["path"]).st_mtime_ns == mtime
+    # 小文件不压缩
+    assert os.path.getsize(os.path.join(workspace, "doe_results", "coded_parameters.csv")) < MIN_COMPRESS_BYTES
+    assert store.representation(workspace, "doe_results/coded_parameters.csv", "gzip")["encoding"] is None
+
+
+def test_range_requests_apply_to_the_encoded_representation(tmp_path):
+    store = ResultStore()
+    workspace = _workspace(tmp_path)
+    app = FastAPI()
+
+    @app.get("/results/{name:path}")
+    def result(name: str, request: Request):
+        representation = store.representation(workspace, name, request.headers.get("accept-encoding", ""))
+        headers = {"ETag": representation["etag"]}
+        if representation["encoding"]:
+            headers["Content-Encoding"] = representation["encoding"]
+        return FileResponse(representation["path"], media_type=representation["media_type"], headers=headers)
+
+    client = TestClient(app)
+    encoded = store.representation(workspace, "design_data.csv", "gzip")
+    with open(encoded["path"], "rb") as f:
+        compressed = f.read()
+    with client.stream("GET", "/results/design_data.csv",
+                       headers={"Accept-Encoding": "gzip", "Range": "bytes=10-99"}) as response:
+        assert response.status_code == 206
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["content-range"] == f"bytes 10-99/{len(compressed)}"
+        # 字节范围是压缩后表示中的范围：按原始字节读取，不解压
+        assert b"".join(response.iter_raw()) == compressed[10:100]
+    # 相同内容重新压缩得到逐字节相同的表示，断点续传的前后两段可以直接拼接
+    os.remove(encoded["path"])
+    assert store.representation(workspace, "design_data.csv", "gzip")["path"] == encoded["path"]
+    with open(encoded["path"], "rb") as f:
+        assert f.read() == compressed
+
+    # If-Range 与当前表示的 ETag 不一致时返回完整表示
+    response = client.get("/results/design_data.csv",
+                          headers={"Accept-Encoding": "identity", "Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200 and response.content == TABLE
+
+
+@pytest.mark.parametrize("name", ["../job/design_data.csv", "doe_results/../../job/design_data.csv",
+                                  "/etc/passwd", ".results/x.gzip", "profiles/profile.prof",
+                                  "doe_results\\..\\..\\secret.csv", "", "missing.csv", "doe_results"])
+def test_resolve_rejects_names_outside_the_results(tmp_path, name):
+    workspace = _workspace(tmp_path)
+    (tmp_path / "secret.csv").write_text("secret")
+    with pytest.raises(KeyError):
+        ResultStore().resolve(workspace, name)
+
+
+def test_resolve_rejects_symlinks_leaving_the_workspace(tmp_path):
+    workspace = _workspace(tmp_path)
+    (tmp_path / "secret.csv").write_text("secret")
+    os.symlink(tmp_path / "secret.csv", os.path.join(workspace, "link.csv"))
+    with pytest.raises(KeyError):
+        ResultStore().resolve(workspace, "link.csv")
+    assert ResultStore().resolve(workspace, "doe_results/coded_parameters.csv").endswith("coded_parameters.csv")
+
+
+def test_prune_keeps_current_entries_and_drops_stale_ones(tmp_path):
+    store = ResultStore()
+    workspace = _workspace(tmp_path)
+    cache = os.path.join(workspace, CACHE_DIR)
+    old_encoded = store.representation(workspace, "design_data.csv", "gzip")["path"]
+    old_bundle = store.bundle(workspace)["path"]
+
+    # 结果更新：design_data 内容变化，旧的压缩项与旧打包不再对应任何当前文件
+    with open(os.path.join(workspace, "design_data.csv"), "ab") as f:
+        f.write(b"2000,1000.000,60\n")
+    in_flight = os.path.join(cache, "deadbeef.gzip.tmp-1234abcd")
+    open(in_flight, "wb").close()
+    new_encoded = store.representation(workspace, "design_data.csv", "gzip")["path"]
+    new_bundle = store.bundle(workspace)["path"]
+
+    assert not os.path.exists(old_encoded) and not os.path.exists(old_bundle)
+    assert os.path.exists(new_encoded) and os.path.exists(new_bundle)
+    assert os.path.exists(in_flight)  # 写入中的临时文件保留
+    assert store.prune(workspace) == 0
+    assert sorted(os.listdir(cache)) == sorted(map(os.path.basename, (new_encoded, new_bundle, in_flight)))
+    # 结果列表不包含缓存与剖析目录
+    assert [f["name"] for f in store.list_files(workspace)] == ["design_data.csv", "doe_results/coded_parameters.csv"]
@@ -0,0 +1,68 @@
+"""
+doe_sensitivity 的核对：可加响应面的 Sobol 指数有闭式解（一阶 = 总指数，二阶为 0），
+以及含交互项时解析解与 Saltelli 抽样估计一致
+
+Author: Zhang Lei
+Created: August 2025
+"""
+
+import numpy as np
+import pytest
+
+from doe_registry import CompiledModel
+from doe_sensitivity import sobol_indices, MAX_SAMPLES
+
+PREDICTORS = ["A", "B", "C"]
+
+
+def _model(terms, coef):
+    spec = {
+        "predictors": PREDICTORS,
+        "terms": terms,
+        "x_mean": [0.0, 0.0, 0.0],
+        "x_scale": [1.0, 1.0, 1.0],
+        "factor_ranges": {p: (-1.0, 1.0) for p in PREDICTORS},
+        "responses": {"y": {"coef": list(coef)}},
+    }
+    return CompiledModel("test", 1, spec)
+
+
+def test_additive_linear_function_uniform():
+    # f = 1 + 2A + B（C 无效应）：V_i = a_i²/3，S = (4/5, 1/5, 0)
+    model = _model(["Intercept", "A", "B", "C"], [1.0, 2.0, 1.0, 0.0])
+    result = sobol_indices(model)
+    indices = result["indices"]
+    np.testing.assert_allclose(indices["First_Order"], [0.8, 0.2, 0.0], atol=1e-12)
+    np.testing.assert_allclose(indices["Total"], indices["First_Order"], atol=1e-12)
+    np.testing.assert_allclose(result["interactions"]["Second_Order"], 0.0, atol=1e-12)
+    assert result["variance"]["y"] == pytest.approx(5.0 / 3.0)
+
+
+def test_additive_quadratic_function_normal():
+    # f = A + B²，u ~ N(0, 1)、w = 1/3：V_A = w²，V_B = 2w⁴
+    model = _model(["Intercept", "A", "I(B ** 2)"], [0.0, 1.0, 1.0])
+    indices = sobol_indices(model, distribution="normal")["indices"].set_index("Factor")
+    w = 1.0 / 3.0
+    V_A, V_B = w ** 2, 2 * w ** 4
+    assert indices.loc["A", "First_Order"] == pytest.approx(V_A / (V_A + V_B))
+    assert indices.loc["B", "First_Order"] == pytest.approx(V_B / (V_A + V_B))
+    np.testing.assert_allclose(indices["Total"], indices["First_Order"], atol=1e-12)
+
+
+@pytest.mark.parametrize("distribution", ["uniform", "normal"])
+def test_saltelli_matches_analytic_with_interactions(distribution):
+    model = _model(["Intercept", "A", "B", "C", "A:B", "I(C ** 2)", "A:C"], [0.5, 1.0, -0.8, 0.3, 0.9, 0.6, -0.4])
+    indices = sobol_indices(model, distribution=distribution, method="both", n_samples=2 ** 14, seed=0)["indices"]
+    np.testing.assert_allclose(indices["First_Order_Saltelli"], indices["First_Order"], atol=0.02)
+    np.testing.assert_allclose(indices["Total_Saltelli"], indices["Total"], atol=0.02)
+    assert (indices["Total"] >= indices["First_Order"] - 1e-12).all()
+
+
+def test_unsupported_options_raise():
+    model = _model(["Intercept", "A"], [0.0, 1.0])
+    with pytest.raises(ValueError, match="Unsupported method"):
+        sobol_indices(model, method="fast")
+    with pytest.raises(ValueError, match="Unsupported distribution"):
+        sobol_indices(model, distribution="beta")
+    with pytest.raises(ValueError, match="n_samples must be between"):
+        sobol_indices(model, method="saltelli", n_samples=MAX_SAMPLES + 1)